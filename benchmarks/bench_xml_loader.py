@@ -0,0 +1,98 @@
+"""Times TypeLibraryXMLLoader.parse on a nodeset file, by default the standard Opc.Ua.NodeSet2.xml.
+
+    python benchmarks/bench_xml_loader.py [--repeat N] [--revision REV] [--baseline REV] [nodeset.xml]
+
+--revision times the ua_nemo sources of a git revision instead of the working tree, in a separate process. With
+--baseline, the benchmark also runs on a second revision and both results are printed. The iterparse rewrite of the
+parse loop is compared with the loop before it by --revision 48480e7 --baseline 48480e7~1.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+from pathlib import Path
+
+import ua_nemo
+from ua_nemo.xml_loader import UA_NODESET, TypeLibraryXMLLoader
+
+from timing import measure
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def bench_parse(xml_path:Path, repeat:int = 5) -> dict:
+    """Parses a nodeset file repeat times, without the typelibrary cache
+
+    Returns:
+        dict: See timing.measure, with the file and the ua_nemo package that was timed
+    """
+    def parse() -> int:
+        loader = TypeLibraryXMLLoader(use_cache=False)
+        return len(loader.parse(xml_path, check_required_models=False).nodes_by_id)
+
+    result = measure(parse, repeat, "nodes")
+    result["file"] = str(xml_path)
+    result["package"] = str(Path(ua_nemo.__file__).parent)
+    return result
+
+
+def bench_revision(revision:str, xml_path:Path, repeat:int = 5) -> dict:
+    """Runs bench_parse on the ua_nemo sources of a git revision
+
+    Args:
+        revision (str): Git revision, e.g. a commit hash
+        xml_path (Path): Nodeset file
+        repeat (int, optional): Number of runs. Defaults to 5.
+
+    Returns:
+        dict: See bench_parse
+    """
+    archive = subprocess.run(["git", "archive", revision, "src"], cwd=REPO_ROOT, check=True, capture_output=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with tarfile.open(fileobj=io.BytesIO(archive.stdout)) as tar:
+            tar.extractall(tmp_dir)
+        src_path = Path(tmp_dir) / "src"
+        # Sources on PYTHONPATH are found before the installed package
+        env = dict(os.environ, PYTHONPATH=str(src_path))
+        child = subprocess.run([sys.executable, __file__, "--json", "--repeat", str(repeat), str(xml_path)],
+                               env=env, check=True, capture_output=True, text=True)
+        result = json.loads(child.stdout)
+        if not Path(result["package"]).is_relative_to(src_path):
+            raise RuntimeError(f"Timed {result['package']} instead of the sources of {revision}")
+    result["revision"] = revision
+    return result
+
+
+def _summary(result:dict) -> str:
+    return (f"{result['count']} nodes, best {result['best_s'] * 1000:.1f} ms, mean {result['mean_s'] * 1000:.1f} ms, "
+            f"{result['rate_per_s']:.0f} nodes/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("xml_path", nargs="?", type=Path, default=UA_NODESET / "Opc.Ua.NodeSet2.xml")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--revision", help="Git revision to time instead of the working tree")
+    parser.add_argument("--baseline", help="Git revision to compare with")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    xml_path = args.xml_path.resolve()
+    if args.revision:
+        result = bench_revision(args.revision, xml_path, args.repeat)
+    else:
+        result = bench_parse(xml_path, args.repeat)
+    if args.json:
+        print(json.dumps(result))
+    elif args.baseline:
+        baseline = bench_revision(args.baseline, xml_path, args.repeat)
+        print(f"{result['file']}")
+        print(f"  {args.baseline}: {_summary(baseline)}")
+        print(f"  {args.revision or 'working tree'}: {_summary(result)}")
+        print(f"  {baseline['best_s'] / result['best_s']:.2f}x")
+    else:
+        print(f"{result['file']}: {_summary(result)}")
@@ -0,0 +1,258 @@
+"""Runs the benchmark suite and writes the results as JSON, optionally comparing them with an earlier run.
+
+    python benchmarks/run_benchmarks.py [--output results.json] [--compare baseline.json] [--sizes 10000 ...]
+
+Scenarios: typelibrary loading (UA nodeset and the ISA95 test library), instantiation at each of --sizes, NodeId and
+browse name lookups, hierarchy walks and xml export. Every scenario is timed --repeat times and reports the best and
+mean wall time, and the rate of the best run in its unit (nodes, instances, lookups).
+"""
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.node_model import Namespace, NamespaceContext, NodeId
+from ua_nemo.xml_builder import dump_model_to_xml_streaming
+from ua_nemo.xml_loader import UA_NODESET, TypeLibraryXMLLoader
+
+from timing import measure
+
+RESULTS_FORMAT = "ua-nemo-benchmarks"
+RESULTS_VERSION = 1
+
+UA_NODESET_FILE = UA_NODESET / "Opc.Ua.NodeSet2.xml"
+ISA95_NODESET_FILE = Path(__file__).resolve().parent.parent / "tests" / "files" / "test-typelibs" / "Opc.ISA95.NodeSet2.xml"
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# Type instantiated by the instantiation, lookup, walk and export scenarios, a variable with two property children
+INSTANCE_TYPE = "TwoStateDiscreteType"
+LOOKUPS = 100_000
+
+
+def _load_engine() -> ModelBuilderEngine:
+    engine = ModelBuilderEngine(NamespaceContext())
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.load_typelibraries()
+    return engine
+
+
+def _build_model(engine:ModelBuilderEngine, size:int) -> Namespace:
+    """Creates size instances of INSTANCE_TYPE below the Objects folder of a new model"""
+    model = engine.create_model(f"http://www.UaNemoBenchmark.com/Instances{size}/")
+    instantiator = engine.get_type_instantiator("UA", model)
+    for idx in range(size):
+        node = instantiator.create_instance(INSTANCE_TYPE, f"ns=1;s=Var{idx}", f"Var{idx}")
+        node.add_reference("Organizes", "i=85", is_forward=False)
+    return model
+
+
+def bench_load(repeat:int) -> dict:
+    results = {}
+
+    def load_ua() -> int:
+        loader = TypeLibraryXMLLoader(use_cache=False, namespace_context=NamespaceContext())
+        _, models = loader.load(UA_NODESET_FILE)
+        return len(models["UA"].nodes_by_id)
+    results["load.ua_nodeset"] = measure(load_ua, repeat, "nodes")
+
+    state = {}
+    def load_ua_untimed():
+        state["loader"] = TypeLibraryXMLLoader(use_cache=False, namespace_context=NamespaceContext())
+        with contextlib.redirect_stdout(io.StringIO()):
+            state["loader"].load(UA_NODESET_FILE)
+
+    def load_isa95() -> int:
+        _, models = state["loader"].load(ISA95_NODESET_FILE)
+        return sum(len(model.nodes_by_id) for model in models.values())
+    results["load.isa95"] = measure(load_isa95, repeat, "nodes", setup=load_ua_untimed)
+    return results
+
+
+def bench_instantiate(engine:ModelBuilderEngine, sizes:list[int], repeat:int) -> dict:
+    results = {}
+    for size in sizes:
+        state = {}
+        def new_model():
+            # Forks keep the models of earlier runs out of the engine context
+            state["engine"] = engine.fork()
+        results[f"instantiate.{size}"] = measure(
+            lambda: (_build_model(state["engine"], size), size)[1], repeat, "instances", setup=new_model)
+    return results
+
+
+def bench_lookup(engine:ModelBuilderEngine, model:Namespace, repeat:int) -> dict:
+    rng = random.Random(0)
+    keys = list(model.nodes_by_id)
+    picked = [rng.choice(keys) for _ in range(LOOKUPS)]
+    nodeid_strings = [model.nodes_by_id[key].node_id.to_string() for key in picked]
+    nodeids = [NodeId.from_string(text) for text in nodeid_strings]
+    ua_model = engine.get_typelibrary("UA")
+    browse_names = [node.browse_name for node in ua_model.nodes_by_id.values()]
+    picked_names = [rng.choice(browse_names) for _ in range(LOOKUPS)]
+    # Full paths from the Objects folder to instance roots and their children
+    paths = []
+    names = []
+    for depth, node in model.iter_subtree("i=85", order="dfs"):
+        del names[depth:]
+        names.append(node.browse_name)
+        if depth > 0 and node.namespace is model:
+            paths.append(("/".join(names), node))
+    picked_paths = [rng.choice(paths) for _ in range(LOOKUPS)]
+    for path, node in paths:
+        if model.resolve_browse_path(path) is not node:
+            raise RuntimeError(f"Browse path {path} does not resolve to {node.node_id.to_string()}")
+    paths = [path for path, _ in picked_paths]
+
+    def by_nodeid() -> int:
+        find = model.find_by_nodeid
+        for nid in nodeids:
+            find(nid)
+        return len(nodeids)
+
+    def by_nodeid_string() -> int:
+        find = model.find_by_nodeid
+        for text in nodeid_strings:
+            find(text)
+        return len(nodeid_strings)
+
+    def by_browse_name() -> int:
+        find = ua_model.find_by_browse_name
+        for name in picked_names:
+            find(name)
+        return len(picked_names)
+
+    def by_browse_path() -> int:
+        resolve = model.resolve_browse_path
+        for path in paths:
+            resolve(path)
+        return len(paths)
+
+    return {
+        "lookup.find_by_nodeid": measure(by_nodeid, repeat, "lookups"),
+        "lookup.find_by_nodeid_string": measure(by_nodeid_string, repeat, "lookups"),
+        "lookup.find_by_browse_name": measure(by_browse_name, repeat, "lookups"),
+        "lookup.resolve_browse_path": measure(by_browse_path, repeat, "lookups"),
+    }
+
+
+def bench_walk(model:Namespace, repeat:int) -> dict:
+    def walk() -> int:
+        return sum(1 for _ in model.walk())
+
+    def subtree() -> int:
+        return sum(1 for _ in model.iter_subtree("i=85"))
+
+    def drop_index():
+        # Rebuilt by the next walk
+        model._children = None
+        model._parents = None
+
+    return {
+        "walk.model": measure(walk, repeat, "nodes"),
+        "walk.objects_subtree": measure(subtree, repeat, "nodes"),
+        "walk.model_cold_index": measure(walk, repeat, "nodes", setup=drop_index),
+    }
+
+
+def bench_export(model:Namespace, repeat:int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = Path(tmp_dir) / "export.xml"
+
+        def export() -> int:
+            dump_model_to_xml_streaming(model, output, indent="  ")
+            return len(model.nodes_by_id)
+        result = measure(export, repeat, "nodes")
+        result["bytes"] = output.stat().st_size
+        result["mb_per_s"] = result["bytes"] / result["best_s"] / 1e6
+    return {"export.xml_streaming": result}
+
+
+def run_suite(sizes:list[int], repeat:int, scenarios:set[str]) -> dict:
+    """Runs the selected scenarios
+
+    Returns:
+        dict: Results document, see RESULTS_FORMAT
+    """
+    results = {}
+    if "load" in scenarios:
+        results.update(bench_load(repeat))
+    engine = _load_engine()
+    if "instantiate" in scenarios:
+        results.update(bench_instantiate(engine, sizes, repeat))
+    if scenarios & {"lookup", "walk", "export"}:
+        # Lookups, walks and the export run on a model of the smallest size
+        model = _build_model(engine.fork(), min(sizes))
+        if "lookup" in scenarios:
+            results.update(bench_lookup(engine, model, repeat))
+        if "walk" in scenarios:
+            results.update(bench_walk(model, repeat))
+        if "export" in scenarios:
+            results.update(bench_export(model, repeat))
+    return {
+        "format": RESULTS_FORMAT,
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "sizes": sizes,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current:dict, baseline:dict, threshold:float) -> list[str]:
+    """Compares the best times of the scenarios both runs have
+
+    Args:
+        current (dict): Results document of this run
+        baseline (dict): Results document of an earlier run
+        threshold (float): Relative slowdown above which a scenario counts as a regression, e.g. 0.1 for 10%
+
+    Returns:
+        list[str]: Names of the regressed scenarios
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            print(f"{name:36} {result['best_s'] * 1000:10.1f} ms   (new)")
+            continue
+        change = result["best_s"] / base["best_s"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:36} {result['best_s'] * 1000:10.1f} ms   {change:+7.1%}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="Results JSON of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative slowdown that counts as a regression when comparing, default 0.1")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="Numbers of instances for the instantiation scenarios")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scenarios", nargs="+", default=["load", "instantiate", "lookup", "walk", "export"],
+                        choices=["load", "instantiate", "lookup", "walk", "export"])
+    args = parser.parse_args()
+
+    document = run_suite(args.sizes, args.repeat, set(args.scenarios))
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2))
+
+    if args.compare:
+        regressions = compare(document, json.loads(args.compare.read_text()), args.threshold)
+        if regressions:
+            sys.exit(1)
+    else:
+        for name, result in document["results"].items():
+            print(f"{name:36} {result['best_s'] * 1000:10.1f} ms   {result['rate_per_s']:14,.0f} {result['unit']}/s")
@@ -0,0 +1,38 @@
+"""Timing helper shared by the benchmark scripts. It does not import ua_nemo, so the scripts can time the sources of
+other revisions with it, see bench_xml_loader.py --baseline.
+"""
+import contextlib
+import io
+import time
+from typing import Callable
+
+
+def measure(run:Callable[[], int], repeat:int, unit:str, setup:Callable[[], None] = None) -> dict:
+    """Times run repeat times, calling setup untimed before each run
+
+    Args:
+        run (Callable[[], int]): Scenario, returns the number of units it processed
+        repeat (int): Number of runs
+        unit (str): What run counts, e.g. "nodes"
+        setup (Callable[[], None], optional): Prepares a run. Defaults to None.
+
+    Returns:
+        dict: Best and mean wall time in seconds, the count of the last run and the rate of the best run
+    """
+    timings = []
+    count = 0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            count = run()
+            timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {
+        "unit": unit,
+        "count": count,
+        "best_s": best,
+        "mean_s": sum(timings) / len(timings),
+        "rate_per_s": count / best if best > 0 else None,
+    }
@@ -1,31 +1,96 @@
+from collections import OrderedDict
 from pathlib import Path
 
-from .node_model import NodeId, Namespace
-from .type_instantiator import TypeInstantiator
+from .node_model import Node, NodeId, Namespace, NamespaceContext
+from .type_instantiator import TemplateCache, TypeInstantiator
 from .xml_loader import TypeLibraryXMLLoader
 
+# Number of (typelibrary, target model) instantiators an engine keeps, the least recently used is dropped first
+INSTANTIATOR_CACHE_SIZE = 32
+
+# Columns of the objects.csv format, in the order instantiate_many expects them
+OBJECT_COLUMNS = ("type_namespace", "nodetype", "nodeid", "browsename")
+
+def _is_missing(value) -> bool:
+    # None, NaN in a pandas column, or an empty cell of a csv read as strings
+    return value is None or value != value or value == ""
+
 
 class ModelBuilderEngine:
     
     typelibraries : dict[str, Namespace]
-    __type_instantiators : dict
+    namespace_context : NamespaceContext
+    # (typelibrary name, id of target model) -> instantiator, in least recently used order
+    __type_instantiators : OrderedDict[tuple[str, int], TypeInstantiator]
+    # Typelibrary name -> compiled templates, shared by the instantiators of all target models and by forks
+    __template_caches : dict[str, TemplateCache]
     
-    def __init__(self):
+    def __init__(self, namespace_context : NamespaceContext = None):
+        """
+        Args:
+            namespace_context (NamespaceContext, optional): Context the typelibraries are loaded into and models are
+                created in. Defaults to a new context owned by this engine, create models with create_model to
+                register them in it. Models of other contexts are rejected by the methods taking a target model.
+                Pass Namespace.get_default_namespace_context() to build models created with a plain Namespace().
+        """
         self.typelibraries = {}
-        self.__type_instantiators = {}
+        self.__type_instantiators = OrderedDict()
+        self.__template_caches = {}
+        if namespace_context is None:
+            namespace_context = NamespaceContext()
+        self.namespace_context = namespace_context
+
+    def fork(self) -> "ModelBuilderEngine":
+        """Returns an engine for an independent build over the typelibraries of this engine. The typelibraries are
+        shared read-only, models created by the fork are only registered in its own context, a snapshot of the
+        context of this engine. Forks can build on separate threads at the same time.
+
+        Returns:
+            ModelBuilderEngine: Engine with the typelibraries of this engine
+        """
+        for typelib_model in self.typelibraries.values():
+            typelib_model.build_indexes()
+        engine = ModelBuilderEngine(self.namespace_context.snapshot())
+        engine.typelibraries = self.typelibraries
+        engine.__template_caches = self.__template_caches
+        return engine
+
+    def create_model(self, uri : str, compact_references : bool = False) -> Namespace:
+        """Creates a model in the context of this engine, with the aliases of the UA typelibrary if it is loaded
+
+        Args:
+            uri (str): Namespace uri of the model
+            compact_references (bool, optional): See Namespace. Defaults to False.
+
+        Returns:
+            Namespace: The model, registered in the context of this engine
+        """
+        model = Namespace(self.namespace_context, compact_references=compact_references)
+        model.uri = uri
+        if "UA" in self.typelibraries:
+            self.set_aliases(model)
+        return model
 
     def load_typelibraries(
             self, 
             dir_path:Path = None, 
-            file_list:list[Path|str] = None) -> None:
+            file_list:list[Path|str] = None,
+            use_cache:bool = None,
+            lazy:bool = False) -> None:
         """Loads typelibraries from either a directory path or a list of files.
         If neither are provider will just load the standard opcua nodeset.
 
         Args:
             dir_path (Path, optional): Path to directory containing typelibrary files. Defaults to None.
             file_list (list[Path | str], optional): List of files to load. Defaults to None.
+            use_cache (bool, optional): Reuse parsed typelibraries from the on-disk cache. Defaults to None, see
+                TypeLibraryXMLLoader.
+            lazy (bool, optional): Parse type nodes on first use instead of up front. Defaults to False.
         """
-        loader = TypeLibraryXMLLoader()
+        loader = TypeLibraryXMLLoader(use_cache=use_cache, lazy=lazy, namespace_context=self.namespace_context)
+        # Templates and instantiators refer to the previous typelibraries
+        self.__type_instantiators = OrderedDict()
+        self.__template_caches = {}
         if dir_path:
             self.typelibraries = loader.load_from_path(dir_path)
         elif file_list:
@@ -42,32 +107,156 @@ class ModelBuilderEngine:
         return typelib_model
     
     def set_aliases(self, target_model : Namespace):
-        target_model.aliases = self.get_typelibrary("UA").aliases
+        self._check_target_model(target_model)
+        # A copy, aliases added to the target model must not end up in the typelibrary
+        target_model.set_aliases(dict(self.get_typelibrary("UA").aliases))
         
+    def _check_target_model(self, target_model : Namespace):
+        """Raises if a model is not in the context of this engine. NodeIds of the typelibraries are remapped through
+        the namespace array of the target model, which only has the typelibrary uris if it shares their context."""
+        if target_model.namespace_context is not self.namespace_context:
+            raise ValueError(
+                f"Model {target_model.uri} is not in the namespace context of this engine. Create it with "
+                f"engine.create_model(uri) or Namespace(engine.namespace_context).")
+
     def get_ref_from_browsename(self, row : tuple, target_model: Namespace) -> NodeId:
-        typelib_model = self.get_typelibrary(row.type_namespace)
+        return self.resolve_reference_type(row.type_namespace, row.reference_type, target_model)
+
+    def resolve_reference_type(self, typelib_name : str, reference_type : str, target_model : Namespace) -> NodeId:
+        """Resolves a reference type given by browse name, alias or NodeId in a typelibrary
 
-        #TODO This is not clean. Needs fixing.
-        try:
-            ref_nodeid = typelib_model.find_by_browse_name(row.reference_type)[0].node_id
-        except:
+        Args:
+            typelib_name (str): Name of the typelibrary that defines the reference type
+            reference_type (str): Browse name, alias or NodeId of the reference type
+            target_model (Namespace): Model the reference will be added to
+
+        Returns:
+            NodeId: NodeId of the reference type, remapped to the namespace array of the target model
+        """
+        self._check_target_model(target_model)
+        typelib_model = self.get_typelibrary(typelib_name)
+        ref_nodes = typelib_model.find_by_browse_name(reference_type)
+        if ref_nodes:
+            ref_nodeid = ref_nodes[0].node_id
+        else:
             #* Check if this is an alias
-            ref_nodeid = typelib_model.resolve(row.reference_type)
-        remapped_nodeid = target_model.namespace_context.remap_nodeid(ref_nodeid, typelib_model, target_model)
-        return remapped_nodeid
+            ref_nodeid = typelib_model.resolve(reference_type)
+        return target_model.namespace_context.remap_nodeid(ref_nodeid, typelib_model, target_model)
+
+    def resolve_browse_name(self, typelib_name : str, browse_name : str, target_model : Namespace) -> NodeId:
+        """Resolves a node of a typelibrary by browse name
+
+        Args:
+            typelib_name (str): Name of the typelibrary
+            browse_name (str): Browse name of the node
+            target_model (Namespace): Model the NodeId will be used in
+
+        Returns:
+            NodeId: NodeId of the node, remapped to the namespace array of the target model
+        """
+        self._check_target_model(target_model)
+        typelib_model = self.get_typelibrary(typelib_name)
+        nodes = typelib_model.find_by_browse_name(browse_name)
+        if not nodes:
+            raise ValueError(f"Could not find {browse_name} in typelibrary {typelib_name}.")
+        return target_model.namespace_context.remap_nodeid(nodes[0].node_id, typelib_model, target_model)
     
     def get_type_instantiator(self, typelib_name : str, target_model : Namespace) -> TypeInstantiator:
-        if self.__type_instantiators.get(typelib_name) is not None:
-            return self.__type_instantiators[typelib_name]
-        typelib_model = self.get_typelibrary(typelib_name)
-        instantiator = TypeInstantiator(typelib_model, target_model)
-        self.__type_instantiators[typelib_name] = instantiator
+        """Returns the instantiator of the types of a typelibrary in a target model. Instantiators are cached per
+        (typelibrary, target model), up to INSTANTIATOR_CACHE_SIZE of them, and share the compiled templates of the
+        typelibrary.
+
+        Args:
+            typelib_name (str): Name of the typelibrary
+            target_model (Namespace): Model to create the instances in
+
+        Returns:
+            TypeInstantiator: The instantiator
+        """
+        self._check_target_model(target_model)
+        instantiators = self.__type_instantiators
+        key = (typelib_name, id(target_model))
+        instantiator = instantiators.get(key)
+        # The id of a model that was garbage collected may be reused by a new one
+        if instantiator is not None and instantiator.target_model is target_model:
+            instantiators.move_to_end(key)
+            return instantiator
+
+        templates = self.__template_caches.get(typelib_name)
+        if templates is None:
+            templates = self.__template_caches.setdefault(
+                typelib_name, TemplateCache(self.get_typelibrary(typelib_name)))
+        instantiator = TypeInstantiator(templates.typelib_model, target_model, templates)
+        instantiators[key] = instantiator
+        instantiators.move_to_end(key)
+        if len(instantiators) > INSTANTIATOR_CACHE_SIZE:
+            instantiators.popitem(last=False)
         return instantiator
     
-    def instantiate_node(self, typelib_name : str, target_model : Namespace, typename: str, node_id: str, browse_name: str, **kwargs) -> str:
+    def release_model(self, target_model : Namespace):
+        """Drops the instantiators of a finished target model and unregisters it from the context of this engine, so
+        processes that build many models one after another do not keep them alive
+
+        Args:
+            target_model (Namespace): Model that is done being built
+        """
+        instantiators = self.__type_instantiators
+        for key in [key for key, instantiator in instantiators.items() if instantiator.target_model is target_model]:
+            del instantiators[key]
+        self.namespace_context.unregister_model(target_model)
+
+    def instantiate_node(self, typelib_name : str, target_model : Namespace, typename: str, node_id: str, browse_name: str, **kwargs) -> Node:
         instantiator = self.get_type_instantiator(typelib_name, target_model)
-        instantiator.instantiate(typename, node_id, browse_name, **kwargs)
-        return target_model.find_by_nodeid(node_id)
+        return instantiator.create_instance(
+            typename, node_id, browse_name, kwargs.get("include_optional", False), kwargs.get("rest"))
+
+    def instantiate_many(self, target_model : Namespace, rows, include_optional : bool = False) -> list[Node]:
+        """Instantiates nodes in bulk. The instantiator and instance template of every (typelibrary, type) are
+        resolved once and reused for all rows of that type.
+
+        Args:
+            target_model (Namespace): Model to create the nodes in
+            rows: Either a DataFrame with the columns of objects.csv (type_namespace, nodetype, nodeid, browsename and
+                optional extra attribute columns, where None, NaN and "" are missing values), or an iterable of (typelib, typename, node_id, browse_name) tuples
+                with an optional fifth dict of extra attributes.
+            include_optional (bool, optional): Include optional children. Defaults to False.
+
+        Returns:
+            list[Node]: The created instance roots, in the order of the rows
+        """
+        templates = {}
+        created = []
+        for typelib_name, typename, node_id, browse_name, rest in self._iter_object_rows(rows):
+            type_key = (typelib_name, typename)
+            resolved = templates.get(type_key)
+            if resolved is None:
+                instantiator = self.get_type_instantiator(typelib_name, target_model)
+                resolved = (instantiator, instantiator.get_template(typename, include_optional))
+                templates[type_key] = resolved
+            instantiator, template = resolved
+            created.append(instantiator.stamp(template, node_id, browse_name, rest))
+        return created
+
+    @staticmethod
+    def _iter_object_rows(rows):
+        if hasattr(rows, "itertuples"):
+            # DataFrame, columns as in objects.csv
+            columns = list(rows.columns)
+            missing = [col for col in OBJECT_COLUMNS if col not in columns]
+            if missing:
+                raise ValueError(f"Objects are missing the column(s) {', '.join(missing)}, "
+                                 f"expected {', '.join(OBJECT_COLUMNS)}.")
+            required = [columns.index(col) for col in OBJECT_COLUMNS]
+            extras = [(idx, col) for idx, col in enumerate(columns) if col not in OBJECT_COLUMNS]
+            for row in rows.itertuples(index=False, name=None):
+                rest = {col: row[idx] for idx, col in extras if not _is_missing(row[idx])}
+                yield (*(row[idx] for idx in required), rest)
+        else:
+            for row in rows:
+                if len(row) == 4:
+                    yield (*row, None)
+                else:
+                    yield row
     
     def get_typelibrary_by_index(self, idx:int) -> Namespace:
         typelib_name = list(self.typelibraries)[idx]
@@ -79,5 +268,5 @@ class ModelBuilderEngine:
         #TODO Refactor, check if still needed
         node_model = self.get_typelibrary_by_index(node_id.ns_index)
         if node_id.ns_index != 0:
-            node_id.ns_index = 1
+            node_id = NodeId(1, node_id.id_type, node_id.id)
         return node_model.find_by_nodeid(node_id)
@@ -0,0 +1,144 @@
+"""Cache of rendered node xml fragments, so exports only have to re-render the nodes that changed.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from .node_model import Namespace, Node
+
+# Bump whenever the rendering of fragments or the layout of the cache file changes
+FRAGMENT_CACHE_VERSION = 1
+
+
+def node_fingerprint(node:Node) -> bytes:
+    """Returns a digest of everything that ends up in the xml fragment of a node
+
+    Args:
+        node (Node): Node to fingerprint
+
+    Returns:
+        bytes: 16 byte digest, stable across processes
+    """
+    content = (
+        node.node_id.to_string(),
+        node.browse_name,
+        node.node_class.value,
+        node.attributes_view,
+        node.subnodes_view,
+        [(ref.reference_type, ref.target_nodeid.to_string(), ref.is_forward) for ref in node.references],
+    )
+    return hashlib.blake2b(repr(content).encode("utf-8"), digest_size=16).digest()
+
+
+class NodeFragmentCache:
+    """Rendered xml fragments of the nodes of a model, keyed on NodeId.key together with the fingerprint of the node
+    they were rendered from.
+
+    A cache that was last refreshed against a model in this process only looks at the nodes the model reports as dirty.
+    A cache loaded from file, or refreshed against another model, fingerprints every node instead and re-renders the ones
+    whose fingerprint changed.
+    """
+
+    path: Path | None
+    # Whitespace the fragments were rendered with, see xml_builder.write_model_xml
+    newlines: tuple[str, ...] | None
+    # Model the fragments were last refreshed against in this process, not stored
+    synced_with: Namespace | None
+    # NodeId.key -> (fingerprint, fragment)
+    entries: dict[tuple, tuple[bytes, bytes]]
+
+    def __init__(self, path:Path|str = None):
+        self.path = Path(path) if path is not None else None
+        self.newlines = None
+        self.synced_with = None
+        self.entries = {}
+        if self.path is not None and self.path.is_file():
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set_format(self, newlines:tuple[str, ...]):
+        """Sets the whitespace of the fragments, dropping all fragments if it differs from what they were rendered with"""
+        if newlines != self.newlines:
+            self.newlines = newlines
+            self.clear()
+
+    def clear(self):
+        self.entries = {}
+        self.synced_with = None
+
+    def load(self):
+        """Loads the cache file, starting empty if it is missing, unreadable or of another version"""
+        self.clear()
+        try:
+            with open(self.path, "rb") as f:
+                header = pickle.load(f)
+                if header.get("version") != FRAGMENT_CACHE_VERSION:
+                    return
+                self.newlines = header["newlines"]
+                self.entries = pickle.load(f)
+        except Exception as e:
+            #TODO Make a proper warning
+            print(f"Discarding unreadable fragment cache {self.path}: {e}")
+            self.clear()
+
+    def save(self):
+        """Writes the cache file. Failing to write the cache never fails the export."""
+        if self.path is None:
+            raise ValueError("Fragment cache has no path to save to")
+        tmp_path = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so a crash never leaves a partially written cache
+            with tempfile.NamedTemporaryFile(dir=self.path.parent, suffix=".tmp", delete=False) as f:
+                tmp_path = Path(f.name)
+                pickle.dump({"version": FRAGMENT_CACHE_VERSION, "newlines": self.newlines}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+            #TODO Make a proper warning
+            print(f"Could not write fragment cache {self.path}: {e}")
+
+    def refresh(self, model:Namespace, render) -> list[tuple]:
+        """Re-renders the fragments of the nodes that changed since the last refresh
+
+        Args:
+            model (Namespace): Model to refresh against. Its change tracking is turned on and reset, so later
+                refreshes only re-render the nodes changed from here on.
+            render: Callable rendering a Node to its fragment bytes
+
+        Returns:
+            list[tuple]: NodeId.key of the nodes that were added or whose fragment changed, in model order when all
+                nodes were checked
+        """
+        model.track_changes()
+        dirty = model.pop_dirty_nodes()
+        nodes_by_id = model.nodes_by_id
+        if self.synced_with is model:
+            candidates = [nodes_by_id[key] for key in dirty if key in nodes_by_id]
+        else:
+            candidates = nodes_by_id.values()
+            # Nodes that are no longer in the model
+            for key in [key for key in self.entries if key not in nodes_by_id]:
+                del self.entries[key]
+
+        entries = self.entries
+        changed = []
+        for node in candidates:
+            key = node.node_id.key
+            fingerprint = node_fingerprint(node)
+            entry = entries.get(key)
+            if entry is None or entry[0] != fingerprint:
+                entries[key] = (fingerprint, render(node))
+                changed.append(key)
+        self.synced_with = model
+        return changed
+
+    def fragment(self, key:tuple) -> bytes:
+        return self.entries[key][1]
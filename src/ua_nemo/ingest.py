@@ -0,0 +1,250 @@
+"""Builds a model from objects.csv and references.csv files.
+
+objects.csv has the columns nodeid, nodetype, browsename and type_namespace, any other column is set as attribute on the
+instance. references.csv has the columns source_node, target_node, reference_type, type_namespace and IsForward, where
+target_node is either a NodeId or Typelib.BrowseName of a node in a typelibrary.
+"""
+from itertools import zip_longest
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from .engine import ModelBuilderEngine
+from .node_model import Namespace, Node, NodeId
+from .utils import normalize_bool
+
+RELATION_COLUMNS = ("source_node", "target_node", "reference_type", "type_namespace", "IsForward")
+
+# Csv files are read as strings so pandas does not infer types, e.g. an AccessLevel column with an empty cell would
+# become float and be exported as "3.0". Missing values are read as "".
+CSV_READ_KWARGS = {"dtype": str, "keep_default_na": False}
+
+DEFAULT_CHUNKSIZE = 10_000
+
+
+def load_objects(obj_path:Path = None) -> pd.DataFrame:
+    """Loads all object csv files in a directory. All columns are read as strings, missing values as "".
+
+    Args:
+        obj_path (Path, optional): Directory with object csv files. Defaults to ./objects.
+
+    Returns:
+        pd.DataFrame: Objects of all files
+    """
+    if obj_path is None:
+        obj_path = Path.cwd() / "objects"
+    df_list = [pd.read_csv(file, **CSV_READ_KWARGS) for file in sorted(Path(obj_path).glob("*.csv"))]
+    return pd.concat(df_list, ignore_index=True)
+
+
+def load_relations(ref_path:Path = None) -> pd.DataFrame:
+    """Loads all reference csv files in a directory. All columns are read as strings, missing values as "".
+
+    Args:
+        ref_path (Path, optional): Directory with reference csv files. Defaults to ./references.
+
+    Returns:
+        pd.DataFrame: References of all files
+    """
+    if ref_path is None:
+        ref_path = Path.cwd() / "references"
+    df_list = [pd.read_csv(file, **CSV_READ_KWARGS) for file in sorted(Path(ref_path).glob("*.csv"))]
+    return pd.concat(df_list, ignore_index=True)
+
+
+def create_nodes(engine:ModelBuilderEngine, model:Namespace, objects:pd.DataFrame, relations:pd.DataFrame) -> list[Node]:
+    """Instantiates the objects in the model and adds the relations between them
+
+    Args:
+        engine (ModelBuilderEngine): Engine with the typelibraries the objects and relations refer to
+        model (Namespace): Model to build
+        objects (pd.DataFrame): Objects, as returned by load_objects
+        relations (pd.DataFrame): Relations, as returned by load_relations
+
+    Returns:
+        list[Node]: The instantiated objects
+    """
+    created = engine.instantiate_many(model, objects)
+    add_relations(engine, model, relations)
+    return created
+
+
+def add_relations(engine:ModelBuilderEngine, model:Namespace, relations:pd.DataFrame, pending:dict = None,
+                  type_cache:dict = None) -> int:
+    """Adds references to existing nodes of the model. Reference types, targets and directions are resolved once per
+    distinct value, and the references of each source node are added in one pass.
+
+    Args:
+        engine (ModelBuilderEngine): Engine with the typelibraries the relations refer to
+        model (Namespace): Model containing the source nodes
+        relations (pd.DataFrame): Relations, as returned by load_relations
+        pending (dict, optional): If given, relations of source nodes that do not exist yet are buffered here as
+            source_node -> [(reference type, target, is_forward)] instead of raising. See apply_pending.
+        type_cache (dict, optional): Resolved reference types to reuse across calls, see resolve_relations
+
+    Raises:
+        ValueError: If a source node does not exist in the model and pending is not given
+
+    Returns:
+        int: Number of relation rows applied
+    """
+    if len(relations) == 0:
+        return 0
+    ref_types, targets, directions = resolve_relations(engine, model, relations, type_cache)
+
+    applied = 0
+    for source, positions in relations.groupby("source_node", sort=False).indices.items():
+        node = model.find_by_nodeid(source)
+        if node is None:
+            if pending is None:
+                raise ValueError(f"Source node {source} of {len(positions)} relation(s) does not exist in the model.")
+            pending.setdefault(source, []).extend((ref_types[pos], targets[pos], directions[pos]) for pos in positions)
+            continue
+        add_reference = node.add_reference
+        for pos in positions:
+            add_reference(ref_types[pos], targets[pos], directions[pos])
+        applied += len(positions)
+    return applied
+
+
+def apply_pending(model:Namespace, pending:dict) -> int:
+    """Adds the buffered relations of source nodes that have been created since they were buffered
+
+    Args:
+        model (Namespace): Model containing the source nodes
+        pending (dict): Buffered relations, as filled by add_relations. Applied entries are removed.
+
+    Returns:
+        int: Number of relations applied
+    """
+    applied = 0
+    for source in list(pending):
+        node = model.find_by_nodeid(source)
+        if node is None:
+            continue
+        for ref_type, target, is_forward in pending.pop(source):
+            node.add_reference(ref_type, target, is_forward)
+            applied += 1
+    return applied
+
+
+def iter_csv_chunks(csv_path:Path, chunksize:int = DEFAULT_CHUNKSIZE, **read_kwargs) -> Iterator[pd.DataFrame]:
+    """Reads all csv files in a directory as chunks of at most chunksize rows
+
+    Args:
+        csv_path (Path): Directory with csv files
+        chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+        **read_kwargs: Passed on to pd.read_csv
+
+    Yields:
+        pd.DataFrame: The next chunk
+    """
+    for file in sorted(Path(csv_path).glob("*.csv")):
+        with pd.read_csv(file, chunksize=chunksize, **read_kwargs) as reader:
+            yield from reader
+
+
+def stream_nodes(engine:ModelBuilderEngine, model:Namespace, obj_path:Path = None, ref_path:Path = None,
+                 chunksize:int = DEFAULT_CHUNKSIZE, include_optional:bool = False) -> tuple[int, int]:
+    """Builds a model from object and reference csv directories without loading them in memory at once.
+
+    Objects and references are read in chunks in lockstep. Each object chunk is instantiated, then the next reference
+    chunk is added. References whose source node has not been created yet are buffered until a later object chunk
+    creates it, so only the chunks in flight and the unresolved references are held in memory.
+
+    Args:
+        engine (ModelBuilderEngine): Engine with the typelibraries the objects and relations refer to
+        model (Namespace): Model to build
+        obj_path (Path, optional): Directory with object csv files. Defaults to ./objects.
+        ref_path (Path, optional): Directory with reference csv files. Defaults to ./references.
+        chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+        include_optional (bool, optional): Include optional children. Defaults to False.
+
+    Raises:
+        ValueError: If source nodes of references are still missing after all objects have been created
+
+    Returns:
+        tuple[int, int]: Number of instantiated objects and number of references added
+    """
+    if obj_path is None:
+        obj_path = Path.cwd() / "objects"
+    if ref_path is None:
+        ref_path = Path.cwd() / "references"
+
+    object_chunks = iter_csv_chunks(obj_path, chunksize, **CSV_READ_KWARGS)
+    relation_chunks = iter_csv_chunks(ref_path, chunksize, **CSV_READ_KWARGS)
+    pending = {}
+    type_cache = {}
+    n_objects = 0
+    n_relations = 0
+    for objects, relations in zip_longest(object_chunks, relation_chunks):
+        if objects is not None:
+            n_objects += len(engine.instantiate_many(model, objects, include_optional))
+            if pending:
+                n_relations += apply_pending(model, pending)
+        if relations is not None:
+            n_relations += add_relations(engine, model, relations, pending, type_cache)
+
+    if pending:
+        missing = list(pending)
+        raise ValueError(f"Source node(s) {', '.join(missing[:10])}{' ...' if len(missing) > 10 else ''} of "
+                         f"{sum(len(refs) for refs in pending.values())} relation(s) do not exist in the model.")
+    return n_objects, n_relations
+
+
+def resolve_relations(engine:ModelBuilderEngine, model:Namespace, relations:pd.DataFrame,
+                      type_cache:dict = None) -> tuple[list, list, list]:
+    """Resolves the reference type, target and direction columns of relations. Every distinct value is resolved once.
+
+    Args:
+        engine (ModelBuilderEngine): Engine with the typelibraries the relations refer to
+        model (Namespace): Model the references will be added to
+        relations (pd.DataFrame): Relations, as returned by load_relations
+        type_cache (dict, optional): (type_namespace, reference_type) -> resolved reference type, filled and reused
+            across calls when resolving chunk by chunk
+
+    Returns:
+        tuple[list, list, list]: Reference type NodeId strings, target NodeIds and IsForward flags, one per row
+    """
+    type_keys = pd.MultiIndex.from_arrays([relations["type_namespace"], relations["reference_type"]])
+    type_codes, unique_types = pd.factorize(type_keys)
+    if type_cache is None:
+        type_cache = {}
+    resolved_types = []
+    for type_key in unique_types:
+        resolved = type_cache.get(type_key)
+        if resolved is None:
+            resolved = engine.resolve_reference_type(*type_key, model).to_string()
+            type_cache[type_key] = resolved
+        resolved_types.append(resolved)
+
+    target_codes, unique_targets = pd.factorize(relations["target_node"])
+    resolved_targets = [resolve_target(engine, model, target) for target in unique_targets]
+
+    direction_codes, unique_directions = pd.factorize(relations["IsForward"].fillna(""))
+    resolved_directions = [normalize_bool(direction) for direction in unique_directions]
+
+    return (
+        [resolved_types[code] for code in type_codes],
+        [resolved_targets[code] for code in target_codes],
+        [resolved_directions[code] for code in direction_codes],
+    )
+
+
+def resolve_target(engine:ModelBuilderEngine, model:Namespace, target:str) -> NodeId:
+    """Resolves a relation target, either a NodeId or Typelib.BrowseName of a node in a typelibrary
+
+    Args:
+        engine (ModelBuilderEngine): Engine with the typelibraries
+        model (Namespace): Model the reference will be added to
+        target (str): Target as written in references.csv
+
+    Returns:
+        NodeId: Target NodeId in the namespace array of the model
+    """
+    try:
+        return NodeId.from_string(target)
+    except ValueError:
+        typelib_name, _, browse_name = target.partition(".")
+        return engine.resolve_browse_name(typelib_name, browse_name, model)
@@ -0,0 +1,314 @@
+"""Namespace that indexes the node elements of a nodeset file and only parses them when they are looked up.
+"""
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Iterator
+from xml.sax.saxutils import unescape
+
+from lxml import etree as ET
+
+from .node_definitions import LOADED_NODE_TAGS, NodeClass, resolve_node_class
+from .node_model import Namespace, NamespaceContext, Node, NodeId
+
+# Same node elements as TypeLibraryXMLLoader.parse loads
+NODE_TAGS = LOADED_NODE_TAGS
+
+# Attributes of a start tag. Quoted values may contain ">", the loop is unrolled so a tag is scanned in linear time.
+_START_TAG_ATTRS = rb"""([^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>"""
+# Start tag of a node element, with an optional namespace prefix
+_NODE_START = re.compile(
+    rb"<((?:[\w.-]+:)?(" + b"|".join(tag.encode() for tag in NODE_TAGS) + rb"))(?=[\s/>])" + _START_TAG_ATTRS)
+_ROOT_START = re.compile(rb"<((?:[\w.-]+:)?UANodeSet)(?=[\s/>])" + _START_TAG_ATTRS)
+_NODE_ID_ATTR = re.compile(rb"""(?<![\w:.-])NodeId\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_BROWSE_NAME_ATTR = re.compile(rb"""(?<![\w:.-])BrowseName\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+# Reference element of a node and its target, the text up to the next tag
+_REFERENCE = re.compile(rb"<(?:[\w.-]+:)?Reference(?=[\s/>])" + _START_TAG_ATTRS + rb"\s*([^<]*?)\s*<")
+_IS_FORWARD_ATTR = re.compile(rb"""(?<![\w:.-])IsForward\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_ENTITIES = {"&quot;": '"', "&apos;": "'"}
+
+
+class NodeElementIndex:
+    """Byte offsets of the node elements of a nodeset file, found in one scan over the raw bytes"""
+    __slots__ = ("xml_path", "root_start", "root_end", "header_end", "spans", "node_classes", "keys_by_browse_name",
+                 "inverse_sources")
+
+    xml_path: Path
+    # <UANodeSet ...> start tag, wraps fragments so they are parsed with the namespace declarations of the file
+    root_start: bytes
+    # </UANodeSet> end tag, with the namespace prefix of the start tag
+    root_end: bytes
+    # Offset of the first node element, everything before it is the header (namespace uris, models, aliases)
+    header_end: int
+    # NodeId.key -> (start, end) of the element
+    spans: dict[tuple, tuple[int, int]]
+    node_classes: dict[tuple, NodeClass]
+    keys_by_browse_name: dict[str, list[tuple]]
+    # Target of an inverse reference, a NodeId or alias as written in the file -> NodeId.key of the nodes declaring
+    # it. Finds the children that only name their parent, see LazyNamespace.get_children.
+    inverse_sources: dict[str, list[tuple]]
+
+    def __init__(self, xml_path:Path):
+        self.xml_path = Path(xml_path)
+        self.spans = {}
+        self.node_classes = {}
+        self.keys_by_browse_name = {}
+        self.inverse_sources = {}
+
+        data = self.xml_path.read_bytes()
+        root_match = _ROOT_START.search(data)
+        if root_match is None:
+            raise ValueError(f"{xml_path} is not a nodeset file, it has no UANodeSet element")
+        self.root_start = root_match.group(0)
+        self.root_end = b"</" + root_match.group(1) + b">"
+        self.header_end = len(data)
+
+        node_classes = {tag.encode(): resolve_node_class(tag) for tag in NODE_TAGS}
+        closing_tags = {}
+        for match in _NODE_START.finditer(data, root_match.end()):
+            qname, tag, attrs = match.group(1), match.group(2), match.group(3)
+            start = match.start()
+            if start < self.header_end:
+                self.header_end = start
+            if attrs.endswith(b"/"):
+                end = match.end()
+            else:
+                closing = closing_tags.get(qname)
+                if closing is None:
+                    closing = closing_tags[qname] = re.compile(rb"</" + re.escape(qname) + rb"\s*>")
+                closing_match = closing.search(data, match.end())
+                if closing_match is None:
+                    raise ValueError(f"Unclosed {qname.decode()} element at byte {start} of {xml_path}")
+                end = closing_match.end()
+
+            node_id = _attribute_value(_NODE_ID_ATTR, attrs)
+            browse_name = _attribute_value(_BROWSE_NAME_ATTR, attrs)
+            if node_id is None or browse_name is None:
+                raise ValueError(f"{qname.decode()} element at byte {start} of {xml_path} has no NodeId or BrowseName")
+            key = NodeId.from_string(node_id).key
+            self.spans[key] = (start, end)
+            self.node_classes[key] = node_classes[tag]
+            self.keys_by_browse_name.setdefault(browse_name, []).append(key)
+            for ref_match in _REFERENCE.finditer(data, match.end(), end):
+                is_forward = _attribute_value(_IS_FORWARD_ATTR, ref_match.group(1))
+                if is_forward is not None and is_forward.strip().lower() == "false":
+                    self.inverse_sources.setdefault(_unescape(ref_match.group(2)), []).append(key)
+
+    def read_header(self) -> ET._Element:
+        """Parses everything before the first node element
+
+        Returns:
+            ET._Element: UANodeSet element with the NamespaceUris, Models and Aliases children
+        """
+        with open(self.xml_path, "rb") as f:
+            header = f.read(self.header_end)
+        return ET.fromstring(header + self.root_end)
+
+    def read_elements(self, keys:list[tuple]) -> list[ET._Element]:
+        """Parses the elements of the given nodes
+
+        Args:
+            keys (list[tuple]): NodeId.key of indexed nodes
+
+        Returns:
+            list[ET._Element]: Node elements, in the order of keys
+        """
+        fragments = []
+        with open(self.xml_path, "rb") as f:
+            for key in keys:
+                start, end = self.spans[key]
+                f.seek(start)
+                fragments.append(f.read(end - start))
+        wrapper = ET.fromstring(self.root_start + b"".join(fragments) + self.root_end)
+        return [elem for elem in wrapper if isinstance(elem.tag, str)]
+
+
+def _attribute_value(pattern:re.Pattern, attrs:bytes) -> str | None:
+    match = pattern.search(attrs)
+    if match is None:
+        return None
+    value = match.group(1)
+    return _unescape(value if value is not None else match.group(2))
+
+
+def _unescape(value:bytes) -> str:
+    if b"&" in value:
+        return unescape(value.decode("utf-8"), _ENTITIES)
+    return value.decode("utf-8")
+
+
+class _LazyNodesById(dict):
+    """nodes_by_id of a LazyNamespace. Lookups parse indexed nodes on first use, iteration parses all of them."""
+
+    def __init__(self, namespace:"LazyNamespace"):
+        super().__init__()
+        self._namespace = namespace
+
+    def get(self, key, default=None):
+        node = dict.get(self, key)
+        if node is None:
+            if key not in self._namespace._pending:
+                return default
+            nodes = self._namespace._materialize([key])
+            # Empty if another thread parsed the node first
+            node = nodes[0] if nodes else dict.get(self, key, default)
+        return node
+
+    def __getitem__(self, key):
+        node = self.get(key)
+        if node is None:
+            raise KeyError(key)
+        return node
+
+    def __contains__(self, key) -> bool:
+        return dict.__contains__(self, key) or key in self._namespace._pending
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + len(self._namespace._pending)
+
+    def __iter__(self):
+        self._namespace.materialize_all()
+        return dict.__iter__(self)
+
+    def keys(self):
+        self._namespace.materialize_all()
+        return dict.keys(self)
+
+    def values(self):
+        self._namespace.materialize_all()
+        return dict.values(self)
+
+    def items(self):
+        self._namespace.materialize_all()
+        return dict.items(self)
+
+
+class _LazyNodesByBrowseName(dict):
+    """nodes_by_browse_name of a LazyNamespace, parses all indexed nodes of a browse name on first lookup"""
+
+    def __init__(self, namespace:"LazyNamespace"):
+        super().__init__()
+        self._namespace = namespace
+
+    def get(self, browse_name, default=None):
+        keys = self._namespace._index.keys_by_browse_name.get(browse_name)
+        if keys is not None:
+            pending = self._namespace._pending
+            self._namespace._materialize([key for key in keys if key in pending])
+        return dict.get(self, browse_name, default)
+
+    def __getitem__(self, browse_name):
+        nodes = self.get(browse_name)
+        if nodes is None:
+            raise KeyError(browse_name)
+        return nodes
+
+    def __contains__(self, browse_name) -> bool:
+        return dict.__contains__(self, browse_name) or browse_name in self._namespace._index.keys_by_browse_name
+
+
+class LazyNamespace(Namespace):
+    """Namespace of a nodeset file whose nodes are parsed on first lookup through find_by_nodeid,
+    find_by_browse_name or nodes_by_id. Iterating over nodes_by_id parses all remaining nodes.
+
+    Reverse lookups (references_to) only know about parsed nodes, call materialize_all first if they have to cover the
+    whole file. The same goes for the hierarchy index, but iter_subtree and resolve_browse_path parse the children of
+    the nodes they visit first, so they only parse the part of the hierarchy they walk. Nodes are kept in the order
+    they were parsed in, not in file order.
+    """
+
+    _index: NodeElementIndex
+    # Keys of indexed nodes that are not parsed yet
+    _pending: set[tuple]
+    # Parses a node element into a node of this namespace
+    _parse_element: Callable[[ET._Element, Namespace], Node]
+    # Guards parsing of pending nodes
+    _lock: threading.RLock
+    # NodeId.key of a node -> keys of the nodes declaring an inverse reference to it, built on first use
+    _inverse_sources: dict[tuple, list[tuple]] | None
+
+    def __init__(self, index:NodeElementIndex, parse_element:Callable[[ET._Element, Namespace], Node],
+                 namespace_context:NamespaceContext = None):
+        super().__init__(namespace_context)
+        self._index = index
+        self._pending = set(index.spans)
+        self._parse_element = parse_element
+        self._lock = threading.RLock()
+        self._inverse_sources = None
+        self.nodes_by_id = _LazyNodesById(self)
+        self.nodes_by_browse_name = _LazyNodesByBrowseName(self)
+
+    def __getstate__(self) -> dict:
+        raise TypeError("LazyNamespace can not be pickled, call materialize_all and copy the nodes to a Namespace")
+
+    @property
+    def materialized_count(self) -> int:
+        return dict.__len__(self.nodes_by_id)
+
+    def _materialize(self, keys:list[tuple]) -> list[Node]:
+        if not keys:
+            return []
+        nodes = []
+        # Typelibraries may be shared by builds on several threads, see ModelBuilderEngine.fork
+        with self._lock:
+            # Another thread may have parsed some of the nodes in the meantime
+            keys = [key for key in keys if key in self._pending]
+            for key, elem in zip(keys, self._index.read_elements(keys)):
+                node = self._parse_element(elem, self)
+                self.add_node(node)
+                self._pending.discard(key)
+                nodes.append(node)
+        return nodes
+
+    def materialize_all(self):
+        """Parses all nodes that have not been parsed yet"""
+        if self._pending:
+            self._materialize([key for key in self._index.spans if key in self._pending])
+
+    def _build_hierarchy_index(self):
+        # Only the parsed nodes, nodes parsed later are indexed by add_node
+        with self._lock:
+            self._children = {}
+            self._parents = {}
+            self._child_names = {}
+            for node in list(dict.values(self.nodes_by_id)):
+                for ref in node.references:
+                    self._index_hierarchical_reference(ref)
+
+    def _get_children(self, key:tuple) -> dict:
+        # Parses the node, whose forward references name children, and the nodes that name it as their parent
+        inverse_sources = self._inverse_sources
+        if inverse_sources is None:
+            inverse_sources = {}
+            for target, sources in self._index.inverse_sources.items():
+                try:
+                    target_key = self.resolve(target).key
+                except ValueError:
+                    continue
+                inverse_sources.setdefault(target_key, []).extend(sources)
+            self._inverse_sources = inverse_sources
+        pending = self._pending
+        keys = [source for source in inverse_sources.get(key, ()) if source in pending]
+        if key in pending:
+            keys.append(key)
+        self._materialize(keys)
+        # A copy, other threads may add children while the caller iterates
+        return dict(super()._get_children(key))
+
+    def find_by_qualified_name(self, ns_index:int, name:str) -> list[Node]:
+        # Parses the indexed nodes of the name first, they are stored under the browse name as written in the file
+        self.nodes_by_browse_name.get(f"{ns_index}:{name}")
+        if ns_index == 0:
+            self.nodes_by_browse_name.get(name)
+        return super().find_by_qualified_name(ns_index, name)
+
+    def iter_nodes(self, node_class:NodeClass = None) -> Iterator[Node]:
+        if node_class is None:
+            yield from super().iter_nodes()
+            return
+        pending = self._pending
+        self._materialize([
+            key for key, key_class in self._index.node_classes.items() if key_class == node_class and key in pending])
+        for node in dict.values(self.nodes_by_id):
+            if node.node_class == node_class:
+                yield node
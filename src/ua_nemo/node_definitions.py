@@ -75,6 +75,9 @@ NODE_CLASSES = {
 
 STR_TO_NODE_CLASS = {v: k for k, v in NODE_CLASSES.items()}
 
+# Node elements read from typelibrary files
+LOADED_NODE_TAGS = ("UAObjectType", "UAVariableType", "UAReferenceType", "UADataType", "UAObject", "UAVariable")
+
 def resolve_node_class(nodeclass:str|NodeClass) -> NodeClass|str:
     if isinstance(nodeclass, str):
         return STR_TO_NODE_CLASS[nodeclass]
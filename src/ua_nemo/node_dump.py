@@ -0,0 +1,105 @@
+"""JSON lines dump of a model, for handing models between build stages without going through nodeset xml.
+
+The first line holds the model: uri, name, namespace array, aliases and model info. Every following line is one node:
+
+    {"n": NodeId, "b": BrowseName, "c": NodeClass value, "a": attributes, "s": subnodes,
+     "r": [[reference type, target NodeId, is_forward], ...], "t": base type NodeId, only for classified reference types}
+"""
+import io
+import json
+
+from .node_model import Namespace, NamespaceContext, Node, NodeClass, NodeId
+from .streams import open_input, open_output
+
+JSONL_FORMAT = "ua_nemo-jsonl"
+JSONL_VERSION = 1
+
+
+def dump_model_to_jsonl(model:Namespace, output, compression:str = None):
+    """Writes a model as JSON lines
+
+    Args:
+        model (Namespace): Model to dump
+        output: File path, writable binary file object or connected socket, see streams.open_output
+        compression (str, optional): "gzip" or "zstd". Defaults to None, which infers it from the suffix of a file path.
+    """
+    header = {
+        "format": JSONL_FORMAT,
+        "version": JSONL_VERSION,
+        "uri": model.uri,
+        "name": model.name,
+        "namespace_array": model.namespace_array,
+        "aliases": {alias: nodeid.to_string() for alias, nodeid in model.aliases.items()},
+        "ns_info": model.ns_info,
+    }
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+    with open_output(output, compression) as f:
+        f.write(encode(header).encode("utf-8") + b"\n")
+        lines = []
+        for node in model.nodes_by_id.values():
+            record = {
+                "n": node.node_id.to_string(),
+                "b": node.browse_name,
+                "c": node.node_class.value,
+                "a": node.attributes_view,
+                "s": node.subnodes_view,
+                "r": [(ref.reference_type, ref.target_nodeid.to_string(), ref.is_forward) for ref in node.references],
+            }
+            if node.base_type is not None:
+                record["t"] = node.base_type.to_string()
+            lines.append(encode(record))
+            if len(lines) >= 1000:
+                f.write(("\n".join(lines) + "\n").encode("utf-8"))
+                lines = []
+        if lines:
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+def load_model_from_jsonl(source, compression:str = None, namespace_context:NamespaceContext = None,
+                          register:bool = True) -> Namespace:
+    """Reads a model written by dump_model_to_jsonl
+
+    Args:
+        source: File path or readable binary file object
+        compression (str, optional): "gzip" or "zstd". Defaults to None, which infers it from the suffix of a file path.
+        namespace_context (NamespaceContext, optional): Context of the model. Defaults to the default context.
+        register (bool, optional): Register the model in the namespace context, like a loaded typelibrary.
+            Defaults to True.
+
+    Raises:
+        ValueError: If the source is not a node dump of a supported version
+
+    Returns:
+        Namespace: The model
+    """
+    with open_input(source, compression) as f:
+        lines = io.TextIOWrapper(f, encoding="utf-8")
+        header = json.loads(lines.readline() or "{}")
+        if header.get("format") != JSONL_FORMAT or header.get("version") != JSONL_VERSION:
+            raise ValueError(f"Not a {JSONL_FORMAT} version {JSONL_VERSION} node dump")
+
+        model = Namespace(namespace_context)
+        # Restored as is, the uri setter would initialize a fresh namespace array
+        model._uri = header["uri"]
+        model.name = header["name"]
+        model.namespace_array = header["namespace_array"]
+        model.ns_info = header["ns_info"]
+        model.aliases = {alias: NodeId.from_string(nodeid) for alias, nodeid in header["aliases"].items()}
+
+        node_classes = {node_class.value: node_class for node_class in NodeClass}
+        add_node = model.add_node
+        for line in lines:
+            record = json.loads(line)
+            node = Node(record["n"], record["b"], node_classes[record["c"]], model, record["a"], record["s"])
+            for ref_type, target, is_forward in record["r"]:
+                node.add_reference(ref_type, target, is_forward)
+            base_type = record.get("t")
+            if base_type is not None:
+                node.base_type = NodeId.from_string(base_type)
+            add_node(node)
+        lines.detach()
+
+    if register and model.uri:
+        model.namespace_context.register_model(model, init_namespace_array=False)
+        model.namespace_context.build_reference_type_table(model)
+    return model
@@ -1,5 +1,11 @@
 from __future__ import annotations
+from array import array
+from collections import deque
 from enum import Enum
+from functools import lru_cache
+import threading
+from types import MappingProxyType
+from typing import Callable, Iterable, Iterator, Mapping
 
 from . import node_definitions
 from .node_definitions import NodeClass
@@ -11,17 +17,42 @@ class NodeIdType(Enum):
     OPAQUE = "b"
 
 
+# Number of distinct NodeId strings whose parse is kept, see NodeId.from_string
+NODEID_CACHE_SIZE = 1 << 16
+
+
 class NodeId:
-    __slots__ = ("ns_index", "id_type", "id")
+    """Immutable OPC UA NodeId. NodeIds parsed from equal strings are the same object while the string is in the
+    parse cache, so the NodeIds of common targets like i=40 are shared instead of duplicated per reference."""
+    __slots__ = ("ns_index", "id_type", "id", "key", "local_key", "_hash", "_string")
 
     ns_index:int
     id_type:NodeIdType
     id: int|str
+    # Hashable identity, used to index nodes in a Namespace
+    key: tuple[int, str, int|str]
+    # Key of the node within the model that owns its namespace, where the namespace is either 0 (UA) or 1 (local)
+    local_key: tuple[int, str, int|str]
 
     def __init__(self, ns_index:int, id_type: NodeIdType, id:int|str):
-        self.ns_index = ns_index
-        self.id_type = id_type
-        self.id = id
+        key = (ns_index, id_type.value, id)
+        set_slot = object.__setattr__
+        set_slot(self, "ns_index", ns_index)
+        set_slot(self, "id_type", id_type)
+        set_slot(self, "id", id)
+        set_slot(self, "key", key)
+        set_slot(self, "local_key", key if ns_index <= 1 else (1, id_type.value, id))
+        set_slot(self, "_hash", hash(key))
+        set_slot(self, "_string", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return (self.__class__, (self.ns_index, self.id_type, self.id))
 
     def __repr__(self) -> str:
         cls_name = self.__class__.__name__
@@ -34,56 +65,65 @@ class NodeId:
         return f"ns={self.ns_index};{self.id_type.value}={self.id}"
     
     def __eq__(self, other) -> bool:
+        if other is self:
+            return True
         if not isinstance(other, NodeId):
             return NotImplemented
-        return (
-            self.ns_index == other.ns_index
-            and self.id_type == other.id_type
-            and self.id == other.id
-        )
+        return self.key == other.key
 
     def __hash__(self):
-        return hash((self.ns_index, self.id_type, self.id))
+        return self._hash
    
     @classmethod
     def from_string(cls, raw:str) -> "NodeId":
-        raw = raw.strip()
+        """Parses a NodeId string like "i=58" or "ns=1;s=Thing". The last NODEID_CACHE_SIZE distinct strings are
+        cached, so parsing a repeated string returns the same NodeId.
 
-        # Default NS-idx is 0 according to OPC UA spec
-        ns_index = 0
-        id_part = None
+        Raises:
+            ValueError: If the string is not a valid NodeId
+        """
+        if cls is not NodeId:
+            return _parse_nodeid(cls, raw)
+        return _parse_nodeid_cached(raw)
+    
+    def to_string(self) -> str:
+        string = self._string
+        if string is None:
+            if self.ns_index == 0:
+                string = f"{self.id_type.value}={self.id}"
+            else:
+                string = f"ns={self.ns_index};{self.id_type.value}={self.id}"
+            object.__setattr__(self, "_string", string)
+        return string
 
-        # Split namespace if present
-        if raw.startswith("ns="):
-            ns_part, id_part = raw.split(";", 1)
-            ns_index = int(ns_part.split("=", 1)[1]) 
-        else:
-            id_part = raw
 
-        try:
-            id_char, ident_str = id_part.split("=", 1)
-        except ValueError:
+_ID_TYPES = {id_type.value: id_type for id_type in NodeIdType}
+
+def _parse_nodeid(cls, raw:str) -> NodeId:
+    text = raw.strip()
+
+    # Default NS-idx is 0 according to OPC UA spec
+    ns_index = 0
+    if text.startswith("ns="):
+        ns_part, separator, text = text.partition(";")
+        if not separator:
             raise ValueError(f"Invalid Nodeid string: {raw!r}")
-        
-        # Map id type char to enum
-        try:
-            id_type = NodeIdType(id_char)
-        except ValueError:
-            raise ValueError(f"Unknown NodeId type '{id_char}' in {raw!r}")
-        
-        # Convert identifier
-        if id_type is NodeIdType.NUMERIC:
-            identifier = int(ident_str)
-        else:
-            identifier = ident_str
-        
-        return cls(ns_index, id_type, identifier)
-    
-    def to_string(self) -> str:
-        if self.ns_index == 0:
-            return f"{self.id_type.value}={self.id}"
-        else:
-            return f"ns={self.ns_index};{self.id_type.value}={self.id}"
+        ns_index = int(ns_part[3:])
+
+    id_char, separator, ident_str = text.partition("=")
+    if not separator:
+        raise ValueError(f"Invalid Nodeid string: {raw!r}")
+    id_type = _ID_TYPES.get(id_char)
+    if id_type is None:
+        raise ValueError(f"Unknown NodeId type '{id_char}' in {raw!r}")
+
+    if id_type is NodeIdType.NUMERIC:
+        return cls(ns_index, id_type, int(ident_str))
+    return cls(ns_index, id_type, ident_str)
+
+@lru_cache(maxsize=NODEID_CACHE_SIZE)
+def _parse_nodeid_cached(raw:str) -> NodeId:
+    return _parse_nodeid(NodeId, raw)
         
 class Reference:
     __slots__ = ("reference_type", "target_nodeid", "is_forward", "source")
@@ -115,7 +155,7 @@ class Reference:
     def is_hierarchical(self) -> bool:
         # Only hierarchical refs have base type for now
         ref_node = self.get_base_type_node()
-        return ref_node.base_type is not None
+        return ref_node is not None and ref_node.base_type is not None
 
     @property
     def base_type(self) -> str:
@@ -126,21 +166,201 @@ class Reference:
     def target(self) -> Node:
         return self.source.namespace.find_by_nodeid(self.target_nodeid)
 
-    def get_base_type_node(self) -> Node:
-        ref_nid = self.source.namespace.resolve(self.reference_type)
-        return self.source.namespace.find_by_nodeid(ref_nid)
+    def get_base_type_node(self) -> Node | None:
+        return self.source.namespace.get_reference_type_node(self.reference_type)
+
+
+class ReferenceStore:
+    """Columnar storage of the references of a namespace, see Namespace(compact_references=True).
+
+    A reference is a row in parallel arrays of source, reference type, target and direction. NodeIds and reference
+    types are interned to integer ids, and the rows of a source and of a target are chained through the next_by_*
+    arrays, so the references of a node and the references pointing at it are found without scanning. Reference
+    objects are only created when rows are read.
+    """
+    __slots__ = ("nodeids", "nodes", "_nodeid_ids", "reference_types", "_reference_type_ids", "sources", "types",
+                 "targets", "forward", "next_by_source", "next_by_target", "first_by_source", "last_by_source",
+                 "first_by_target", "last_by_target")
+
+    # Interned NodeIds of sources and targets, and the source Node of a NodeId once it has a reference view
+    nodeids: list[NodeId]
+    nodes: list[Node | None]
+    _nodeid_ids: dict[tuple, int]
+    # Interned reference types, as written in references
+    reference_types: list[str]
+    _reference_type_ids: dict[str, int]
+    # Per reference: nodeid ids of source and target, reference type id, direction and the next row of the same
+    # source and target, -1 at the end of a chain
+    sources: array
+    types: array
+    targets: array
+    forward: array
+    next_by_source: array
+    next_by_target: array
+    # Per nodeid id: first and last row of its chains, -1 if it has none
+    first_by_source: array
+    last_by_source: array
+    first_by_target: array
+    last_by_target: array
+
+    def __init__(self):
+        self.nodeids = []
+        self.nodes = []
+        self._nodeid_ids = {}
+        self.reference_types = []
+        self._reference_type_ids = {}
+        self.sources = array("i")
+        self.types = array("i")
+        self.targets = array("i")
+        self.forward = array("b")
+        self.next_by_source = array("i")
+        self.next_by_target = array("i")
+        self.first_by_source = array("i")
+        self.last_by_source = array("i")
+        self.first_by_target = array("i")
+        self.last_by_target = array("i")
+
+    def __len__(self) -> int:
+        return len(self.sources)
+
+    def intern_nodeid(self, node_id:NodeId) -> int:
+        nodeid_id = self._nodeid_ids.get(node_id.key)
+        if nodeid_id is None:
+            nodeid_id = len(self.nodeids)
+            self._nodeid_ids[node_id.key] = nodeid_id
+            self.nodeids.append(node_id)
+            self.nodes.append(None)
+            for chain_ends in (self.first_by_source, self.last_by_source, self.first_by_target, self.last_by_target):
+                chain_ends.append(-1)
+        return nodeid_id
+
+    def view(self, node:Node) -> ReferenceView:
+        """Returns the reference view of a node, which is used as its references. A node created again with the same
+        NodeId takes over the references of the previous one."""
+        source_id = self.intern_nodeid(node.node_id)
+        self.nodes[source_id] = node
+        return ReferenceView(self, source_id)
+
+    def add(self, source_id:int, reference_type:str, target_nodeid:NodeId, is_forward:bool) -> int | None:
+        """Adds a reference, unless the source already has the same one
+
+        Returns:
+            int | None: Row of the reference, or None if it is a duplicate
+        """
+        type_id = self._reference_type_ids.get(reference_type)
+        if type_id is None:
+            type_id = len(self.reference_types)
+            self._reference_type_ids[reference_type] = type_id
+            self.reference_types.append(reference_type)
+        target_id = self.intern_nodeid(target_nodeid)
+
+        # Nodes have few references, so duplicates are found by walking the chain of the source
+        types, targets, forward, next_by_source = self.types, self.targets, self.forward, self.next_by_source
+        row = self.first_by_source[source_id]
+        while row != -1:
+            if types[row] == type_id and targets[row] == target_id and forward[row] == is_forward:
+                return None
+            row = next_by_source[row]
+
+        row = len(self.sources)
+        self.sources.append(source_id)
+        types.append(type_id)
+        targets.append(target_id)
+        forward.append(is_forward)
+        next_by_source.append(-1)
+        self.next_by_target.append(-1)
+        self._link(row, source_id, self.first_by_source, self.last_by_source, next_by_source)
+        self._link(row, target_id, self.first_by_target, self.last_by_target, self.next_by_target)
+        return row
+
+    @staticmethod
+    def _link(row:int, nodeid_id:int, first:array, last:array, next_row:array):
+        if first[nodeid_id] == -1:
+            first[nodeid_id] = row
+        else:
+            next_row[last[nodeid_id]] = row
+        last[nodeid_id] = row
+
+    def reference(self, row:int) -> Reference:
+        return Reference(
+            self.reference_types[self.types[row]],
+            self.nodeids[self.targets[row]],
+            bool(self.forward[row]),
+            self.nodes[self.sources[row]])
+
+    def rows_from(self, source_id:int) -> Iterator[int]:
+        next_by_source = self.next_by_source
+        row = self.first_by_source[source_id]
+        while row != -1:
+            yield row
+            row = next_by_source[row]
+
+    def references_to(self, node_id:NodeId) -> Iterator[Reference]:
+        target_id = self._nodeid_ids.get(node_id.key)
+        if target_id is None:
+            return
+        next_by_target = self.next_by_target
+        row = self.first_by_target[target_id]
+        while row != -1:
+            yield self.reference(row)
+            row = next_by_target[row]
+
+
+class ReferenceView:
+    """The references of a node in a ReferenceStore. Reads like the reference list of a node, the references are
+    created on access."""
+    __slots__ = ("store", "source_id")
+
+    store: ReferenceStore
+    source_id: int
+
+    def __init__(self, store:ReferenceStore, source_id:int):
+        self.store = store
+        self.source_id = source_id
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({list(self)!r})"
+
+    def __iter__(self) -> Iterator[Reference]:
+        reference = self.store.reference
+        for row in self.store.rows_from(self.source_id):
+            yield reference(row)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.store.rows_from(self.source_id))
+
+    def __bool__(self) -> bool:
+        return self.store.first_by_source[self.source_id] != -1
+
+    def __getitem__(self, idx:int|slice) -> Reference | list[Reference]:
+        return list(self)[idx]
+
+    def add(self, reference_type:str, target_nodeid:NodeId, is_forward:bool) -> Reference | None:
+        row = self.store.add(self.source_id, reference_type, target_nodeid, is_forward)
+        return None if row is None else self.store.reference(row)
+
+
+# Bits of Node._shared_fields
+SHARED_ATTRIBUTES = 1
+SHARED_SUBNODES = 2
+# Attributes and subnodes of nodes that have none, never modified as it is always flagged as shared
+_EMPTY_FIELDS = {}
 
 
 class Node:
-    __slots__ = ("node_id", "browse_name", "node_class", "references", "attributes", "subnodes", "namespace", "base_type")
+    __slots__ = ("node_id", "browse_name", "node_class", "references", "_reference_keys", "_attributes", "_subnodes",
+                 "_shared_fields", "namespace", "base_type")
 
     namespace: Namespace
     node_id: NodeId
     browse_name: str
     node_class: NodeClass
-    references:list[Reference]
+    # A list, or a ReferenceView when the namespace stores its references in a ReferenceStore
+    references:list[Reference] | ReferenceView
     attributes:dict
     subnodes:dict
+    # SHARED_ATTRIBUTES | SHARED_SUBNODES for the dicts that are shared with other nodes and copied on first write
+    _shared_fields: int
     base_type:NodeId
 
     display_name: str
@@ -160,24 +380,48 @@ class Node:
             browse_name:str, 
             node_class: NodeClass, 
             namespace:Namespace,
-            attributes:dict={}, 
-            subnodes:dict={},
+            attributes:dict=None, 
+            subnodes:dict=None,
+            shared:bool=False,
             ):
-        
+        """
+        Args:
+            node_id (str | NodeId): NodeId of the node
+            browse_name (str): Browse name, also the display name unless subnodes has a DisplayName
+            node_class (NodeClass): Node class
+            namespace (Namespace): Namespace of the node
+            attributes (dict, optional): xml attributes. Defaults to None, no attributes.
+            subnodes (dict, optional): Subnodes like DisplayName, Value etc. Defaults to None, no subnodes.
+            shared (bool, optional): attributes and subnodes are shared with other nodes, like the entries of an
+                instance template, and are copied before the node changes them. Defaults to False.
+        """
         if not isinstance(node_id, NodeId):
             node_id = NodeId.from_string(node_id)
         
         self.node_id = node_id
         self.browse_name = browse_name
         self.node_class = node_class
-        self.references = []
-        self.attributes = attributes  # xml attributes
-        self.subnodes = subnodes # subnodes like displayname, value etc.
+        reference_store = namespace.reference_store
+        if reference_store is None:
+            self.references = []
+            self._reference_keys = set() # (reference_type, target key, is_forward) of references, for deduplication
+        else:
+            # Deduplicated by the store
+            self.references = reference_store.view(self)
+            self._reference_keys = None
+
+        shared_fields = SHARED_ATTRIBUTES | SHARED_SUBNODES if shared else 0
+        if not attributes:
+            attributes = _EMPTY_FIELDS
+            shared_fields |= SHARED_ATTRIBUTES
+        if not subnodes:
+            subnodes = _EMPTY_FIELDS
+            shared_fields |= SHARED_SUBNODES
+        self._attributes = attributes
+        self._subnodes = subnodes
+        self._shared_fields = shared_fields
         self.namespace = namespace
         self.base_type = None
-
-        if not "DisplayName" in subnodes:
-            subnodes["DisplayName"] = browse_name
     
     def __repr__(self) -> str:
         cls_name = self.__class__.__name__
@@ -198,13 +442,69 @@ class Node:
     def is_variable(self) -> bool:
         return self.node_class == NodeClass.Variable
     
+    @property
+    def attributes(self) -> Mapping:
+        """The xml attributes of the node, read-only since they may be shared with other nodes. Use edit_attributes
+        to change them."""
+        return MappingProxyType(self._attributes)
+
+    @attributes.setter
+    def attributes(self, attributes:dict):
+        self._attributes = attributes
+        self._shared_fields &= ~SHARED_ATTRIBUTES
+        self._mark_dirty()
+
+    @property
+    def subnodes(self) -> Mapping:
+        """The subnodes of the node, read-only like attributes. Use edit_subnodes to change them. The DisplayName is
+        only in here if it was set, see display_name."""
+        return MappingProxyType(self._subnodes)
+
+    @subnodes.setter
+    def subnodes(self, subnodes:dict):
+        self._subnodes = subnodes
+        self._shared_fields &= ~SHARED_SUBNODES
+        self._mark_dirty()
+
+    def edit_attributes(self) -> dict:
+        """Returns the xml attributes of the node for editing, copied first if they are shared with other nodes, and
+        marks the node as changed for incremental exports. Call it again for edits made after an export."""
+        if self._shared_fields & SHARED_ATTRIBUTES:
+            self._attributes = dict(self._attributes)
+            self._shared_fields &= ~SHARED_ATTRIBUTES
+        self._mark_dirty()
+        return self._attributes
+
+    def edit_subnodes(self) -> dict:
+        """Returns the subnodes of the node for editing, see edit_attributes"""
+        if self._shared_fields & SHARED_SUBNODES:
+            self._subnodes = dict(self._subnodes)
+            self._shared_fields &= ~SHARED_SUBNODES
+        self._mark_dirty()
+        return self._subnodes
+
+    def _mark_dirty(self):
+        if self.namespace is not None:
+            self.namespace.mark_dirty(self)
+
+    @property
+    def attributes_view(self) -> dict:
+        """The xml attributes dict of the node without the read-only wrapper of attributes, for hot loops. It may be
+        shared with other nodes and must not be modified."""
+        return self._attributes
+
+    @property
+    def subnodes_view(self) -> dict:
+        """The subnodes dict of the node, see attributes_view"""
+        return self._subnodes
+
     @property
     def display_name(self) -> str:
-        return self.subnodes.get("DisplayName", "")
+        return self._subnodes.get("DisplayName", self.browse_name)
     
     @property
     def description(self) -> str:
-        return self.subnodes.get("Description", "")
+        return self._subnodes.get("Description", "")
     
     @property
     def node_uri(self) -> str:
@@ -239,35 +539,127 @@ class Node:
 
     @property
     def value(self):
-        return self.subnodes.get("Value")
+        return self._subnodes.get("Value")
     
     def get_hierarchical_references(self, is_forward:bool) -> list[Reference]:
         hierarchical_refs = []
+        get_reference_type_node = self.namespace.get_reference_type_node
         for ref in self.references:
             if not ref.is_forward == is_forward:
                 continue
-            ref_type = self.namespace.resolve(ref.reference_type)
-            ref_type_node = self.namespace.find_by_nodeid(ref_type)
-            if ref_type_node.base_type:
+            ref_type_node = get_reference_type_node(ref.reference_type)
+            if ref_type_node is not None and ref_type_node.base_type:
                 hierarchical_refs.append(ref)
         return hierarchical_refs
                 
-    def add_reference(self, reference_type: str, target_nodeid: str, is_forward:bool=True):
-        ref = Reference(reference_type, target_nodeid, is_forward, self)
-        if ref not in self.references:
-            self.references.append(Reference(reference_type, target_nodeid, is_forward, self))
+    def add_reference(self, reference_type: str, target_nodeid: str|NodeId, is_forward:bool=True):
+        if not isinstance(target_nodeid, NodeId):
+            target_nodeid = NodeId.from_string(target_nodeid)
+        if self._reference_keys is None:
+            ref = self.references.add(reference_type, target_nodeid, is_forward)
+            if ref is None:
+                return
+        else:
+            ref_key = (reference_type, target_nodeid.key, is_forward)
+            if ref_key in self._reference_keys:
+                return
+            self._reference_keys.add(ref_key)
+            ref = Reference(reference_type, target_nodeid, is_forward, self)
+            self.references.append(ref)
+        self.namespace._on_reference_added(ref)
         
+class NamespaceTranslation:
+    """Translates NodeIds from the namespace array of one model to the namespace array of another, see
+    NamespaceContext.remap_nodeid. Namespaces missing in the target model are added to it on first use."""
+    __slots__ = ("from_model", "to_model", "indexes", "nodeids")
+
+    from_model: Namespace
+    to_model: Namespace
+    # Namespace index in from_model -> index in to_model, None until first used
+    indexes: list[int | None]
+    # NodeId.key in from_model -> remapped NodeId, for NodeIds whose namespace index changes
+    nodeids: dict[tuple, NodeId]
+
+    def __init__(self, from_model:Namespace, to_model:Namespace):
+        self.from_model = from_model
+        self.to_model = to_model
+        self.indexes = []
+        self.nodeids = {}
+
+    def translate_index(self, ns_index:int) -> int:
+        indexes = self.indexes
+        if ns_index >= len(indexes):
+            indexes.extend([None] * (ns_index + 1 - len(indexes)))
+        new_index = indexes[ns_index]
+        if new_index is None:
+            uri = self.from_model.namespace_array[ns_index]
+            new_index = self.to_model.namespace_context.get_or_add_namespace(self.to_model, uri)
+            indexes[ns_index] = new_index
+        return new_index
+
+    def remap(self, nid:NodeId) -> NodeId:
+        remapped = self.nodeids.get(nid.key)
+        if remapped is None:
+            new_index = self.translate_index(nid.ns_index)
+            if new_index == nid.ns_index:
+                return nid
+            remapped = NodeId(new_index, nid.id_type, nid.id)
+            self.nodeids[nid.key] = remapped
+        return remapped
+
+
 class NamespaceContext:
+    """The models that NodeIds of a namespace array are resolved against. Models only see the models registered in
+    their own context, so independent builds should each use their own, see snapshot and ModelBuilderEngine.fork.
+    Registration and namespace translation are guarded by a lock, lookups are plain dict reads."""
     #TODO Needs a cleanup, fairly sure this contains duplicate functionality
-    namespace_dict: dict[str, Namespace] = {}
-    namespace_dict_uri: dict[str, Namespace] = {}
-    known_models: list[Namespace] = []
+    namespace_dict: dict[str, Namespace]
+    namespace_dict_uri: dict[str, Namespace]
+    known_models: list[str]
+    # Per model uri: reference type as written in references (alias or NodeId string) -> ReferenceType node
+    reference_type_tables: dict[str, dict[str, Node]]
+    # (from model uri, to model uri) -> translation between the namespace arrays of the two models
+    translations: dict[tuple[str, str], NamespaceTranslation]
+    lock: threading.RLock
+
+    def __init__(self):
+        self.namespace_dict = {}
+        self.namespace_dict_uri = {}
+        self.known_models = []
+        self.reference_type_tables = {}
+        self.translations = {}
+        self.lock = threading.RLock()
+
+    def snapshot(self) -> NamespaceContext:
+        """Returns a new context with the models registered in this one. Models registered in either context later
+        on are not seen by the other, so a snapshot of a context holding loaded typelibraries can be used for a build
+        that runs concurrently with other builds over the same typelibraries.
+
+        Returns:
+            NamespaceContext: The new context
+        """
+        context = NamespaceContext()
+        with self.lock:
+            context.namespace_dict.update(self.namespace_dict)
+            context.namespace_dict_uri.update(self.namespace_dict_uri)
+            context.known_models.extend(self.known_models)
+            context.reference_type_tables.update(self.reference_type_tables)
+        return context
 
     #? Would I like to automatically load the ua nodeset here? 
-    def register_model(self, model:Namespace):
+    def register_model(self, model:Namespace, init_namespace_array:bool=True):
+        with self.lock:
+            self._register_model(model, init_namespace_array)
+
+    def _register_model(self, model:Namespace, init_namespace_array:bool):
         self.namespace_dict[model.name] = model
         self.namespace_dict_uri[model.uri] = model
         self.known_models.append(model.uri)
+        self.reference_type_tables[model.uri] = model.reference_type_table
+
+        if not init_namespace_array:
+            # Model was restored with its namespace array intact, e.g. from the typelibrary cache
+            return
 
         if not model.name == "UA":
             ua_namespace = self.namespace_dict.get("UA")
@@ -275,10 +667,25 @@ class NamespaceContext:
                 #TODO Make a proper warning
                 print(f"UA namespace has not been loaded. Model {model.name} has an empty namespace on index 0 of its namespace array.")
             else:
-                model.namespace_array.append(ua_namespace.uri)
+                model.add_namespace(ua_namespace.uri)
             
-        model.namespace_array.append(model.uri)
+        model.add_namespace(model.uri)
     
+    def unregister_model(self, model:Namespace):
+        """Removes a model and the namespace translations from and to it, so a finished target model can be garbage
+        collected. NodeIds of other models that point into its namespace no longer resolve."""
+        with self.lock:
+            if self.namespace_dict.get(model.name) is model:
+                del self.namespace_dict[model.name]
+            if self.namespace_dict_uri.get(model.uri) is model:
+                del self.namespace_dict_uri[model.uri]
+                self.reference_type_tables.pop(model.uri, None)
+                if model.uri in self.known_models:
+                    self.known_models.remove(model.uri)
+            self.translations = {
+                uris: translation for uris, translation in self.translations.items()
+                if translation.from_model is not model and translation.to_model is not model}
+
     def get_model(self, name:str=None, uri:str=None) -> Namespace | None:
         #TODO Refactor this
         if name == uri:
@@ -291,21 +698,53 @@ class NamespaceContext:
         return self.namespace_dict_uri[model_uri]
     
     def get_or_add_namespace(self, target_model:Namespace, uri:str) -> int:
-        if uri not in target_model.namespace_array:
-            target_model.namespace_array.append(uri)
-        return target_model.namespace_array.index(uri)
+        ns_index = target_model.get_namespace_index(uri)
+        if ns_index is None:
+            with self.lock:
+                target_model.add_namespace(uri)
+                ns_index = target_model.get_namespace_index(uri)
+        return ns_index
+
+    def get_translation(self, from_model:Namespace, to_model:Namespace) -> NamespaceTranslation:
+        """Returns the translation of NodeIds from one model to another, created on first use"""
+        translation = self.translations.get((from_model.uri, to_model.uri))
+        if translation is None or translation.from_model is not from_model or translation.to_model is not to_model:
+            with self.lock:
+                translation = NamespaceTranslation(from_model, to_model)
+                # Also replaces translations of models that were loaded again
+                self.translations[(from_model.uri, to_model.uri)] = translation
+        return translation
 
     def remap_nodeid(self, nid: NodeId, from_model:Namespace, to_model:Namespace) -> NodeId:
-        uri = from_model.namespace_array[nid.ns_index]
-        new_index = self.get_or_add_namespace(to_model, uri)
-        return NodeId(
-            ns_index = new_index,
-            id_type = nid.id_type,
-            id=nid.id)
+        """Returns the NodeId of from_model as a NodeId of to_model, adding its namespace to to_model if needed.
+        Remapping the same NodeId again returns the same object."""
+        return self.get_translation(from_model, to_model).remap(nid)
+
+    def remap_nodeids(self, nids: Iterable[NodeId], from_model:Namespace, to_model:Namespace) -> list[NodeId]:
+        """Bulk remap_nodeid, e.g. for all reference targets of a node"""
+        remap = self.get_translation(from_model, to_model).remap
+        return [remap(nid) for nid in nids]
     
     def empty(self):
         return len(self.namespace_dict) == 0
 
+    def build_reference_type_table(self, model:Namespace):
+        """Fills the reference type table of a model with its aliases and reference types, so hierarchy checks on
+        references cost a single dict lookup. Should be called once the model is loaded and its reference types are
+        classified. Other spellings of reference types are added to the table on first use.
+
+        Args:
+            model (Namespace): Loaded model
+        """
+        table = model.reference_type_table
+        table.clear()
+        for alias, nid in model.aliases.items():
+            ref_type_node = model.find_by_nodeid(nid)
+            if ref_type_node is not None and ref_type_node.node_class == NodeClass.ReferenceType:
+                table[alias] = ref_type_node
+        for node in model.iter_nodes(NodeClass.ReferenceType):
+            table[node.node_id.to_string()] = node
+
 class Namespace:
     #TODO Add ".from_nodeset" function to load nodemodels from files
     
@@ -313,32 +752,106 @@ class Namespace:
     _uri: str
 
     namespace_array: list
+    # Namespace uri -> first index in namespace_array, see get_namespace_index
+    _namespace_indexes: dict[str, int]
+    # The namespace array _namespace_indexes was built from and how many of its entries it covers
+    _indexed_array: list
+    _indexed_count: int
     namespace_context: NamespaceContext = None
     aliases: dict[str, NodeId]
     is_type_namespace: bool
     name: str
-    nodes_by_id: dict[str, Node]
+    # Nodes keyed on NodeId.key
+    nodes_by_id: dict[tuple, Node]
+    nodes_by_browse_name: dict[str, list[Node]]
+    # Nodes keyed on their browse name as (ns_index, name), see split_browse_name
+    nodes_by_qualified_name: dict[tuple[int, str], list[Node]]
+    # Reference type as written in references -> ReferenceType node, see NamespaceContext.build_reference_type_table
+    reference_type_table: dict[str, Node]
+    # Hierarchical adjacency, parent key -> {(child key, reference type): (child NodeId, Reference)} and the inverse.
+    # Built on the first traversal, None until then.
+    _children: dict[tuple, dict[tuple, tuple[NodeId, Reference]]] | None
+    _parents: dict[tuple, dict[tuple, tuple[NodeId, Reference]]] | None
+    # Columnar storage of the references of the nodes, None when nodes keep Reference objects in lists
+    reference_store: ReferenceStore | None
+    # Per parent NodeId.key: browse name of a hierarchical child -> the child, under both the name and the
+    # (ns_index, name) qualified name relative to this model. Filled per parent by resolve_browse_path.
+    _child_names: dict[tuple, dict[str|tuple[int, str], Node]]
+    # Target NodeId.key -> references in this model that point at it, unused with a reference store
+    _references_to: dict[tuple, list[Reference]]
+    # Keys of nodes added or changed since the last pop_dirty_nodes, see xml_builder.write_model_xml. None until
+    # track_changes is called.
+    _dirty_nodes: set[tuple] | None
 
     ns_info: dict
 
-    def __init__(self, namespace_context:NamespaceContext = None):
+    def __init__(self, namespace_context:NamespaceContext = None, compact_references:bool = False):
+        """
+        Args:
+            namespace_context (NamespaceContext, optional): Defaults to the default namespace context.
+            compact_references (bool, optional): Store references in a ReferenceStore instead of a Reference object
+                per reference, for large models. References of the nodes are then created when they are read.
+                Defaults to False.
+        """
         self.name = None
         self._uri = None
         self.is_type_namespace = False
         self.nodes_by_id = {}
         self.nodes_by_browse_name = {}
+        self.nodes_by_qualified_name = {}
         self.namespace_array = []
+        self._namespace_indexes = {}
+        self._indexed_array = self.namespace_array
+        self._indexed_count = 0
         self.ns_info = {}
+        self.reference_type_table = {}
+        self._children = None
+        self._parents = None
+        self._child_names = {}
+        self.reference_store = ReferenceStore() if compact_references else None
+        self._references_to = {}
+        self._dirty_nodes = None
         
         if namespace_context is None:
-            if Namespace._default_namespace_context is None:
-                Namespace._default_namespace_context = NamespaceContext()
-            self.namespace_context = Namespace._default_namespace_context
-        else:
-            self.namespace_context = namespace_context
+            namespace_context = Namespace.get_default_namespace_context()
+        self.namespace_context = namespace_context
         
         self.aliases = {}
 
+    @classmethod
+    def get_default_namespace_context(cls) -> NamespaceContext:
+        if Namespace._default_namespace_context is None:
+            Namespace._default_namespace_context = NamespaceContext()
+        return Namespace._default_namespace_context
+
+    def __getstate__(self) -> dict:
+        # The namespace context is process state, it is re-attached when the model is unpickled
+        state = self.__dict__.copy()
+        state.pop("namespace_context", None)
+        # May point into other models, rebuilt when the model is registered again
+        state.pop("reference_type_table", None)
+        # Derived indexes, rebuilt on demand
+        state.pop("_children", None)
+        state.pop("_parents", None)
+        state.pop("_child_names", None)
+        state.pop("_dirty_nodes", None)
+        state.pop("_namespace_indexes", None)
+        state.pop("_indexed_array", None)
+        state.pop("_indexed_count", None)
+        return state
+
+    def __setstate__(self, state:dict):
+        self.__dict__.update(state)
+        self.namespace_context = Namespace.get_default_namespace_context()
+        self.reference_type_table = {}
+        self._children = None
+        self._parents = None
+        self._child_names = {}
+        self._dirty_nodes = None
+        self._namespace_indexes = {}
+        self._indexed_array = self.namespace_array
+        self._indexed_count = 0
+
     def __repr__(self) -> str:
         cls = self.__class__.__name__
         return (f"{cls}("
@@ -397,21 +910,241 @@ class Namespace:
             raise ValueError(f"Unknown alias or bad NodeId: {nodeid_or_alias}")
         
     def add_namespace(self, ns_uri: str):
-        if ns_uri in self.namespace_array:
+        if self.get_namespace_index(ns_uri) is not None:
             return
         self.namespace_array.append(ns_uri)
 
+    def get_namespace_index(self, ns_uri: str) -> int | None:
+        """Returns the index of a namespace uri in the namespace array, None if it is not in it"""
+        array = self.namespace_array
+        indexes = self._namespace_indexes
+        if self._indexed_array is not array or self._indexed_count > len(array):
+            # The array was replaced, e.g. when restoring a model
+            indexes.clear()
+            self._indexed_array = array
+            self._indexed_count = 0
+        if self._indexed_count < len(array):
+            # Appended to since the last lookup
+            for ns_index in range(self._indexed_count, len(array)):
+                indexes.setdefault(array[ns_index], ns_index)
+            self._indexed_count = len(array)
+        return indexes.get(ns_uri)
+
     def get_namespace_by_index(self, ns_idx: int) -> str:
         return self.namespace_array[ns_idx]
 
     def add_node(self, node: Node):   
-        self.nodes_by_id[node.node_id.to_string()] = node
+        self.nodes_by_id[node.node_id.key] = node
+        if self._dirty_nodes is not None:
+            self._dirty_nodes.add(node.node_id.key)
         self.nodes_by_browse_name.setdefault(node.browse_name, []).append(node)
+        self.nodes_by_qualified_name.setdefault(split_browse_name(node.browse_name), []).append(node)
         
         if not self.is_type_namespace:
             if node.node_class in node_definitions.TYPE_CLASSES:
                 self.is_type_namespace = True
 
+        if self._children is not None:
+            for ref in node.references:
+                self._index_hierarchical_reference(ref)
+            if self._child_names:
+                # Edges declared by parents before the node was added
+                for parent_key, _ in self._parents.get(node.node_id.key, ()):
+                    names = self._child_names.get(parent_key)
+                    if names is not None:
+                        self._add_child_name(names, node)
+
+    def _on_reference_added(self, ref: Reference):
+        if self.reference_store is None:
+            self._references_to.setdefault(ref.target_nodeid.key, []).append(ref)
+        if self._dirty_nodes is not None:
+            self._dirty_nodes.add(ref.source.node_id.key)
+        # References of nodes that are not added yet are indexed by add_node. dict.get, so a LazyNamespace does not
+        # parse the node it is parsing again.
+        if self._children is not None and dict.get(self.nodes_by_id, ref.source.node_id.key) is ref.source:
+            self._index_hierarchical_reference(ref)
+
+    def track_changes(self):
+        """Starts recording the nodes that are added or changed, see pop_dirty_nodes. Called by NodeFragmentCache when
+        it first renders the model, models that are not exported incrementally do not keep the record."""
+        if self._dirty_nodes is None:
+            self._dirty_nodes = set()
+
+    def mark_dirty(self, node: Node|NodeId|str):
+        """Marks a node as changed, for changes that do not go through add_node, add_reference or the edit methods of
+        the node. Does nothing unless changes are tracked, see track_changes."""
+        if self._dirty_nodes is None:
+            return
+        if isinstance(node, Node):
+            node = node.node_id
+        elif isinstance(node, str):
+            node = NodeId.from_string(node)
+        self._dirty_nodes.add(node.key)
+
+    def pop_dirty_nodes(self) -> set[tuple]:
+        """Returns the keys of the nodes added or changed since the previous call and resets the record
+
+        Returns:
+            set[tuple]: NodeId.key of the changed nodes, empty if changes are not tracked
+        """
+        dirty = self._dirty_nodes
+        if dirty is None:
+            return set()
+        self._dirty_nodes = set()
+        return dirty
+
+    def references_to(self, node_id: Node|NodeId|str) -> list[Reference]:
+        """Returns the references in this model that point at a node, in the order they were added
+
+        Args:
+            node_id (Node | NodeId | str): Target node, or its NodeId relative to this model
+
+        Returns:
+            list[Reference]: References targeting the node. Their source attribute is the referencing node.
+        """
+        if isinstance(node_id, Node):
+            node_id = node_id.node_id
+        elif not isinstance(node_id, NodeId):
+            node_id = NodeId.from_string(node_id)
+        if self.reference_store is not None:
+            return list(self.reference_store.references_to(node_id))
+        return list(self._references_to.get(node_id.key, ()))
+
+    def _index_hierarchical_reference(self, ref: Reference):
+        ref_type_node = self.get_reference_type_node(ref.reference_type)
+        if ref_type_node is None or ref_type_node.base_type is None:
+            return
+        if ref.is_forward:
+            parent_id, child_id = ref.source.node_id, ref.target_nodeid
+        else:
+            parent_id, child_id = ref.target_nodeid, ref.source.node_id
+        # The same edge may be declared on both ends, keep the first declaration
+        self._children.setdefault(parent_id.key, {}).setdefault((child_id.key, ref.reference_type), (child_id, ref))
+        self._parents.setdefault(child_id.key, {}).setdefault((parent_id.key, ref.reference_type), (parent_id, ref))
+        names = self._child_names.get(parent_id.key)
+        if names is not None:
+            child = self.find_by_nodeid(child_id)
+            if child is not None:
+                self._add_child_name(names, child)
+
+    def _build_hierarchy_index(self):
+        nodes = self.nodes_by_id.values()
+        self._children = {}
+        self._parents = {}
+        self._child_names = {}
+        for node in nodes:
+            for ref in node.references:
+                self._index_hierarchical_reference(ref)
+
+    def build_indexes(self):
+        """Builds the indexes that are otherwise built on first use, so the model can be read from several threads at
+        once, like the typelibraries shared by the builds of ModelBuilderEngine.fork"""
+        with self.namespace_context.lock:
+            self.get_hierarchy_index()
+            self.get_namespace_index(self.uri)
+
+    def get_hierarchy_index(self) -> tuple[dict, dict]:
+        """Returns the hierarchical adjacency of the model, building it on first use. Both declaration directions of
+        a reference are taken into account, e.g. an inverse HasComponent on a child makes it a child of its parent.
+
+        Returns:
+            tuple[dict, dict]: children and parents, each mapping a NodeId.key to
+                {(NodeId.key, reference type): (NodeId, Reference)} of its neighbours
+        """
+        if self._children is None:
+            self._build_hierarchy_index()
+        return self._children, self._parents
+
+    def _get_children(self, key: tuple) -> dict:
+        """Returns the hierarchical children of a node from the hierarchy index, see get_hierarchy_index"""
+        children, _ = self.get_hierarchy_index()
+        return children.get(key, {})
+
+    def iter_subtree(
+            self,
+            root: Node|NodeId|str,
+            max_depth: int = None,
+            ref_filter: Callable[[Reference], bool] = None,
+            order: str = "bfs",
+            ) -> Iterator[tuple[int, Node]]:
+        """Walks the hierarchy below a node
+
+        Args:
+            root (Node | NodeId | str): Node to start from
+            max_depth (int, optional): Maximum depth below the root to visit. Defaults to no limit.
+            ref_filter (Callable[[Reference], bool], optional): Only follow hierarchical references it returns True for.
+                Defaults to all hierarchical references.
+            order (str, optional): "bfs" for breadth first or "dfs" for depth first (pre-order). Defaults to "bfs".
+
+        Yields:
+            tuple[int, Node]: Depth below the root and node. Every node is visited once, children that can not be
+                found are skipped.
+        """
+        yield from self._iter_subtrees([root], max_depth, ref_filter, order, set())
+
+    def walk(
+            self,
+            max_depth: int = None,
+            ref_filter: Callable[[Reference], bool] = None,
+            order: str = "bfs",
+            ) -> Iterator[tuple[int, Node]]:
+        """Walks the hierarchy of the whole model, starting from the nodes that have no hierarchical parent in it.
+        Every node of the model is visited once, nodes only reachable through a cycle are visited as roots.
+
+        Args:
+            max_depth (int, optional): Maximum depth below the roots to visit. Defaults to no limit.
+            ref_filter (Callable[[Reference], bool], optional): Only follow hierarchical references it returns True for.
+                Defaults to all hierarchical references.
+            order (str, optional): "bfs" for breadth first or "dfs" for depth first (pre-order). Defaults to "bfs".
+
+        Yields:
+            tuple[int, Node]: Depth below its root and node
+        """
+        _, parents = self.get_hierarchy_index()
+        nodes_by_id = self.nodes_by_id
+        roots = [
+            node for key, node in nodes_by_id.items()
+            if not any(parent_key in nodes_by_id for parent_key, _ in parents.get(key, ()))]
+        visited = set()
+        yield from self._iter_subtrees(roots, max_depth, ref_filter, order, visited)
+        if len(visited) < len(nodes_by_id):
+            remaining = [node for key, node in nodes_by_id.items() if key not in visited]
+            yield from self._iter_subtrees(remaining, max_depth, ref_filter, order, visited)
+
+    def _iter_subtrees(self, roots:list, max_depth:int, ref_filter:Callable, order:str, visited:set):
+        if order not in ("bfs", "dfs"):
+            raise ValueError(f"Unknown traversal order {order!r}, expected 'bfs' or 'dfs'")
+        get_children = self._get_children
+        depth_first = order == "dfs"
+        find_by_nodeid = self.find_by_nodeid
+
+        for root in roots:
+            if not isinstance(root, Node):
+                root = find_by_nodeid(root)
+                if root is None:
+                    continue
+            if root.node_id.key in visited:
+                continue
+            visited.add(root.node_id.key)
+            pending = deque([(0, root)])
+            while pending:
+                depth, node = pending.pop() if depth_first else pending.popleft()
+                yield depth, node
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                found = []
+                for child_id, ref in get_children(node.node_id.key).values():
+                    if child_id.key in visited or (ref_filter is not None and not ref_filter(ref)):
+                        continue
+                    child = find_by_nodeid(child_id)
+                    if child is None:
+                        continue
+                    visited.add(child_id.key)
+                    found.append((depth + 1, child))
+                if depth_first:
+                    found.reverse()
+                pending.extend(found)
+
     def add_alias(self, alias_name: str, nodeid_text: str):
         # nodeid_text can be "i=63", "ns=0;i=63", "ns=1;s=Thing", etc.
         if ";" in nodeid_text:  # expanded form
@@ -420,6 +1153,15 @@ class Namespace:
             # Short form like "i=63", "s=MyId", etc. -> default to ns=0
             nid = NodeId.from_string(f"ns=0;{nodeid_text}")
         self.aliases[alias_name] = nid
+        self.reference_type_table.pop(alias_name, None)
+
+    def set_aliases(self, aliases:dict[str, NodeId]):
+        self.aliases = aliases
+        self.reference_type_table.clear()
+        # Aliases decide which references are hierarchical
+        self._children = None
+        self._parents = None
+        self._child_names = {}
 
     def _get_model_for_ns_index(self, ns_idx: int):
         ns_uri = self.get_namespace_by_index(ns_idx)
@@ -427,41 +1169,154 @@ class Namespace:
 
     def find_by_nodeid(self, node_id: str | NodeId) -> Node|ReferenceNode:
         # Normalize
-        nid = node_id if isinstance(node_id, NodeId) else NodeId.from_string(node_id)
+        nid = node_id if node_id.__class__ is NodeId else NodeId.from_string(node_id)
         ns = nid.ns_index
 
-        # local
-        if ns == 1:
-            return self.nodes_by_id.get(nid.to_string())
+        # local, or the UA namespace when this is the UA model
+        if ns == 1 or (ns == 0 and self.name == "UA"):
+            return self.nodes_by_id.get(nid.key)
 
-        # UA namespace
-        if ns == 0:
-            if self.name == "UA":
-                return self.nodes_by_id.get(nid.to_string())
-            else:
-                target_model = self._get_model_for_ns_index(ns)
-                return target_model.nodes_by_id.get(nid.to_string())
+        # Any other namespace: delegate. The node is local to the target model, so look it up by its local key.
+        # Same as _get_model_for_ns_index, inlined as this is the hot path of every reference lookup
+        target_model = self.namespace_context.namespace_dict_uri[self.namespace_array[ns]]
+        return target_model.nodes_by_id.get(nid.local_key)
 
-        # Any other namespace: delegate
-        target_model = self._get_model_for_ns_index(ns)
-        
-        # Normalize the nid to 1 as the node will be local to the target model
-        normalized_nid = NodeId(
-            ns_index=1,
-            id_type = nid.id_type,
-            id = nid.id
-        )
+    def get_reference_type_node(self, reference_type: str|NodeId) -> Node | None:
+        """Returns the ReferenceType node of a reference type as written in a reference, i.e. an alias or NodeId
 
-        normalized_nid.ns_index = 1
-        return target_model.nodes_by_id.get(normalized_nid.to_string())
+        Args:
+            reference_type (str | NodeId): Alias or NodeId of the reference type
+
+        Returns:
+            Node | None: The ReferenceType node, or None if it can not be found
+        """
+        ref_type_node = self.reference_type_table.get(reference_type)
+        if ref_type_node is None:
+            ref_type_node = self.find_by_nodeid(self.resolve(reference_type))
+            if ref_type_node is not None:
+                self.reference_type_table[reference_type] = ref_type_node
+        return ref_type_node
+
+    def iter_nodes(self, node_class: NodeClass = None) -> Iterator[Node]:
+        """Iterates over the nodes of the model
+
+        Args:
+            node_class (NodeClass, optional): Only nodes of this class. Defaults to None, all nodes.
+
+        Yields:
+            Node: The nodes, in insertion order
+        """
+        for node in self.nodes_by_id.values():
+            if node_class is None or node.node_class == node_class:
+                yield node
 
-        
     def find_by_browse_name(self, browse_name: str) -> list[Node]:
         #TODO Clean this up
         if not browse_name.startswith("1") and not self.name == "UA":
             browse_name = f"1:{browse_name}"
         return self.nodes_by_browse_name.get(browse_name, [])
 
+    def find_by_qualified_name(self, ns_index: int, name: str) -> list[Node]:
+        """Returns the nodes with a browse name, looked up in the model that owns the namespace if it is not this one
+
+        Args:
+            ns_index (int): Namespace index of the browse name, relative to the namespace array of this model
+            name (str): Browse name without namespace index
+
+        Returns:
+            list[Node]: The nodes, empty if there are none
+        """
+        nodes = self.nodes_by_qualified_name.get((ns_index, name))
+        if nodes is None and 0 <= ns_index < len(self.namespace_array):
+            uri = self.namespace_array[ns_index]
+            owner = self.namespace_context.namespace_dict_uri.get(uri)
+            owner_index = owner.get_namespace_index(uri) if owner is not None and owner is not self else None
+            if owner_index is not None:
+                return owner.find_by_qualified_name(owner_index, name)
+        return list(nodes or ())
+
+    def resolve_browse_path(self, path: str|list[str], start: Node|NodeId|str = "i=84") -> Node | None:
+        """Resolves a browse path by following hierarchical references, like Objects/Plant/Line1/Temperature.
+
+        A segment without namespace index matches a child browse name of any namespace, a segment like "2:Line1"
+        only matches that namespace, relative to the namespace array of this model. If several children match, the
+        first one is taken. Children come from this model and, for nodes of another model like the UA Objects folder,
+        from that model as well. The browse names under a parent are indexed on the first path through it and kept
+        up to date as nodes and references are added to this model.
+
+        Args:
+            path (str | list[str]): Path with segments separated by "/", or the segments
+            start (Node | NodeId | str, optional): Node the path starts below. Defaults to the UA Root folder.
+
+        Returns:
+            Node | None: The node at the end of the path, or None if the path does not resolve
+        """
+        segments = path.strip("/").split("/") if isinstance(path, str) else path
+        node = start if isinstance(start, Node) else self.find_by_nodeid(start)
+        self.get_hierarchy_index()
+        child_names = self._child_names
+        for segment in segments:
+            if node is None:
+                return None
+            parent_id = self._to_local_nodeid(node)
+            if parent_id is None:
+                return None
+            names = child_names.get(parent_id.key)
+            if names is None:
+                names = self._build_child_names(node, parent_id)
+            ns_index, name = split_browse_name(segment)
+            node = names.get((ns_index, name) if ":" in segment else name)
+        return node
+
+    def _build_child_names(self, parent: Node, parent_id: NodeId) -> dict[str|tuple[int, str], Node]:
+        names = {}
+        owner = parent.namespace
+        if owner is not self:
+            for child_id, _ in owner._get_children(parent.node_id.key).values():
+                child = owner.find_by_nodeid(child_id)
+                if child is not None:
+                    self._add_child_name(names, child)
+        for child_id, _ in self._get_children(parent_id.key).values():
+            child = self.find_by_nodeid(child_id)
+            if child is not None:
+                self._add_child_name(names, child)
+        self._child_names[parent_id.key] = names
+        return names
+
+    def _add_child_name(self, names: dict, child: Node):
+        ns_index, name = split_browse_name(child.browse_name)
+        owner = child.namespace
+        if owner is not self and ns_index != 0:
+            uri = owner.namespace_array[ns_index] if ns_index < len(owner.namespace_array) else None
+            ns_index = self.get_namespace_index(uri)
+            if ns_index is None:
+                ns_index = -1
+        names.setdefault((ns_index, name), child)
+        names.setdefault(name, child)
+
+    def _to_local_nodeid(self, node: Node) -> NodeId | None:
+        """Returns the NodeId of a node relative to the namespace array of this model, None if the namespace of the
+        node is not in it"""
+        node_id = node.node_id
+        owner = node.namespace
+        if owner is self or node_id.ns_index == 0:
+            return node_id
+        ns_index = self.get_namespace_index(owner.namespace_array[node_id.ns_index])
+        if ns_index is None:
+            return None
+        return NodeId(ns_index, node_id.id_type, node_id.id)
+
+def split_browse_name(browse_name: str) -> tuple[int, str]:
+    """Splits a browse name like "1:Plant" into namespace index and name. Names without index are in namespace 0.
+
+    Returns:
+        tuple[int, str]: Namespace index and name
+    """
+    ns_part, separator, name = browse_name.partition(":")
+    if separator and ns_part.isdigit():
+        return int(ns_part), name
+    return 0, browse_name
+
 class ReferenceNode(Node):
     __slots__ = ("base_type",)
 
@@ -0,0 +1,97 @@
+"""Opening of (optionally compressed) binary inputs and outputs for exports and node dumps.
+"""
+import gzip
+import io
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+# Size of the write buffer of output files
+WRITE_BUFFER_SIZE = 1 << 20
+
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+    ".zstd": "zstd",
+}
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression needs the zstandard package, install ua-nemo[zstd]") from e
+    return zstandard
+
+
+def infer_compression(target) -> str | None:
+    """Returns the compression implied by the suffix of a file path, None for anything else"""
+    if isinstance(target, (str, Path)):
+        return COMPRESSION_SUFFIXES.get(Path(target).suffix.lower())
+    return None
+
+
+@contextmanager
+def open_output(output, compression:str = None, buffered:bool = True):
+    """Opens a binary output for writing
+
+    Args:
+        output: File path, writable binary file object or connected socket. File objects and sockets are not closed.
+        compression (str, optional): "gzip" or "zstd". Defaults to None, which infers it from the suffix of a file path
+            (.gz, .zst) and writes file objects and sockets uncompressed.
+        buffered (bool, optional): Use a large write buffer for file paths. Defaults to True.
+
+    Raises:
+        ValueError: For an unknown compression
+
+    Yields:
+        Writable binary file object
+    """
+    if compression is None:
+        compression = infer_compression(output)
+    with ExitStack() as stack:
+        if isinstance(output, (str, Path)):
+            f = stack.enter_context(open(output, "wb", buffering=WRITE_BUFFER_SIZE if buffered else -1))
+        elif not hasattr(output, "write") and hasattr(output, "makefile"):
+            # Socket
+            f = stack.enter_context(output.makefile("wb"))
+        else:
+            f = output
+
+        if compression == "gzip":
+            f = stack.enter_context(gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6))
+        elif compression == "zstd":
+            f = stack.enter_context(_import_zstandard().ZstdCompressor().stream_writer(f, closefd=False))
+        elif compression is not None:
+            raise ValueError(f"Unsupported compression {compression}")
+        yield f
+
+
+@contextmanager
+def open_input(source, compression:str = None):
+    """Opens a binary input for reading, see open_output
+
+    Args:
+        source: File path or readable binary file object. File objects are not closed.
+        compression (str, optional): "gzip" or "zstd". Defaults to None, which infers it from the suffix of a file path.
+
+    Raises:
+        ValueError: For an unknown compression
+
+    Yields:
+        Readable binary file object
+    """
+    if compression is None:
+        compression = infer_compression(source)
+    with ExitStack() as stack:
+        if isinstance(source, (str, Path)):
+            f = stack.enter_context(open(source, "rb"))
+        else:
+            f = source
+
+        if compression == "gzip":
+            f = stack.enter_context(gzip.GzipFile(fileobj=f, mode="rb"))
+        elif compression == "zstd":
+            f = io.BufferedReader(stack.enter_context(_import_zstandard().ZstdDecompressor().stream_reader(f, closefd=False)))
+        elif compression is not None:
+            raise ValueError(f"Unsupported compression {compression}")
+        yield f
@@ -1,59 +1,127 @@
-from .node_model import Namespace, NodeClass, Node
+import threading
+
+from .node_model import Namespace, NodeClass, Node, NodeId
 
 from .utils import split_node_fields
 
-class TypeInstantiator:
-    #TODO This needs to be cleaned up a bit. Not sure I even like using a class for this.
-    #TODO Rewrite
-    def __init__(self, typelib_model:Namespace, target_model:Namespace):
+CHILD_REFERENCE_TYPES = ("HasComponent", "HasProperty", "HasOrderedComponent")
+
+class TemplateEntry:
+    """A node to create when stamping out an instance template"""
+    __slots__ = ("suffix", "browse_name", "node_class", "attributes", "subnodes", "type_definition", "parent",
+                 "reference_type")
+
+    suffix: str # Appended to the NodeId of the instance root, empty for the root itself
+    browse_name: str
+    node_class: NodeClass
+    attributes: dict
+    subnodes: dict
+    type_definition: NodeId # In the namespace array of the typelibrary, remapped to the target model when stamping
+    parent: int # Index of the parent entry, -1 for the root
+    reference_type: str # Reference from the parent entry to this entry
+
+    def __init__(self, suffix:str, browse_name:str, node_class:NodeClass, attributes:dict, subnodes:dict,
+                 type_definition:NodeId, parent:int=-1, reference_type:str=None):
+        self.suffix = suffix
+        self.browse_name = browse_name
+        self.node_class = node_class
+        self.attributes = attributes
+        self.subnodes = subnodes
+        self.type_definition = type_definition
+        self.parent = parent
+        self.reference_type = reference_type
+
+
+class InstanceTemplate:
+    """The resolved child tree of a type, flattened in creation order (pre-order, the root first)"""
+    __slots__ = ("type_node", "entries")
+
+    type_node: Node
+    entries: list[TemplateEntry]
+
+    def __init__(self, type_node:Node, entries:list[TemplateEntry]):
+        self.type_node = type_node
+        self.entries = entries
+
+
+class TemplateCache:
+    """Compiled instance templates of the types of a typelibrary. Templates do not depend on the target model, so one
+    cache is shared by the instantiators of all target models, also across threads."""
+
+    typelib_model: Namespace
+    # (typename, include_optional) -> compiled template
+    _templates: dict[tuple[str, bool], InstanceTemplate]
+    _lock: threading.Lock
+
+    def __init__(self, typelib_model:Namespace):
         self.typelib_model = typelib_model
-        self.target_model = target_model
-        self.ns_context = target_model.namespace_context
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, typename: str, include_optional: bool = False) -> InstanceTemplate:
+        """Returns the compiled instance template of a type, compiling it on first use
+
+        Args:
+            typename (str): Browse name of the type in the typelibrary
+            include_optional (bool, optional): Include optional children. Defaults to False.
+
+        Returns:
+            InstanceTemplate: The template
+        """
+        template = self._templates.get((typename, include_optional))
+        if template is None:
+            with self._lock:
+                template = self._compile_template(typename, include_optional, set())
+        return template
+
+    def _compile_template(self, typename: str, include_optional: bool, in_progress: set) -> InstanceTemplate:
+        template = self._templates.get((typename, include_optional))
+        if template is not None:
+            return template
+        if typename in in_progress:
+            raise ValueError(f"Type {typename} contains itself, cannot instantiate it")
+        in_progress.add(typename)
 
-    def instantiate(self, typename: str, instance_nodeid: str, instance_browsename: str, include_optional: bool = False, **kwargs) -> str:
         # Find typedefinition
         type_nodes = self.typelib_model.find_by_browse_name(typename)
         if not type_nodes:
             raise ValueError(f"Type {typename} not found in typelibrary")
         type_node = type_nodes[0]
-        
-        remapped_typedef = self.ns_context.remap_nodeid(type_node.node_id, self.typelib_model, self.target_model)
-        raw_attrs = type_node.attributes | kwargs.get("rest", {})
-        if "ParentNodeId" in raw_attrs:
-            del(raw_attrs["ParentNodeId"])
-        attrs, subnodes = split_node_fields(type_node.node_class, raw_attrs)
-        # Instantiate node
-        instance_node = Node(
-            node_id=instance_nodeid,
-            browse_name=instance_browsename,
+
+        attrs, subnodes = split_type_attributes(type_node)
+        entries = [TemplateEntry(
+            suffix="",
+            browse_name=None,
             node_class=self._resolve_nodeclass_from_typenode(type_node),
-            namespace=self.target_model,
             attributes=attrs,
-            subnodes=subnodes
-        )
-        instance_node.add_reference("HasTypeDefinition", remapped_typedef.to_string())
-        self.target_model.add_node(instance_node)
+            subnodes=subnodes,
+            type_definition=type_node.node_id)]
 
-        # Instantiate children
+        # Flatten children
         for ref in type_node.references:
-            if ref.reference_type in ("HasComponent", "HasProperty", "HasOrderedComponent"):
+            if ref.is_forward and ref.reference_type in CHILD_REFERENCE_TYPES:
                 child_type_node = self.typelib_model.find_by_nodeid(ref.target_nodeid)
                 if child_type_node and (self._is_mandatory(child_type_node) or include_optional):
-                    child_instance_id = f"{instance_nodeid}.{child_type_node.browse_name.split(':', 1)[-1]}"
+                    child_suffix = f".{child_type_node.browse_name.split(':', 1)[-1]}"
                     child_instance_browse = child_type_node.browse_name.split(":")[-1]
-                    
-                    # Recursive instantiation of child
-                    self.instantiate(
-                        typename=child_instance_browse,
-                        instance_nodeid=child_instance_id,
-                        instance_browsename=child_instance_browse,
-                        include_optional=include_optional
-                    )
-
-                    # Add the reference from parent to child
-                    instance_node.add_reference(ref.reference_type, child_instance_id)
+                    child_template = self._compile_template(child_instance_browse, include_optional, in_progress)
 
-        return instance_node.node_id
+                    offset = len(entries)
+                    for idx, child_entry in enumerate(child_template.entries):
+                        entries.append(TemplateEntry(
+                            suffix=child_suffix + child_entry.suffix,
+                            browse_name=child_instance_browse if idx == 0 else child_entry.browse_name,
+                            node_class=child_entry.node_class,
+                            attributes=child_entry.attributes,
+                            subnodes=child_entry.subnodes,
+                            type_definition=child_entry.type_definition,
+                            parent=0 if idx == 0 else child_entry.parent + offset,
+                            reference_type=ref.reference_type if idx == 0 else child_entry.reference_type))
+
+        in_progress.discard(typename)
+        template = InstanceTemplate(type_node, entries)
+        self._templates[(typename, include_optional)] = template
+        return template
 
     def _is_mandatory(self, node:Node) -> bool:
         for ref in node.references:
@@ -70,4 +138,90 @@ class TypeInstantiator:
         elif type_node.node_class in NodeClass:
             return type_node.node_class
         else:
-            raise ValueError(f"Cannot instantiate from unsupported type class {type_node.node_class}")
\ No newline at end of file
+            raise ValueError(f"Cannot instantiate from unsupported type class {type_node.node_class}")
+
+
+class TypeInstantiator:
+    """Instantiates the types of a typelibrary in a target model. The compiled templates live in a TemplateCache,
+    which can be shared by the instantiators of other target models."""
+    #TODO This needs to be cleaned up a bit. Not sure I even like using a class for this.
+    def __init__(self, typelib_model:Namespace, target_model:Namespace, templates:TemplateCache = None):
+        self.typelib_model = typelib_model
+        self.target_model = target_model
+        self.ns_context = target_model.namespace_context
+        if templates is None:
+            templates = TemplateCache(typelib_model)
+        self.templates = templates
+        # Type definitions of the templates are remapped from the typelibrary to the target model
+        self._translation = self.ns_context.get_translation(typelib_model, target_model)
+
+    def instantiate(self, typename: str, instance_nodeid: str, instance_browsename: str, include_optional: bool = False, **kwargs) -> str:
+        instance_node = self.create_instance(typename, instance_nodeid, instance_browsename, include_optional, kwargs.get("rest"))
+        return instance_node.node_id
+
+    def create_instance(self, typename: str, instance_nodeid: str|NodeId, instance_browsename: str, include_optional: bool = False, rest: dict = None) -> Node:
+        """Instantiates a type in the target model
+
+        Args:
+            typename (str): Browse name of the type in the typelibrary
+            instance_nodeid (str | NodeId): NodeId of the instance, children get it as prefix of their NodeId
+            instance_browsename (str): Browse name of the instance
+            include_optional (bool, optional): Include optional children. Defaults to False.
+            rest (dict, optional): Attributes and subnodes that override those of the type on the instance root
+
+        Returns:
+            Node: The instance root
+        """
+        template = self.get_template(typename, include_optional)
+        return self.stamp(template, instance_nodeid, instance_browsename, rest)
+
+    def get_template(self, typename: str, include_optional: bool = False) -> InstanceTemplate:
+        """See TemplateCache.get_template"""
+        return self.templates.get_template(typename, include_optional)
+
+    def stamp(self, template: InstanceTemplate, instance_nodeid: str|NodeId, instance_browsename: str, rest: dict = None) -> Node:
+        """Creates the nodes of a template in the target model
+
+        Returns:
+            Node: The instance root
+        """
+        target_model = self.target_model
+        remap = self._translation.remap
+        nodes = []
+        for entry in template.entries:
+            if entry.parent < 0:
+                node_id = instance_nodeid
+                browse_name = instance_browsename
+                if rest:
+                    attrs, subnodes = split_type_attributes(template.type_node, rest)
+                else:
+                    attrs, subnodes = entry.attributes, entry.subnodes
+            else:
+                node_id = f"{instance_nodeid}{entry.suffix}"
+                browse_name = entry.browse_name
+                attrs, subnodes = entry.attributes, entry.subnodes
+
+            node = Node(
+                node_id=node_id,
+                browse_name=browse_name,
+                node_class=entry.node_class,
+                namespace=target_model,
+                attributes=attrs,
+                subnodes=subnodes,
+                # The entry fields are copied by the node if it changes them
+                shared=attrs is entry.attributes,
+            )
+            node.add_reference("HasTypeDefinition", remap(entry.type_definition))
+            target_model.add_node(node)
+            if entry.parent >= 0:
+                # Add the reference from parent to child
+                nodes[entry.parent].add_reference(entry.reference_type, node.node_id)
+            nodes.append(node)
+        return nodes[0]
+
+
+def split_type_attributes(type_node:Node, rest:dict = None) -> tuple[dict, dict]:
+    raw_attrs = type_node.attributes_view | (rest or {})
+    if "ParentNodeId" in raw_attrs:
+        del(raw_attrs["ParentNodeId"])
+    return split_node_fields(type_node.node_class, raw_attrs)
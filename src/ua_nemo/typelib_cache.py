@@ -0,0 +1,114 @@
+"""Persistent on-disk cache of parsed typelibraries, so warm loads can skip XML parsing entirely.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from .node_model import Namespace
+
+# Bump whenever the pickled layout of Namespace/Node/Reference changes
+CACHE_VERSION = 7
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "ua_nemo"
+# Environment variable overriding DEFAULT_CACHE_DIR, setting it also turns the cache on by default
+CACHE_DIR_ENV = "UA_NEMO_CACHE_DIR"
+
+
+class TypeLibraryCache:
+    """Stores parsed typelibrary namespaces as pickles, keyed on path, size, mtime and content hash of the source xml.
+
+    A cache entry consists of a small header followed by the pickled namespace. The header is validated before
+    the namespace is unpickled, so stale entries are cheap to reject and are simply rebuilt on the next load.
+    """
+
+    cache_dir: Path
+
+    def __init__(self, cache_dir:Path|str = None):
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        self.cache_dir = Path(cache_dir)
+
+    def entry_path(self, xml_path:Path) -> Path:
+        path_key = hashlib.sha256(str(Path(xml_path).resolve()).encode("utf-8")).hexdigest()[:32]
+        return self.cache_dir / f"{path_key}.pickle"
+
+    @staticmethod
+    def fingerprint(xml_path:Path) -> dict:
+        """Returns the values a cache entry is keyed on
+
+        Args:
+            xml_path (Path): Path to typelibrary xml file
+
+        Returns:
+            dict: Cache version, resolved path, size, mtime and sha256 of the file contents
+        """
+        xml_path = Path(xml_path).resolve()
+        stat = xml_path.stat()
+        digest = hashlib.sha256()
+        with open(xml_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return {
+            "version": CACHE_VERSION,
+            "path": str(xml_path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": digest.hexdigest(),
+        }
+
+    def load(self, xml_path:Path) -> Namespace | None:
+        """Loads the cached namespace for a typelibrary file
+
+        Args:
+            xml_path (Path): Path to typelibrary xml file
+
+        Returns:
+            Namespace | None: The cached namespace, or None if there is no valid entry for the current file contents.
+                The namespace is not registered in any namespace context.
+        """
+        entry = self.entry_path(xml_path)
+        if not entry.is_file():
+            return None
+        try:
+            with open(entry, "rb") as f:
+                header = pickle.load(f)
+                if header != self.fingerprint(xml_path):
+                    return None
+                return pickle.load(f)
+        except Exception as e:
+            #TODO Make a proper warning
+            print(f"Discarding unreadable typelibrary cache entry {entry}: {e}")
+            return None
+
+    def store(self, xml_path:Path, model:Namespace) -> None:
+        """Writes a parsed namespace to the cache. Failing to write the cache never fails the load.
+
+        Args:
+            xml_path (Path): Path to the typelibrary xml file the namespace was parsed from
+            model (Namespace): Parsed and classified namespace
+        """
+        entry = self.entry_path(xml_path)
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            header = self.fingerprint(xml_path)
+            # Write to a temporary file first so concurrent loaders never see a partially written entry
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp", delete=False) as f:
+                tmp_path = Path(f.name)
+                pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry)
+        except Exception as e:
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+            #TODO Make a proper warning
+            print(f"Could not write typelibrary cache entry {entry}: {e}")
+
+    def clear(self) -> None:
+        """Removes all cache entries"""
+        if not self.cache_dir.is_dir():
+            return
+        for entry in self.cache_dir.glob("*.pickle"):
+            entry.unlink(missing_ok=True)
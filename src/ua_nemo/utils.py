@@ -1,3 +1,5 @@
+from sys import intern
+
 from .node_definitions import NodeClass, get_expected_attributes, get_expected_subnodes
 
 def normalize_bool(input_string:str) -> bool:
@@ -7,7 +9,7 @@ def normalize_bool(input_string:str) -> bool:
     elif not input_string:
         return True
     bool_str = input_string.upper()
-    if bool_str in ["TRUE, FALSE"]:
+    if bool_str in ["TRUE", "FALSE"]:
         return bool_str == "TRUE"
     raise ValueError("Invalid input", input_string)
 
@@ -38,6 +40,8 @@ def split_node_fields(node_class: NodeClass, raw: dict) -> tuple[dict, dict]:
     subs = {}
     if raw is not None and len(raw) > 0:
         for k, v in raw.items():
+            # Keys repeat across all nodes, share one string per key
+            k = intern(k)
             if k in expected_attrs:
                 attrs[k] = v
             elif k in expected_subs:
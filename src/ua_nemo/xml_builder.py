@@ -1,132 +1,260 @@
-from pathlib import Path
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from lxml import etree as ET
 from .node_model import Namespace, Node
 from .node_definitions import NODE_CLASSES
+from .fragment_cache import NodeFragmentCache
+from .streams import open_output
 from .utils import bool_to_str
 
-def dump_model_to_xml(model:Namespace, file_path=None):
-    #TODO Rewrite to use LXML. This also barely supports literally anything.
-    NS_UA = "http://opcfoundation.org/UA/2011/03/UANodeSet.xsd"
-    nsmap = {"ua": NS_UA}
-    ET.register_namespace('', NS_UA)
-
-    root = ET.Element("UANodeSet", xmlns=NS_UA)
-
-    # NamespaceUris
-    ns_uris = ET.SubElement(root, "NamespaceUris")
-    for uri in model.namespace_array:
-        if uri == "http://opcfoundation.org/UA/":
-            continue
-        uri_elem = ET.SubElement(ns_uris, "Uri")
-        uri_elem.text = uri
-
-    # Aliases
-    aliases = ET.SubElement(root, "Aliases")
-    for alias in model.aliases:
-        alias_elem = ET.SubElement(aliases, "Alias")
-        alias_elem.attrib["Alias"] = alias
-        alias_elem.text = model.aliases[alias].to_string()
-
-    #TODO add models
-
-    # Nodes
-    for node in model.nodes_by_id.values():
-        #TODO Make this more memory efficient. Maybe don't create the full model in memory before dumping?
-        tag = NODE_CLASSES[node.node_class]
-        elem = ET.SubElement(root, tag)
-
-        # Core attributes (NodeId, BrowseName, etc.)
-        elem.attrib["NodeId"] = node.node_id.to_string()
-        elem.attrib["BrowseName"] = node.attributes.get("BrowseName", node.browse_name)
-
-        for attr_key, attr_val in node.attributes.items():
-            if attr_key not in ("NodeId", "BrowseName"):
-                if type(attr_val, bool):
-                    attr_val = bool_to_str(attr_val)
-                elem.attrib[attr_key] = str(attr_val)
-
-        # Subnodes (DisplayName, Description, etc.)
-        for sub_key, sub_val in node.subnodes.items():
-            child = ET.SubElement(elem, sub_key)
-            child.text = str(sub_val)
-
-        # References
-        if node.references:
-            refs_elem = ET.SubElement(elem, "References")
-            for ref in node.references:
-                ref_elem = ET.SubElement(refs_elem, "Reference")
-                ref_elem.attrib["ReferenceType"] = ref.reference_type
-                if not ref.is_forward:
-                    ref_elem.attrib["IsForward"] = "false"
-                ref_elem.text = ref.target_nodeid.to_string()
-
-    # Write output
-    xml_str = ET.tostring(root, encoding="utf-8")
-    pretty = minidom.parseString(xml_str).toprettyxml(indent="  ")
+NS_UA = "http://opcfoundation.org/UA/2011/03/UANodeSet.xsd"
+UA_URI = "http://opcfoundation.org/UA/"
 
-    if file_path:
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(pretty)
-    return pretty
+# Number of nodes rendered per task when exporting with several processes
+DEFAULT_SHARD_SIZE = 5000
 
-from lxml import etree as ET
+# Nodes of the export a worker process renders, set by the pool initializer in the worker only
+_worker_nodes: list[Node] = None
 
-def dump_model_to_xml_streaming(model:Namespace, file_path:Path):
-    NS_UA = "http://opcfoundation.org/UA/2011/03/UANodeSet.xsd"
-    nsmap = {None: NS_UA}
 
+def dump_model_to_xml(model:Namespace, file_path=None, indent:str = "  ", compact:bool = False) -> str | None:
+    """Exports a model as a UANodeSet xml document
+
+    Args:
+        model (Namespace): Model to export
+        file_path (optional): Output file. If not given, the document is returned as string.
+        indent (str, optional): Indentation per nesting level. Defaults to two spaces.
+        compact (bool, optional): Write without any whitespace between elements. Defaults to False.
+
+    Returns:
+        str | None: The document if no file_path is given
+    """
+    if file_path:
+        write_model_xml(model, file_path, indent=indent, compact=compact)
+        return None
+    buffer = BytesIO()
+    write_model_xml(model, buffer, indent=indent, compact=compact)
+    return buffer.getvalue().decode("utf-8")
+
+
+def dump_model_to_xml_streaming(model:Namespace, file_path, indent:str = None, compact:bool = False,
+                                compression:str = None):
+    """Exports a model as a UANodeSet xml file, one node at a time. See write_model_xml.
+    """
     print("Writing to XML")
+    write_model_xml(model, file_path, indent=indent, compact=compact, compression=compression)
 
-    with ET.xmlfile(file_path, encoding="utf-8") as xf:
-        xf.write_declaration()
 
-        with xf.element("UANodeSet", nsmap=nsmap):
+def write_model_xml(model:Namespace, output, indent:str = None, compact:bool = False, buffered:bool = True,
+                    max_workers:int = 1, shard_size:int = DEFAULT_SHARD_SIZE, fragment_cache:NodeFragmentCache = None,
+                    delta_output = None, compression:str = None):
+    """Streams a model as a UANodeSet xml document. Only the element of the node being written is held in memory.
+
+    With max_workers > 1, the nodes are split into shards of shard_size nodes that are rendered to bytes in a process
+    pool and written in the order of nodes_by_id, so the output is identical to a single process export. At most two
+    shards per worker are in flight at a time. This needs the fork start method, on platforms without it the export
+    runs in a single process.
+
+    With a fragment_cache, only the nodes that changed since the cache was last refreshed are rendered (in this
+    process), all other nodes are written from their cached fragments. The cache is updated but not saved.
 
+    Args:
+        model (Namespace): Model to export
+        output: File path, writable binary file object or connected socket, see streams.open_output
+        indent (str, optional): Indentation per nesting level. Defaults to None, which puts every element on its own
+            line without indentation.
+        compact (bool, optional): Write without any whitespace between elements, overrides indent. Defaults to False.
+        buffered (bool, optional): Buffer the output, only flushing it in large blocks. Defaults to True.
+        max_workers (int, optional): Number of rendering processes, None for the number of CPUs. Defaults to 1.
+        shard_size (int, optional): Nodes per rendering task. Defaults to DEFAULT_SHARD_SIZE.
+        fragment_cache (NodeFragmentCache, optional): Rendered fragments to reuse. Defaults to None.
+        delta_output (optional): File path or writable binary file object for a second document with only the nodes
+            that were added or changed since the fragment cache was last refreshed. Needs a fragment_cache. Nodes removed
+            from the model cannot be expressed in a nodeset and are left out. Defaults to None.
+        compression (str, optional): "gzip" or "zstd" compression of the output(s). Defaults to None, which infers it
+            from the suffix of file paths (.gz, .zst).
+
+    Raises:
+        ValueError: If delta_output is given without a fragment_cache
+    """
+    if compact:
+        newlines = ("",) * 4
+    else:
+        newlines = tuple("\n" + (indent or "") * depth for depth in range(4))
+
+    if fragment_cache is not None:
+        fragment_cache.set_format(newlines)
+        changed = fragment_cache.refresh(model, lambda node: ET.tostring(node_to_element(node, newlines), encoding="utf-8"))
+        _write_output(model, output, newlines, buffered, compression,
+                      lambda: _iter_cached_fragments(fragment_cache, model.nodes_by_id, newlines))
+        if delta_output is not None:
+            changed = set(changed)
+            changed_keys = [key for key in model.nodes_by_id if key in changed]
+            _write_output(model, delta_output, newlines, buffered, compression,
+                          lambda: _iter_cached_fragments(fragment_cache, changed_keys, newlines))
+        return
+    if delta_output is not None:
+        raise ValueError("A delta export needs a fragment cache to compare against")
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, -(-len(model.nodes_by_id) // shard_size))
+    if max_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+        node_chunks = lambda: _iter_rendered_shards(model, newlines, max_workers, shard_size)
+    else:
+        node_chunks = None
+    _write_output(model, output, newlines, buffered, compression, node_chunks)
+
+
+def _write_output(model:Namespace, output, newlines:tuple[str, ...], buffered:bool, compression:str, node_chunks):
+    with open_output(output, compression, buffered) as f:
+        _write_document(model, f, newlines, buffered, node_chunks)
+
+
+def _write_document(model:Namespace, f, newlines:tuple[str, ...], buffered:bool, node_chunks):
+    with ET.xmlfile(f, encoding="utf-8", buffered=buffered) as xf:
+        # xmlfile does not accept empty strings, so whitespace is skipped entirely in compact mode
+        space = xf.write if newlines[0] else _skip
+        xf.write_declaration()
+
+        with xf.element("UANodeSet", nsmap={None: NS_UA}):
             # NamespaceUris
+            space(newlines[1])
             with xf.element("NamespaceUris"):
-                for ext_model in model.namespace_array:
-                    if ext_model != "http://opcfoundation.org/UA/":
+                for uri in model.namespace_array:
+                    if uri != UA_URI:
+                        space(newlines[2])
                         with xf.element("Uri"):
-                            xf.write(ext_model)
-                        xf.write("\n")
-                xf.write("\n")
+                            xf.write(uri)
+                space(newlines[1])
 
             # Aliases
+            space(newlines[1])
             with xf.element("Aliases"):
                 for alias, nodeid in model.aliases.items():
+                    space(newlines[2])
                     with xf.element("Alias", Alias=alias):
                         xf.write(nodeid.to_string())
-                    xf.write("\n")
-                xf.write("\n")
+                space(newlines[1])
+
+            #TODO add models
 
             # Nodes
-            for node in model.nodes_by_id.values():
-                tag = NODE_CLASSES[node.node_class]
-                node_attrs = {
-                    "NodeId": node.node_id.to_string(),
-                    "BrowseName": node.attributes.get("BrowseName", node.browse_name),
-                }
-                for key, val in node.attributes.items():
-                    if key not in ("NodeId", "BrowseName"):
-                        if isinstance(val, bool) or str(val).lower() in ["true", "false"]:
-                            val = str(val).lower()
-                        node_attrs[key] = str(val)
-
-                with xf.element(tag, node_attrs):
-                    for sub_key, sub_val in node.subnodes.items():
-                        with xf.element(sub_key):
-                            xf.write(str(sub_val))
-                        xf.write("\n")
-
-                    if node.references:
-                        with xf.element("References"):
-                            for ref in node.references:
-                                ref_attrs = {"ReferenceType": ref.reference_type}
-                                if not ref.is_forward:
-                                    ref_attrs["IsForward"] = "false"
-                                with xf.element("Reference", ref_attrs):
-                                    xf.write(ref.target_nodeid.to_string())
-                                xf.write("\n")
-                        xf.write("\n")
-                xf.write("\n")
\ No newline at end of file
+            if node_chunks is not None:
+                # Pre-rendered nodes bypass the xml writer, so flush what it has buffered first
+                xf.flush()
+                for chunk in node_chunks():
+                    f.write(chunk)
+            else:
+                for node in model.nodes_by_id.values():
+                    space(newlines[1])
+                    xf.write(node_to_element(node, newlines))
+            space(newlines[0])
+
+
+def _iter_cached_fragments(fragment_cache:NodeFragmentCache, keys, newlines:tuple[str, ...], block_size:int = 1000):
+    separator = newlines[1].encode("utf-8")
+    block = []
+    for key in keys:
+        block.append(fragment_cache.fragment(key))
+        if len(block) >= block_size:
+            yield separator + separator.join(block)
+            block = []
+    if block:
+        yield separator + separator.join(block)
+
+
+def _iter_rendered_shards(model:Namespace, newlines:tuple[str, ...], max_workers:int, shard_size:int):
+    nodes = list(model.nodes_by_id.values())
+    # Forked workers inherit the list through the initializer arguments, each pool gets the nodes of its own export
+    with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("fork"),
+                             initializer=_init_render_worker, initargs=(nodes,)) as pool:
+        in_flight = deque()
+        for start in range(0, len(nodes), shard_size):
+            in_flight.append(pool.submit(_render_shard, start, start + shard_size, newlines))
+            if len(in_flight) >= 2 * max_workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def _init_render_worker(nodes:list[Node]):
+    global _worker_nodes
+    _worker_nodes = nodes
+
+
+def _render_shard(start:int, stop:int, newlines:tuple[str, ...]) -> bytes:
+    separator = newlines[1].encode("utf-8")
+    return b"".join(
+        separator + ET.tostring(node_to_element(node, newlines), encoding="utf-8")
+        for node in _worker_nodes[start:stop])
+
+
+def _skip(_):
+    pass
+
+
+def node_to_element(node:Node, newlines:tuple[str, ...] = None) -> ET._Element:
+    """Builds the xml element of a single node
+
+    Args:
+        node (Node): Node to convert
+        newlines (tuple[str, ...], optional): Whitespace to put before elements of nesting level 0-3, as set up by
+            write_model_xml. Defaults to no whitespace.
+
+    Returns:
+        ET._Element: UANode element
+    """
+    if newlines is None:
+        newlines = ("",) * 4
+    elem = ET.Element(NODE_CLASSES[node.node_class])
+
+    # Core attributes (NodeId, BrowseName, etc.)
+    elem.set("NodeId", node.node_id.to_string())
+    attributes = node.attributes_view
+    elem.set("BrowseName", str(attributes.get("BrowseName", node.browse_name)))
+    for key, val in attributes.items():
+        if key not in ("NodeId", "BrowseName"):
+            elem.set(key, _attribute_to_str(val))
+
+    # Subnodes (DisplayName, Description, etc.)
+    last = None
+    subnodes = node.subnodes_view
+    if "DisplayName" not in subnodes:
+        last = ET.SubElement(elem, "DisplayName")
+        last.text = node.browse_name
+        last.tail = newlines[2]
+    for sub_key, sub_val in subnodes.items():
+        last = ET.SubElement(elem, sub_key)
+        last.text = str(sub_val)
+        last.tail = newlines[2]
+
+    # References
+    if node.references:
+        refs_elem = ET.SubElement(elem, "References")
+        refs_elem.text = newlines[3]
+        for ref in node.references:
+            ref_elem = ET.SubElement(refs_elem, "Reference", ReferenceType=ref.reference_type)
+            if not ref.is_forward:
+                ref_elem.set("IsForward", "false")
+            ref_elem.text = ref.target_nodeid.to_string()
+            ref_elem.tail = newlines[3]
+        ref_elem.tail = newlines[2]
+        last = refs_elem
+
+    if last is not None:
+        elem.text = newlines[2]
+        last.tail = newlines[1]
+    return elem
+
+
+def _attribute_to_str(val) -> str:
+    if isinstance(val, bool):
+        return bool_to_str(val)
+    val = str(val)
+    if val.lower() in ("true", "false"):
+        return val.lower()
+    return val
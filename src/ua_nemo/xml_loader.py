@@ -1,9 +1,13 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-import xml.etree.ElementTree as ET
-from .node_model import Node, Namespace, NodeId
+from lxml import etree as ET
+from .node_model import Node, Namespace, NamespaceContext, NodeId
 
-from .node_definitions import NodeClass, resolve_node_class
+from .lazy_namespace import LazyNamespace, NodeElementIndex
+from .node_definitions import LOADED_NODE_TAGS, NodeClass, resolve_node_class
+from .typelib_cache import CACHE_DIR_ENV, TypeLibraryCache
 from .utils import split_node_fields
 
 UA_NODESET = Path(__file__).resolve().parent / "typelibraries" / "ua_nodeset"
@@ -11,161 +15,476 @@ UA_NODESET = Path(__file__).resolve().parent / "typelibraries" / "ua_nodeset"
 HIERARCHICAL_UA_REFS = ["i=33"]
 NON_HIERARCHICAL_USA_REFS = ["i=32"]
 HAS_SUBTYPE = "i=45"
+HIERARCHICAL_UA_KEYS = {NodeId.from_string(nodeid).key for nodeid in HIERARCHICAL_UA_REFS}
+HAS_SUBTYPE_KEY = NodeId.from_string(HAS_SUBTYPE).key
+UA_URI = "http://opcfoundation.org/UA/"
+UA_NS = "http://opcfoundation.org/UA/2011/03/UANodeSet.xsd"
+
+# Qualified tag names, so the parse loop compares tags without splitting them
+UA_TAG_PREFIX = f"{{{UA_NS}}}"
+UA_TAG_PREFIX_LEN = len(UA_TAG_PREFIX)
+URI_TAG = f"{UA_TAG_PREFIX}Uri"
+MODEL_TAG = f"{UA_TAG_PREFIX}Model"
+REQUIRED_MODEL_TAG = f"{UA_TAG_PREFIX}RequiredModel"
+ALIAS_TAG = f"{UA_TAG_PREFIX}Alias"
+REFERENCES_TAG = f"{UA_TAG_PREFIX}References"
+REFERENCE_TAG = f"{UA_TAG_PREFIX}Reference"
+NODE_TAG_CLASSES = {f"{UA_TAG_PREFIX}{tag}": resolve_node_class(tag) for tag in LOADED_NODE_TAGS}
+# Elements the parse loop gets end events for
+PARSED_TAGS = [URI_TAG, MODEL_TAG, ALIAS_TAG, *NODE_TAG_CLASSES]
+
+
+def read_model_header(xml_path:Path) -> dict:
+    """Reads the NamespaceUris and Models header of a typelibrary file, without parsing any nodes
+
+    Args:
+        xml_path (Path): Path to typelibrary xml file
+
+    Returns:
+        dict: Model uri, namespace uris and uris of the required models
+    """
+    header = {"model_uri": None, "namespace_uris": [], "required_models": []}
+    stop_tags = {f"{{{UA_NS}}}{tag}" for tag in ("Aliases", "UAObjectType", "UAVariableType", "UAReferenceType",
+                                                 "UADataType", "UAObject", "UAVariable", "UAMethod", "UAView")}
+    with open(xml_path, "rb") as f:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if elem.tag in stop_tags:
+                break
+            if event != "end":
+                continue
+            tag = TypeLibraryXMLLoader.get_clean_tag(elem.tag)
+            if tag == "Uri":
+                header["namespace_uris"].append(elem.text)
+            elif tag == "RequiredModel":
+                header["required_models"].append(elem.attrib.get("ModelUri"))
+            elif tag == "Model" and header["model_uri"] is None:
+                header["model_uri"] = elem.attrib["ModelUri"]
+            elif tag == "Models":
+                break
+    if header["model_uri"] is None and header["namespace_uris"]:
+        # Same fallback as the loader, the first available uri names the model
+        header["model_uri"] = header["namespace_uris"][0]
+    return header
+
+
+def _parse_typelibrary(xml_path:Path, namespace_uris:list[str]) -> Namespace:
+    """Parses a typelibrary file in a worker process. The models it requires are only loaded in the parent process,
+    so classification and registration are left to the caller.
+
+    Args:
+        xml_path (Path): Path to typelibrary xml file
+        namespace_uris (list[str]): Uris of the models to register in the context of the worker before parsing, as
+            empty placeholders. The UA uri has to be among them, so it gets index 0 in the namespace array of the
+            parsed model.
+
+    Returns:
+        Namespace: The parsed model, with a context local to this call
+    """
+    context = NamespaceContext()
+    for uri in namespace_uris:
+        placeholder = Namespace(context)
+        placeholder.uri = uri
+    loader = TypeLibraryXMLLoader(use_cache=False, namespace_context=context)
+    return loader.parse(xml_path, check_required_models=False)
+
+
 class TypeLibraryXMLLoader:
 
     refs_to_classify:list[Node]
+    # id(node) -> (node, base type) of every reference type classified by this loader, including those whose base
+    # type is None, which node.base_type cannot tell apart from unclassified types
+    _classified:dict[int, tuple[Node, NodeId|None]]
+    cache: TypeLibraryCache | None
+    lazy: bool
+    namespace_context: NamespaceContext
 
-    def load(self, xml_path:Path) -> tuple[bool, dict|Path]:
-        model = Namespace()
+    def __init__(self, use_cache:bool=None, cache_dir:Path=None, lazy:bool=False,
+                 namespace_context:NamespaceContext=None):
+        """
+        Args:
+            use_cache (bool, optional): Reuse parsed typelibraries from the on-disk cache. The cache unpickles its
+                entries, so only point it at a directory you trust. Defaults to None, which uses the cache only if
+                cache_dir or $UA_NEMO_CACHE_DIR is set.
+            cache_dir (Path, optional): Cache directory. Defaults to $UA_NEMO_CACHE_DIR or ~/.cache/ua_nemo.
+            lazy (bool, optional): Only index the node elements of each file and parse nodes when they are first
+                looked up, see LazyNamespace. Lazy loads do not use the cache. Defaults to False.
+            namespace_context (NamespaceContext, optional): Context to load the typelibraries into.
+                Defaults to the default namespace context.
+        """
         self.refs_to_classify = []
+        self._classified = {}
+        if use_cache is None:
+            use_cache = cache_dir is not None or CACHE_DIR_ENV in os.environ
+        self.cache = TypeLibraryCache(cache_dir) if use_cache and not lazy else None
+        self.lazy = lazy
+        if namespace_context is None:
+            namespace_context = Namespace.get_default_namespace_context()
+        self.namespace_context = namespace_context
 
-        ns = {'ua': 'http://opcfoundation.org/UA/2011/03/UANodeSet.xsd'}
-        context = ET.iterparse(xml_path, events=("start", "end"))
-        event, root = next(context)
-        models_elem = root.find("ua:Models", ns)
-        if models_elem is not None:
-            model_elem = models_elem.findall("ua:Model", ns)
-            if len(model_elem) == 0:
-                pass
-            else: 
-                model_elem = model_elem[0]
-                model.uri = model_elem.attrib["ModelUri"]
-                model.ns_info.update(model_elem.attrib)
-                model.ns_info['required_models'] = []
-
-                required_models = model_elem.findall("ua:RequiredModel", ns)
-                for required_model in required_models:
-                    model.ns_info['required_models'].append(required_model.attrib)
-                    if not required_model.attrib.get("ModelUri") in model.namespace_context.namespace_dict_uri:
-                        # Required model has not been loaded yet, defer to later time
-                        del model
-                        return False, xml_path
-                
-        aliases_elem = root.find("ua:Aliases", ns)
-        log_interval = 10000
-        counter = 0
-        if aliases_elem is not None:
-            for alias_elem in aliases_elem.findall("ua:Alias", ns):
-                model.add_alias(
-                    alias_name = alias_elem.attrib.get("Alias"),
-                    nodeid_text = alias_elem.text)
-        
-        for event, elem in context:
-            if counter % log_interval == 0:
-                print(f"\rProcessing xml elements:\t {counter}", end="", flush=True)
-            counter += 1
-            if event == "end":
-                tag = self.get_clean_tag(elem.tag)
-                if not model.uri:
-                    if tag == "Model":
-                        model.uri = elem.attrib["ModelUri"]
-                    elif tag == "Uri": # If model name is not properly defined, extract from first available uri
-                        model.uri = elem.text
-                if tag == "Uri":
-                    model.add_namespace(elem.text)
-                elif tag in ("UAObjectType", "UAVariableType", "UAReferenceType", "UADataType", "UAObject", "UAVariable"):
-                    if tag == "UAReferenceType":
-                        node = self.parse_xml_node(elem, model, ns)
-                        self.refs_to_classify.append(node)
-                    else:
-                        node = self.parse_xml_node(elem, model, ns)
-                    model.add_node(node)
-                    elem.clear()
+    def load(self, xml_path:Path) -> tuple[bool, dict|Path]:
+        if self.lazy:
+            return self._load_lazy(xml_path)
+        if self.cache is not None:
+            cached_model = self.cache.load(xml_path)
+            if cached_model is not None:
+                return self._register_cached_model(cached_model, xml_path)
+        return self._load_uncached(xml_path)
+
+    def _load_uncached(self, xml_path:Path) -> tuple[bool, dict|Path]:
+        model = self.parse(xml_path)
+        if model is None:
+            return False, xml_path
 
         self.classify_references()
-        print("\r\033[K", end='', flush=True)  # Clear the line
-        print(f"Finished processing {counter} xml elements")
+        model.namespace_context.build_reference_type_table(model)
+        if self.cache is not None:
+            self.cache.store(xml_path, model)
         typelib_dict = {model.name: model}
 
         return True, typelib_dict
+
+    def _load_lazy(self, xml_path:Path) -> tuple[bool, dict|Path]:
+        model = self.parse_lazy(xml_path)
+        if model is None:
+            return False, xml_path
+
+        # Reference types are few and needed to classify references, so they are parsed right away
+        self.refs_to_classify = list(model.iter_nodes(NodeClass.ReferenceType))
+        self.classify_references()
+        model.namespace_context.build_reference_type_table(model)
+        return True, {model.name: model}
+
+    def parse_lazy(self, xml_path:Path, check_required_models:bool=True) -> LazyNamespace | None:
+        """Indexes a typelibrary file into a lazy namespace. Only the header (namespace uris, models and aliases) is
+        parsed, nodes are parsed on first lookup.
+
+        Args:
+            xml_path (Path): Path to typelibrary xml file
+            check_required_models (bool, optional): Abort if a RequiredModel is not loaded yet. Defaults to True.
+
+        Returns:
+            LazyNamespace | None: The namespace, or None if the load has to be deferred
+        """
+        ns = {'ua': UA_NS}
+        index = NodeElementIndex(xml_path)
+        header = index.read_header()
+        model = LazyNamespace(index, self.parse_xml_node, self.namespace_context)
+
+        uris = [uri_elem.text for uri_elem in header.iterfind("ua:NamespaceUris/ua:Uri", ns)]
+        if not self._apply_header(model, uris, header.find("ua:Models/ua:Model", ns), check_required_models):
+            return None
+
+        for alias_elem in header.findall("ua:Aliases/ua:Alias", ns):
+            model.add_alias(alias_name=alias_elem.attrib.get("Alias"), nodeid_text=alias_elem.text)
+        return model
+
+    def parse(self, xml_path:Path, check_required_models:bool=True) -> Namespace | None:
+        """Parses a typelibrary file into a namespace. Reference types are collected in refs_to_classify,
+        but not classified, as that may require reference types from the required models.
+
+        Args:
+            xml_path (Path): Path to typelibrary xml file
+            check_required_models (bool, optional): Abort if a RequiredModel is not loaded yet. Defaults to True.
+
+        Returns:
+            Namespace | None: The parsed namespace, or None if the load has to be deferred
+        """
+        model = Namespace(self.namespace_context)
+        self.refs_to_classify = []
+
+        # The header (NamespaceUris, Models) is applied once the first element after it is reached
+        uris = []
+        model_elem = None
+        header_done = False
+        counter = 0
+
+        context = ET.iterparse(str(xml_path), events=("end",), tag=PARSED_TAGS, remove_comments=True)
+        for _, elem in context:
+            tag = elem.tag
+            node_class = NODE_TAG_CLASSES.get(tag)
+            if node_class is None:
+                if tag == URI_TAG:
+                    uris.append(elem.text)
+                    continue
+                if tag == MODEL_TAG:
+                    if model_elem is None:
+                        model_elem = elem
+                    continue
+
+            if not header_done:
+                header_done = True
+                if not self._apply_header(model, uris, model_elem, check_required_models):
+                    return None
+
+            if node_class is None:
+                # Alias
+                model.add_alias(alias_name=elem.get("Alias"), nodeid_text=elem.text)
+            else:
+                model.add_node(self.parse_xml_node(elem, model, node_class=node_class))
+                counter += 1
+            # Free the element and everything parsed before it
+            elem.clear(keep_tail=True)
+            parent = elem.getparent()
+            if parent is not None:
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+        if not header_done and not self._apply_header(model, uris, model_elem, check_required_models):
+            return None
+        print(f"Finished processing {counter} nodes")
+
+        return model
+
+    @staticmethod
+    def _apply_header(model:Namespace, uris:list[str], model_elem, check_required_models:bool) -> bool:
+        """Applies the NamespaceUris and Models header of a typelibrary file to the model being parsed
+
+        Returns:
+            bool: False if the load has to be deferred, as a RequiredModel is not loaded yet
+        """
+        model_uri = None
+        if model_elem is not None:
+            model_uri = model_elem.get("ModelUri")
+            model.ns_info.update(model_elem.attrib)
+            model.ns_info['required_models'] = []
+            for required_model in model_elem.iterchildren(REQUIRED_MODEL_TAG):
+                model.ns_info['required_models'].append(dict(required_model.attrib))
+                if check_required_models and \
+                        required_model.get("ModelUri") not in model.namespace_context.namespace_dict_uri:
+                    # Required model has not been loaded yet, defer to later time
+                    return False
+        if model_uri is None and uris:
+            # If model name is not properly defined, extract from first available uri
+            model_uri = uris[0]
+        if model_uri:
+            model.uri = model_uri
+        for uri in uris:
+            model.add_namespace(uri)
+        return True
+
+    def _register_cached_model(self, model:Namespace, xml_path:Path, verbose:bool=True) -> tuple[bool, dict|Path]:
+        # Unpickled models are attached to the default context
+        context = model.namespace_context = self.namespace_context
+        for required_model in model.ns_info.get("required_models", []):
+            if not required_model.get("ModelUri") in context.namespace_dict_uri:
+                # Required model has not been loaded yet, defer to later time
+                return False, xml_path
+        if model.uri:
+            context.register_model(model, init_namespace_array=False)
+        context.build_reference_type_table(model)
+        if verbose:
+            print(f"Loaded {model.name} from typelibrary cache")
+        return True, {model.name: model}
     
-    def _resolve_ua_basetype(self, node:Node) -> tuple[NodeId]:
+    @staticmethod
+    def _supertype(node:Node) -> Node|None:
+        """Returns the node of the supertype of a type, found through its inverse HasSubtype reference.
+        The supertype may be defined in another model, such as a UA type subtyped by a companion specification."""
         namespace = node.namespace
-        if node.base_type:
-            # Function has been recursively called, and the parent node has a base type
-            return node.base_type
-        
-        if node.node_id.to_string() in HIERARCHICAL_UA_REFS:
-            # Node is base hierarchical type
-            return node.node_id
-        
         for ref in node.references:
-            ref_type = namespace.resolve(ref.reference_type)
-            if ref_type.to_string() == HAS_SUBTYPE and not ref.is_forward:
-                if ref.target_nodeid.to_string() in HIERARCHICAL_UA_REFS:
-                    # Parent type is the base hierarchical type, return nodeid of current type as it's a 'hierarchical category'.
-                    return node.node_id
-                else:
-                    # No matches, search for base type of parent type node
-                    parent_node = namespace.find_by_nodeid(ref.target_nodeid)
-                    return self._resolve_ua_basetype(parent_node)
+            if not ref.is_forward and namespace.resolve(ref.reference_type).key == HAS_SUBTYPE_KEY:
+                return namespace.find_by_nodeid(ref.target_nodeid)
+        return None
 
     def classify_references(self):
+        """Sets the base type of the reference types in refs_to_classify, then empties the list.
+
+        The base type is the subtype of HierarchicalReferences that a reference type descends from, i.e. its
+        'hierarchical category', or None for non-hierarchical reference types. Each HasSubtype chain is walked up to
+        the first type with a known base type and the result is stored for every type on the way, so every reference
+        type is visited once per loader no matter how many subtypes it has or how many models subtype it.
+        """
+        classified = self._classified
         for node in self.refs_to_classify:
-            base_type = self._resolve_ua_basetype(node)
-            
-            node.base_type = base_type
-            self.refs_to_classify.remove(node)
+            chain = []
+            on_chain = set()
+            base_type = None
+            while node is not None:
+                node_ref = id(node)
+                entry = classified.get(node_ref)
+                if entry is not None and entry[0] is node:
+                    # Also ends chains through non-hierarchical types of models loaded earlier
+                    base_type = entry[1]
+                    break
+                if node.base_type is not None:
+                    # Classified with a required model
+                    base_type = node.base_type
+                    break
+                if node_ref in on_chain:
+                    print(f"Circular HasSubtype chain at reference type {node.browse_name}")
+                    break
+                chain.append(node)
+                on_chain.add(node_ref)
+                if node.node_id.key in HIERARCHICAL_UA_KEYS:
+                    # Node is the base hierarchical type
+                    base_type = node.node_id
+                    break
+                parent = self._supertype(node)
+                if parent is not None and parent.node_id.key in HIERARCHICAL_UA_KEYS:
+                    # Parent type is the base hierarchical type, the node is a 'hierarchical category'
+                    base_type = node.node_id
+                    break
+                node = parent
 
-    def load_from_path(self, typelib_path: Path) -> dict[str, Namespace]:
+            for chain_node in chain:
+                classified[id(chain_node)] = (chain_node, base_type)
+                chain_node.base_type = base_type
+        self.refs_to_classify = []
+
+    def load_from_path(self, typelib_path: Path, max_workers:int = None) -> dict[str, Namespace]:
         """Loads typelibraries from a directory path
 
         Args:
             typelib_path (Path): Path to directory containing typelibrary files
+            max_workers (int, optional): Maximum number of parsing processes. Defaults to the number of CPUs.
 
         Returns:
             dict: Mapping of model_name:model
         """
         xml_files = list(typelib_path.glob("*.xml"))
-        return self.load_from_file_list(xml_files)
+        return self.load_from_file_list(xml_files, max_workers=max_workers)
         
-    def load_from_file_list(self, file_list:list[str|Path], deferred=0) -> dict[str, Namespace]:
-        """Legacy support
+    def load_from_file_list(self, file_list:list[str|Path], max_workers:int = None) -> dict[str, Namespace]:
+        """Loads a list of typelibrary files. The standard opcua nodeset is always loaded, even if it is not in the list.
+
+        The <Models> header of every file is read first to build the RequiredModel dependency graph. Files that
+        are not in the cache are parsed in parallel, the first one in this process and the others in a process pool,
+        and the parsed models are then registered and classified in dependency order.
+
+        Models parsed in the pool are pickled back to this process, which takes almost as long as parsing them (about
+        0.4 s against 0.45 s for the UA nodeset). The pool therefore only pays off for several large files, with a
+        single file to parse or a single CPU everything is parsed in this process.
 
         Args:
             file_list (list[str | Path]): List of files
+            max_workers (int, optional): Maximum number of parsing processes, including this one. Defaults to the
+                number of CPUs.
 
         Returns:
             dict: Mapping of model_name:model
         """
-        # Max attempts to load typelibraries if required models are missing
-        max_attempts = 3
-
         file_list = [Path(f) for f in file_list]
         
         load_order:list[Path] = []
         
-        if deferred == 0:
-            if not any("Opc.Ua.NodeSet2" in file.name for file in file_list):
-                load_order.append(Path(UA_NODESET / "Opc.Ua.NodeSet2.xml"))
-            else:
-                for file in file_list:
-                    if "Opc.Ua.NodeSet2" in file.name:
-                        load_order.append(file)
-                        break
+        if not any("Opc.Ua.NodeSet2" in file.name for file in file_list):
+            load_order.append(Path(UA_NODESET / "Opc.Ua.NodeSet2.xml"))
+        else:
+            for file in file_list:
+                if "Opc.Ua.NodeSet2" in file.name:
+                    load_order.append(file)
+                    break
         
         load_order += sorted(file_list, key=lambda p: p.name)
 
-        typelibraries = {}
-        
-        deferred_load = []
-
-        
+        # Drop duplicates and missing files, keeping the first occurence
+        unique_files = {}
         for file in load_order:
             if file.is_file():
-                load_status, result = self.load(file)
-                if load_status:
-                    typelibraries.update(result)
+                unique_files.setdefault(file.resolve(), file)
+        headers = {file: read_model_header(file) for file in unique_files.values()}
+        load_order = self._sort_by_required_models(headers, self.namespace_context.namespace_dict_uri)
+
+        if self.lazy:
+            typelibraries = {}
+            for file in load_order:
+                load_status, result = self._load_lazy(file)
+                if not load_status:
+                    raise Exception(f"Failed to load all typelibraries. Missing requirements for file:\n{result}")
+                typelibraries.update(result)
+            return typelibraries
+
+        cached_models = {}
+        if self.cache is not None:
+            for file in load_order:
+                cached_model = self.cache.load(file)
+                if cached_model is not None:
+                    cached_models[file] = cached_model
+        to_parse = [file for file in load_order if file not in cached_models]
+
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        # The first file, usually the UA nodeset all others require, is parsed here while the pool parses the rest
+        pooled = to_parse[1:]
+        pool_size = min(max_workers - 1, len(pooled))
+
+        typelibraries = {}
+        if pool_size < 1:
+            for file in load_order:
+                if file in cached_models:
+                    load_status, result = self._register_cached_model(cached_models[file], file)
                 else:
-                    print(f"Performing deferred load of {result} later..")
-                    deferred_load.append(result)
-        
-        if len(deferred_load) > 0:
-            if deferred >= max_attempts:
-                raise Exception(f"Failed to load all typelibraries. Missing requirements for files:\n{deferred_load}")
-            typelibraries.update(self.load_from_file_list(deferred_load, deferred+1))
-        
+                    load_status, result = self._load_uncached(file)
+                if not load_status:
+                    raise Exception(f"Failed to load all typelibraries. Missing requirements for file:\n{result}")
+                typelibraries.update(result)
+            return typelibraries
+
+        with ProcessPoolExecutor(max_workers=pool_size) as executor:
+            futures = {file: executor.submit(_parse_typelibrary, file, [UA_URI]) for file in pooled}
+            # Register in dependency order, so reference types of required models are available for classification
+            for file in load_order:
+                if file in cached_models:
+                    load_status, result = self._register_cached_model(cached_models[file], file)
+                elif file not in futures:
+                    load_status, result = self._load_uncached(file)
+                else:
+                    load_status, result = self._register_parsed_model(futures[file].result(), file)
+                if not load_status:
+                    raise Exception(f"Failed to load all typelibraries. Missing requirements for file:\n{result}")
+                typelibraries.update(result)
+
         return typelibraries
+
+    def _register_parsed_model(self, model:Namespace, xml_path:Path) -> tuple[bool, dict|Path]:
+        """Registers and classifies a model that was parsed in a worker process"""
+        load_status, result = self._register_cached_model(model, xml_path, verbose=False)
+        if not load_status:
+            return load_status, result
+        self.refs_to_classify = [
+            node for node in model.nodes_by_id.values() if node.node_class == NodeClass.ReferenceType]
+        self.classify_references()
+        if self.cache is not None:
+            self.cache.store(xml_path, model)
+        return load_status, result
+
+    @staticmethod
+    def _sort_by_required_models(headers:dict[Path, dict], loaded_uris:dict[str, Namespace] = None) -> list[Path]:
+        """Sorts files topologically on their RequiredModel entries, keeping the original order where possible
+
+        Args:
+            headers (dict[Path, dict]): Mapping of file:model header, as returned by read_model_header
+            loaded_uris (dict[str, Namespace], optional): Models that are already loaded, by uri.
+                Defaults to the models of the default namespace context.
+
+        Returns:
+            list[Path]: Files in an order where every file comes after the files of its required models
+        """
+        file_by_uri = {header["model_uri"]: file for file, header in headers.items() if header["model_uri"]}
+        if loaded_uris is None:
+            loaded_uris = Namespace.get_default_namespace_context().namespace_dict_uri
+
+        dependencies = {}
+        missing = []
+        for file, header in headers.items():
+            dependencies[file] = set()
+            for uri in header["required_models"]:
+                if uri in file_by_uri and file_by_uri[uri] != file:
+                    dependencies[file].add(file_by_uri[uri])
+                elif uri not in loaded_uris:
+                    missing.append(file)
+        if missing:
+            raise Exception(f"Failed to load all typelibraries. Missing requirements for files:\n{missing}")
+
+        sorted_files = []
+        remaining = list(headers)
+        while remaining:
+            ready = [file for file in remaining if dependencies[file].issubset(sorted_files)]
+            if not ready:
+                raise Exception(f"Failed to load all typelibraries. Circular requirements between files:\n{remaining}")
+            sorted_files += ready
+            remaining = [file for file in remaining if file not in ready]
+        return sorted_files
     
     @staticmethod
     def get_clean_tag(tag:str)->str:
@@ -185,41 +504,48 @@ class TypeLibraryXMLLoader:
         is_forward = ref_elem.attrib.get("IsForward", "true").lower() != "false" # Convert to bool
         target_id = ref_elem.text
 
-    def parse_xml_node(self, elem, model:Namespace, ns):
-        tag = self.get_clean_tag(elem.tag)
+    def parse_xml_node(self, elem, model:Namespace, ns=None, node_class:NodeClass=None) -> Node:
+        """Creates a node from its xml element
+
+        Args:
+            elem: UANode element (lxml)
+            model (Namespace): Namespace of the node
+            ns (optional): Unused, kept for backwards compatibility
+            node_class (NodeClass, optional): Node class, if the caller already resolved it from the tag
+
+        Returns:
+            Node: The node, with its references. ReferenceType nodes are queued in refs_to_classify.
+        """
+        if node_class is None:
+            node_class = NODE_TAG_CLASSES[elem.tag]
 
-        node_id = elem.attrib.pop("NodeId")
-        browse_name = elem.attrib.pop("BrowseName")
-        node_class = resolve_node_class(tag)
-        references = []
         raw = dict(elem.attrib)
+        node_id = raw.pop("NodeId")
+        browse_name = raw.pop("BrowseName")
 
+        reference_elems = ()
         for child in elem:
-            subtag = self.get_clean_tag(child.tag)
-            if subtag not in ("References",):
-                text = "".join(child.itertext()).strip()
-                raw[subtag] = text
+            tag = child.tag
+            if tag == REFERENCES_TAG:
+                reference_elems = child
+            elif isinstance(tag, str):
+                raw[tag[UA_TAG_PREFIX_LEN:] if tag.startswith(UA_TAG_PREFIX) else tag] = "".join(child.itertext()).strip()
 
         attributes, subnodes = split_node_fields(node_class, raw)
+        node = Node(node_id, browse_name, node_class, model, attributes, subnodes)
 
         # Extract references
-        for refs_elem in elem.findall("ua:References", ns):
-            for ref_elem in refs_elem.findall("ua:Reference", ns):
-                ref_type = ref_elem.attrib["ReferenceType"]
-                is_forward = ref_elem.attrib.get("IsForward", "true").lower() != "false"
-                target_id = model.resolve(ref_elem.text)
-                references.append(
-                    {
-                        "reference_type": ref_type,
-                        "target_nodeid": target_id,
-                        "is_forward": is_forward
-                     })
-
-        node = Node(node_id, browse_name, node_class, model, attributes, subnodes)
-        for ref in references:
-            node.add_reference(**ref)
+        resolve = model.resolve
+        add_reference = node.add_reference
+        for ref_elem in reference_elems:
+            if ref_elem.tag == REFERENCE_TAG:
+                is_forward = ref_elem.get("IsForward")
+                add_reference(
+                    ref_elem.get("ReferenceType"),
+                    resolve(ref_elem.text),
+                    is_forward is None or is_forward.lower() != "false")
 
-        if node.node_class == NodeClass.ReferenceType:
+        if node_class == NodeClass.ReferenceType:
             self.refs_to_classify.append(node)
 
         return node
@@ -0,0 +1,11 @@
+import pytest
+
+from ua_nemo.typelib_cache import CACHE_DIR_ENV
+
+
+@pytest.fixture(autouse=True)
+def typelib_cache_dir(tmp_path, monkeypatch):
+    """Keeps the typelibrary cache of every test in its own temporary directory"""
+    cache_dir = tmp_path / "typelib-cache"
+    monkeypatch.setenv(CACHE_DIR_ENV, str(cache_dir))
+    return cache_dir
@@ -39,3 +39,130 @@ def test_get_typelibrary_not_found():
     engine = ModelBuilderEngine()
     with pytest.raises(ValueError):
         engine.get_typelibrary('Missing')
+
+def test_instantiate_many():
+    from ua_nemo.node_model import Namespace
+    pd = pytest.importorskip("pandas")
+
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyEngineTest.com/Batch/"
+    engine.set_aliases(model)
+
+    rows = pd.DataFrame({
+        "nodeid": ["ns=1;s=Folder", "ns=1;s=VarA", "ns=1;s=VarB"],
+        "nodetype": ["FolderType", "TwoStateDiscreteType", "TwoStateDiscreteType"],
+        "browsename": ["Folder", "VarA", "VarB"],
+        "type_namespace": ["UA", "UA", "UA"],
+        "Description": ["A folder", None, None],
+    })
+    created = engine.instantiate_many(model, rows)
+
+    assert [node.browse_name for node in created] == ["Folder", "VarA", "VarB"]
+    assert created[1] is model.find_by_nodeid("ns=1;s=VarA")
+    assert created[0].description == "A folder"
+    assert "Description" not in created[1].subnodes
+    assert model.find_by_nodeid("ns=1;s=VarB.TrueState") is not None
+
+    more = engine.instantiate_many(model, [("UA", "FolderType", "ns=1;s=Other", "Other", {"Description": "Other"})])
+    assert more[0].description == "Other"
+
+def test_engines_own_their_context():
+    from ua_nemo.node_model import Namespace
+
+    first = ModelBuilderEngine()
+    second = ModelBuilderEngine()
+    assert first.namespace_context is not second.namespace_context
+    first.load_typelibraries()
+    second.load_typelibraries()
+    assert first.namespace_context.get_model(name="UA") is first.get_typelibrary("UA")
+    assert second.namespace_context.get_model(name="UA") is second.get_typelibrary("UA")
+    assert first.get_typelibrary("UA") is not second.get_typelibrary("UA")
+
+    # Sharing the default context is opt-in
+    shared = ModelBuilderEngine(Namespace.get_default_namespace_context())
+    assert shared.namespace_context is Namespace.get_default_namespace_context()
+
+def test_models_outside_the_engine_context_are_rejected():
+    from ua_nemo.node_model import Namespace
+
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace()
+    model.uri = "http://www.MyEngineTest.com/Plain/"
+
+    # Typelibrary NodeIds could not be remapped into the namespace array of the model
+    with pytest.raises(ValueError, match="create_model"):
+        engine.instantiate_node("UA", model, "BaseObjectType", "ns=1;s=Object", "Object")
+    with pytest.raises(ValueError, match="create_model"):
+        engine.set_aliases(model)
+    assert model.find_by_nodeid("ns=1;s=Object") is None
+
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyEngineTest.com/Plain/"
+    node = engine.instantiate_node("UA", model, "BaseObjectType", "ns=1;s=Object", "Object")
+    type_definition = next(ref for ref in node.references if ref.reference_type == "HasTypeDefinition")
+    assert type_definition.target_nodeid.to_string() == "i=58"
+    assert type_definition.target is engine.get_typelibrary("UA").find_by_nodeid("i=58")
+
+def test_forked_builds_are_isolated():
+    from concurrent.futures import ThreadPoolExecutor
+    from ua_nemo.node_model import Namespace, NamespaceContext
+
+    engine = ModelBuilderEngine(NamespaceContext())
+    engine.load_typelibraries()
+    ua_model = engine.get_typelibrary("UA")
+    assert ua_model.namespace_context is engine.namespace_context
+
+    def build(idx):
+        fork = engine.fork()
+        model = fork.create_model("http://www.MyEngineTest.com/Fork/")
+        fork.instantiate_many(model, [("UA", "BaseObjectType", f"ns=1;s=Object{idx}", f"Object{idx}")])
+        model.find_by_nodeid(f"ns=1;s=Object{idx}").add_reference("Organizes", "i=85", is_forward=False)
+        return fork, model
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        builds = list(executor.map(build, range(4)))
+
+    for idx, (fork, model) in enumerate(builds):
+        assert fork.get_typelibrary("UA") is ua_model
+        assert fork.namespace_context.get_model(uri=model.uri) is model
+        assert [node.browse_name for node in model.iter_nodes()] == [f"Object{idx}"]
+        assert model.resolve_browse_path(f"Objects/Object{idx}") is model.find_by_nodeid(f"ns=1;s=Object{idx}")
+    # Models of the forks are not registered in the context of the engine or the default context
+    assert engine.namespace_context.get_model(uri="http://www.MyEngineTest.com/Fork/") is None
+    assert Namespace.get_default_namespace_context().get_model(uri="http://www.MyEngineTest.com/Fork/") is None
+
+def test_type_instantiators_per_target_model():
+    import gc
+    import weakref
+    from ua_nemo import engine as engine_module
+    from ua_nemo.node_model import NamespaceContext
+
+    engine = ModelBuilderEngine(NamespaceContext())
+    engine.load_typelibraries()
+    first = engine.create_model("http://www.MyEngineTest.com/First/")
+    second = engine.create_model("http://www.MyEngineTest.com/Second/")
+
+    first_instantiator = engine.get_type_instantiator("UA", first)
+    second_instantiator = engine.get_type_instantiator("UA", second)
+    assert first_instantiator is not second_instantiator
+    assert engine.get_type_instantiator("UA", first) is first_instantiator
+    assert first_instantiator.templates is second_instantiator.templates
+
+    engine.instantiate_node("UA", first, "BaseObjectType", "ns=1;s=A", "A")
+    engine.instantiate_node("UA", second, "BaseObjectType", "ns=1;s=B", "B")
+    assert [node.browse_name for node in first.iter_nodes()] == ["A"]
+    assert [node.browse_name for node in second.iter_nodes()] == ["B"]
+
+    # Finished models are not kept alive by the engine
+    engine.release_model(first)
+    first_ref = weakref.ref(first)
+    del first, first_instantiator
+    gc.collect()
+    assert first_ref() is None
+
+    for idx in range(engine_module.INSTANTIATOR_CACHE_SIZE):
+        engine.get_type_instantiator("UA", engine.create_model(f"http://www.MyEngineTest.com/Many{idx}/"))
+    assert engine.get_type_instantiator("UA", second) is not second_instantiator
@@ -1,6 +1,7 @@
 from ua_nemo.node_definitions import NodeClass
 from ua_nemo.node_model import Namespace, Node
 from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.xml_loader import TypeLibraryXMLLoader
 from tests.test_minimal_example import TYPELIB_PATH
 
 def test_classify_hierarchical_references():
@@ -18,5 +19,154 @@ def test_classify_hierarchical_references():
     assert organizes_node.base_type == organizes_node.node_id
     assert modelling_rule_node.base_type is None
 
+def test_classify_companion_reference_subtypes():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    ua_model = engine.get_typelibrary("UA")
+    # HasComponent -> Aggregates -> HasChild -> HierarchicalReferences
+    has_child_node = ua_model.find_by_nodeid("i=34")
+    assert ua_model.find_by_nodeid("i=47").base_type == has_child_node.node_id
+
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyHierarchyTest.com/References/"
+    model.add_alias("HasSubtype", "i=45")
+    for name in ("HasPart", "HasSubPart", "HasPeer"):
+        model.add_node(Node(f"ns=1;s={name}", name, NodeClass.ReferenceType, model, {}, {}))
+    # Subtypes of HasComponent and of a local subtype of it, queued before their supertypes
+    model.find_by_nodeid("ns=1;s=HasSubPart").add_reference("HasSubtype", "ns=1;s=HasPart", is_forward=False)
+    model.find_by_nodeid("ns=1;s=HasPart").add_reference("HasSubtype", "i=47", is_forward=False)
+    model.find_by_nodeid("ns=1;s=HasPeer").add_reference("HasSubtype", "i=32", is_forward=False)
+
+    loader = TypeLibraryXMLLoader(use_cache=False)
+    loader.refs_to_classify = [model.find_by_nodeid(f"ns=1;s={name}") for name in ("HasSubPart", "HasPeer", "HasPart")]
+    loader.classify_references()
+
+    assert loader.refs_to_classify == []
+    assert model.find_by_nodeid("ns=1;s=HasSubPart").base_type == has_child_node.node_id
+    assert model.find_by_nodeid("ns=1;s=HasPart").base_type == has_child_node.node_id
+    assert model.find_by_nodeid("ns=1;s=HasPeer").base_type is None
+
+def test_classify_caches_non_hierarchical_supertypes():
+    from ua_nemo.node_model import NamespaceContext
+    from ua_nemo.xml_loader import UA_NODESET
+
+    loader = TypeLibraryXMLLoader(use_cache=False, namespace_context=NamespaceContext())
+    _, loaded = loader.load(UA_NODESET / "Opc.Ua.NodeSet2.xml")
+    ua_model = loaded["UA"]
+    assert ua_model.find_by_nodeid("i=41").base_type is None
+
+    model = Namespace(loader.namespace_context)
+    model.uri = "http://www.MyHierarchyTest.com/Events/"
+    model.add_alias("HasSubtype", "i=45")
+    for name in ("GeneratesAlarm", "GeneratesWarning"):
+        model.add_node(Node(f"ns=1;s={name}", name, NodeClass.ReferenceType, model, {}, {}))
+        # GeneratesEvent -> NonHierarchicalReferences
+        model.find_by_nodeid(f"ns=1;s={name}").add_reference("HasSubtype", "i=41", is_forward=False)
+
+    walked = []
+    supertype = loader._supertype
+    loader._supertype = lambda node: walked.append(node.browse_name) or supertype(node)
+    loader.refs_to_classify = [model.find_by_nodeid(f"ns=1;s={name}") for name in ("GeneratesAlarm", "GeneratesWarning")]
+    loader.classify_references()
+
+    # The UA types were classified when UA was loaded, chains stop at GeneratesEvent
+    assert walked == ["GeneratesAlarm", "GeneratesWarning"]
+    assert model.find_by_nodeid("ns=1;s=GeneratesAlarm").base_type is None
+
 def test_get_hierarchical_parent():
-    raise NotImplementedError()
\ No newline at end of file
+    raise NotImplementedError()
+
+
+def test_reference_type_table():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    ua_model = engine.get_typelibrary("UA")
+
+    organizes_node = ua_model.find_by_browse_name("Organizes")[0]
+    assert ua_model.reference_type_table["Organizes"] is organizes_node
+    assert ua_model.reference_type_table["i=35"] is organizes_node
+    assert ua_model.get_reference_type_node("ns=0;i=35") is organizes_node
+
+    objects_node = ua_model.find_by_nodeid("i=85")
+    assert [ref.target_nodeid.to_string() for ref in objects_node.hierarchical_parents] == ["i=84"]
+    assert all(ref.is_hierarchical for ref in objects_node.hierarchical_parents)
+    assert not any(ref.is_hierarchical for ref in objects_node.references if ref.reference_type == "HasTypeDefinition")
+
+
+def _build_plant_model(engine:ModelBuilderEngine) -> Namespace:
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyHierarchyTest.com/Plant/"
+    engine.set_aliases(model)
+    for name in ("Plant", "Line1", "Line2", "Temperature"):
+        model.add_node(Node(f"ns=1;s={name}", name, NodeClass.Object, model, {}, {}))
+    model.find_by_nodeid("ns=1;s=Plant").add_reference("Organizes", "i=85", is_forward=False)
+    model.find_by_nodeid("ns=1;s=Plant").add_reference("HasComponent", "ns=1;s=Line1")
+    # Declared on the child only
+    model.find_by_nodeid("ns=1;s=Line2").add_reference("HasComponent", "ns=1;s=Plant", is_forward=False)
+    model.find_by_nodeid("ns=1;s=Line1").add_reference("HasComponent", "ns=1;s=Temperature")
+    model.find_by_nodeid("ns=1;s=Line1").add_reference("HasTypeDefinition", "i=58")
+    return model
+
+
+def test_iter_subtree():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = _build_plant_model(engine)
+
+    bfs = [(depth, node.browse_name) for depth, node in model.iter_subtree("ns=1;s=Plant")]
+    assert bfs == [(0, "Plant"), (1, "Line1"), (1, "Line2"), (2, "Temperature")]
+
+    dfs = [node.browse_name for _, node in model.iter_subtree("ns=1;s=Plant", order="dfs")]
+    assert dfs == ["Plant", "Line1", "Temperature", "Line2"]
+
+    shallow = [node.browse_name for _, node in model.iter_subtree("ns=1;s=Plant", max_depth=1)]
+    assert shallow == ["Plant", "Line1", "Line2"]
+
+    # Children declared in this model are found below nodes of other models
+    from_objects = [node.browse_name for _, node in model.iter_subtree("i=85", max_depth=1)]
+    assert from_objects == ["Objects", "Plant"]
+
+    filtered = model.iter_subtree("i=85", ref_filter=lambda ref: ref.reference_type == "Organizes")
+    assert [node.browse_name for _, node in filtered] == ["Objects", "Plant"]
+
+
+def test_walk_is_updated_incrementally():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = _build_plant_model(engine)
+
+    assert [node.browse_name for _, node in model.walk()] == ["Plant", "Line1", "Line2", "Temperature"]
+
+    pressure = Node("ns=1;s=Pressure", "Pressure", NodeClass.Object, model, {}, {})
+    pressure.add_reference("HasComponent", "ns=1;s=Line2", is_forward=False)
+    model.add_node(pressure)
+    model.find_by_nodeid("ns=1;s=Line2").add_reference("HasComponent", "ns=1;s=Flow")
+    model.add_node(Node("ns=1;s=Flow", "Flow", NodeClass.Object, model, {}, {}))
+
+    walked = [(depth, node.browse_name) for depth, node in model.walk(order="dfs")]
+    assert walked == [(0, "Plant"), (1, "Line1"), (2, "Temperature"), (1, "Line2"), (2, "Pressure"), (2, "Flow")]
+
+
+def test_resolve_browse_path():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = _build_plant_model(engine)
+
+    temperature = model.find_by_nodeid("ns=1;s=Temperature")
+    assert model.resolve_browse_path("Objects/Plant/Line1/Temperature") is temperature
+    assert model.resolve_browse_path("/Objects/0:Plant/Line1/0:Temperature") is temperature
+    assert model.resolve_browse_path(["Line1", "Temperature"], start="ns=1;s=Plant") is temperature
+    assert model.resolve_browse_path("Objects/1:Plant") is None
+    assert model.resolve_browse_path("Objects/Plant/Line3") is None
+    assert model.find_by_qualified_name(0, "Plant") == [model.find_by_nodeid("ns=1;s=Plant")]
+    assert model.find_by_qualified_name(0, "Objects") == [engine.get_typelibrary("UA").find_by_nodeid("i=85")]
+
+    # Resolved parents pick up children added later, whichever end declares the reference
+    model.find_by_nodeid("ns=1;s=Line2").add_reference("HasComponent", "ns=1;s=Flow")
+    model.add_node(Node("ns=1;s=Flow", "Flow", NodeClass.Object, model, {}, {}))
+    line3 = Node("ns=1;s=Line3", "1:Line3", NodeClass.Object, model, {}, {})
+    line3.add_reference("HasComponent", "ns=1;s=Plant", is_forward=False)
+    model.add_node(line3)
+    assert model.resolve_browse_path("Objects/Plant/Line2/Flow") is model.find_by_nodeid("ns=1;s=Flow")
+    assert model.resolve_browse_path("Objects/Plant/1:Line3") is line3
+    assert model.find_by_qualified_name(1, "Line3") == [line3]
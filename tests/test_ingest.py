@@ -0,0 +1,126 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.ingest import create_nodes, load_objects, load_relations, stream_nodes
+from ua_nemo.node_model import Namespace, NodeId
+
+OBJECTS_CSV = """nodeid,nodetype,browsename,type_namespace,Description
+ns=1;s=Plant,FolderType,Plant,UA,The plant
+ns=1;s=Plant.Alarm,TwoStateDiscreteType,Alarm,UA,
+"""
+
+REFERENCES_CSV = """source_node,target_node,reference_type,type_namespace,IsForward
+ns=1;s=Plant,UA.Objects,Organizes,UA,False
+ns=1;s=Plant,ns=1;s=Plant.Alarm,HasComponent,UA,
+ns=1;s=Plant.Alarm,i=58,HasTypeDefinition,UA,True
+"""
+
+
+@pytest.fixture
+def csv_dirs(tmp_path):
+    (tmp_path / "objects").mkdir()
+    (tmp_path / "references").mkdir()
+    (tmp_path / "objects" / "objects.csv").write_text(OBJECTS_CSV)
+    (tmp_path / "references" / "references.csv").write_text(REFERENCES_CSV)
+    return tmp_path / "objects", tmp_path / "references"
+
+
+def test_create_nodes(csv_dirs):
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyIngestTest.com/Plant/"
+    engine.set_aliases(model)
+
+    objects_path, references_path = csv_dirs
+    created = create_nodes(engine, model, load_objects(objects_path), load_relations(references_path))
+
+    plant, alarm = created
+    assert plant.description == "The plant"
+    assert "Description" not in alarm.subnodes
+
+    refs = {(ref.reference_type, ref.target_nodeid.to_string(), ref.is_forward) for ref in plant.references}
+    assert ("i=35", "i=85", False) in refs
+    assert ("i=47", "ns=1;s=Plant.Alarm", True) in refs
+
+    alarm_refs = [(ref.reference_type, ref.target_nodeid) for ref in alarm.references]
+    assert ("i=40", NodeId.from_string("i=58")) in alarm_refs
+    assert [ref.source for ref in model.references_to(alarm)] == [plant]
+
+
+def test_unknown_source_node(csv_dirs):
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyIngestTest.com/Empty/"
+
+    _, references_path = csv_dirs
+    with pytest.raises(ValueError, match="ns=1;s=Plant"):
+        create_nodes(engine, model, load_objects(csv_dirs[0]).iloc[:0], load_relations(references_path))
+
+
+def test_stream_nodes_buffers_unknown_sources(tmp_path):
+    (tmp_path / "objects").mkdir()
+    (tmp_path / "references").mkdir()
+    (tmp_path / "objects" / "objects.csv").write_text(OBJECTS_CSV)
+    # The first reference chunk refers to the alarm, which is only created by the second object chunk
+    reference_lines = REFERENCES_CSV.splitlines()
+    (tmp_path / "references" / "references.csv").write_text(
+        "\n".join([reference_lines[0], reference_lines[3], reference_lines[1], reference_lines[2]]) + "\n")
+
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyIngestTest.com/Streamed/"
+    engine.set_aliases(model)
+
+    n_objects, n_relations = stream_nodes(engine, model, tmp_path / "objects", tmp_path / "references", chunksize=1)
+    assert (n_objects, n_relations) == (2, 3)
+
+    alarm = model.find_by_nodeid("ns=1;s=Plant.Alarm")
+    assert ("i=40", NodeId.from_string("i=58")) in [(ref.reference_type, ref.target_nodeid) for ref in alarm.references]
+
+    (tmp_path / "references" / "references.csv").write_text(
+        "source_node,target_node,reference_type,type_namespace,IsForward\nns=1;s=Missing,i=58,HasTypeDefinition,UA,\n")
+    with pytest.raises(ValueError, match="ns=1;s=Missing"):
+        stream_nodes(engine, Namespace(engine.namespace_context), tmp_path / "objects", tmp_path / "references", chunksize=1)
+
+
+def test_numeric_columns_keep_their_text(tmp_path):
+    from ua_nemo.xml_builder import dump_model_to_xml
+
+    (tmp_path / "objects").mkdir()
+    (tmp_path / "references").mkdir()
+    (tmp_path / "objects" / "objects.csv").write_text(
+        "nodeid,nodetype,browsename,type_namespace,AccessLevel\n"
+        "ns=1;s=VarA,TwoStateDiscreteType,VarA,UA,3\n"
+        "ns=1;s=VarB,TwoStateDiscreteType,VarB,UA,\n")
+    (tmp_path / "references" / "references.csv").write_text(REFERENCES_CSV.splitlines()[0] + "\n")
+
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    for build in ("create_nodes", "stream_nodes"):
+        model = Namespace(engine.namespace_context)
+        model.uri = f"http://www.MyIngestTest.com/{build}/"
+        engine.set_aliases(model)
+        if build == "create_nodes":
+            create_nodes(engine, model, load_objects(tmp_path / "objects"), load_relations(tmp_path / "references"))
+        else:
+            stream_nodes(engine, model, tmp_path / "objects", tmp_path / "references", chunksize=1)
+
+        assert model.find_by_nodeid("ns=1;s=VarA").attributes_view["AccessLevel"] == "3"
+        assert "AccessLevel" not in model.find_by_nodeid("ns=1;s=VarB").attributes_view
+        assert 'AccessLevel="3"' in dump_model_to_xml(model)
+
+
+def test_missing_object_column():
+    import pandas as pd
+
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = engine.create_model("http://www.MyIngestTest.com/Columns/")
+    objects = pd.DataFrame({"nodeid": ["ns=1;s=Plant"], "browsename": ["Plant"], "type_namespace": ["UA"]})
+    with pytest.raises(ValueError, match="missing the column\\(s\\) nodetype"):
+        engine.instantiate_many(model, objects)
@@ -0,0 +1,72 @@
+import gzip
+import io
+import socket
+import threading
+
+from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.node_dump import dump_model_to_jsonl, load_model_from_jsonl
+from ua_nemo.node_model import Namespace
+from ua_nemo.xml_builder import write_model_xml
+
+
+def _build_model() -> Namespace:
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyNodeDumpTest.com/"
+    engine.set_aliases(model)
+    engine.instantiate_many(model, [("UA", "TwoStateDiscreteType", "ns=1;s=Alarm", "Alarm", {"Description": "An alarm"})])
+    return model
+
+
+def _export(model:Namespace) -> bytes:
+    output = io.BytesIO()
+    write_model_xml(model, output)
+    return output.getvalue()
+
+
+def test_jsonl_roundtrip(tmp_path):
+    model = _build_model()
+
+    dump_model_to_jsonl(model, tmp_path / "model.jsonl.gz")
+    with gzip.open(tmp_path / "model.jsonl.gz") as f:
+        assert f.readline().startswith(b'{"format":"ua_nemo-jsonl"')
+
+    loaded = load_model_from_jsonl(tmp_path / "model.jsonl.gz", register=False)
+    assert loaded.uri == model.uri
+    assert loaded.namespace_array == model.namespace_array
+    assert _export(loaded) == _export(model)
+
+    alarm = loaded.find_by_nodeid("ns=1;s=Alarm")
+    assert [ref.source for ref in loaded.references_to("ns=1;s=Alarm.TrueState")] == [alarm]
+
+
+def test_jsonl_keeps_reference_type_classification():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    ua_model = engine.get_typelibrary("UA")
+    buffer = io.BytesIO()
+    dump_model_to_jsonl(ua_model, buffer)
+
+    buffer.seek(0)
+    loaded = load_model_from_jsonl(buffer, register=False)
+    has_component = loaded.find_by_nodeid("i=47")
+    assert has_component.base_type == ua_model.find_by_nodeid("i=47").base_type
+
+
+def test_compressed_and_socket_xml_outputs(tmp_path):
+    model = _build_model()
+    expected = _export(model)
+
+    write_model_xml(model, tmp_path / "model.xml.gz")
+    assert gzip.decompress((tmp_path / "model.xml.gz").read_bytes()) == expected
+
+    receiver, sender = socket.socketpair()
+    received = []
+    reader = threading.Thread(target=lambda: received.append(receiver.makefile("rb").read()))
+    reader.start()
+    write_model_xml(model, sender, compression="gzip")
+    sender.close()
+    reader.join()
+    receiver.close()
+    assert gzip.decompress(received[0]) == expected
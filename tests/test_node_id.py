@@ -168,3 +168,29 @@ def test_repr_contains_useful_info():
 def test_repr_exact_format():
     nid = NodeId.from_string("ns=2;i=1234")
     assert repr(nid) == "NodeId(ns=2, type=NUMERIC, identifier=1234)"
+
+
+# --- interning & immutability ----------------------------------------------
+
+
+def test_from_string_returns_shared_nodeid():
+    assert NodeId.from_string("ns=2;i=1234") is NodeId.from_string("ns=2;i=1234")
+    assert NodeId.from_string("i=40") is not NodeId.from_string("ns=0;i=40")
+    assert NodeId.from_string("i=40") == NodeId.from_string("ns=0;i=40")
+
+
+def test_nodeid_is_immutable():
+    nid = NodeId.from_string("ns=2;i=1234")
+    with pytest.raises(AttributeError):
+        nid.id = 1235
+    assert nid.to_string() == "ns=2;i=1234"
+
+
+def test_pickle_roundtrip():
+    import pickle
+
+    nid = NodeId.from_string("ns=3;s=MyVar")
+    restored = pickle.loads(pickle.dumps(nid))
+    assert restored == nid
+    assert restored.local_key == (1, "s", "MyVar")
+    assert hash(restored) == hash(nid)
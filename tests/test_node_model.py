@@ -1,5 +1,5 @@
 from pathlib import Path
-from ua_nemo.node_model import Node, Namespace, NodeClass
+from ua_nemo.node_model import Node, Namespace, NodeClass, NodeId
 from ua_nemo.xml_loader import TypeLibraryXMLLoader
 
 #TODO The namespace context is a class variable, needs to be reset between test runs. That is not being done currently.
@@ -29,3 +29,79 @@ def test_namespace_array():
     assert len(model_one.namespace_array) == 2
     assert model_one.namespace_array[0] == ua_model.uri
     assert model_one.namespace_array[1] == model_one.uri
+
+def test_add_reference_deduplicates():
+    model = Namespace()
+    model.uri = "http://model_references.org"
+    node = Node("ns=1;s=Source", "Source", NodeClass.Object, model, {}, {})
+    model.add_node(node)
+
+    node.add_reference("HasTypeDefinition", "i=58")
+    node.add_reference("HasTypeDefinition", "i=58")
+    node.add_reference("HasTypeDefinition", "i=58", is_forward=False)
+
+    assert len(node.references) == 2
+
+def test_references_to():
+    model = Namespace()
+    model.uri = "http://model_references_to.org"
+    source_one = Node("ns=1;s=One", "One", NodeClass.Object, model, {}, {})
+    source_two = Node("ns=1;s=Two", "Two", NodeClass.Object, model, {}, {})
+    model.add_node(source_one)
+    model.add_node(source_two)
+
+    source_one.add_reference("Organizes", "ns=1;s=Two")
+    source_two.add_reference("Organizes", "i=85", is_forward=False)
+    source_one.add_reference("Organizes", "i=85", is_forward=False)
+
+    assert [ref.source for ref in model.references_to("i=85")] == [source_two, source_one]
+    assert [ref.source for ref in model.references_to(source_two)] == [source_one]
+    assert model.references_to("ns=1;s=One") == []
+
+def test_compact_references():
+    model = Namespace(compact_references=True)
+    model.uri = "http://model_compact_references.org"
+    source_one = Node("ns=1;s=One", "One", NodeClass.Object, model, {}, {})
+    source_two = Node("ns=1;s=Two", "Two", NodeClass.Object, model, {}, {})
+    model.add_node(source_one)
+    model.add_node(source_two)
+
+    source_one.add_reference("Organizes", "ns=1;s=Two")
+    source_one.add_reference("Organizes", "ns=1;s=Two")
+    source_one.add_reference("HasTypeDefinition", "i=58")
+    source_two.add_reference("Organizes", "i=85", is_forward=False)
+    source_one.add_reference("Organizes", "i=85", is_forward=False)
+
+    assert len(model.reference_store) == 4
+    assert len(source_one.references) == 3
+    assert [(ref.reference_type, ref.target_nodeid.to_string(), ref.is_forward) for ref in source_one.references] == [
+        ("Organizes", "ns=1;s=Two", True), ("HasTypeDefinition", "i=58", True), ("Organizes", "i=85", False)]
+    assert source_one.references[1].source is source_one
+    assert [ref.source for ref in model.references_to("i=85")] == [source_two, source_one]
+    assert [ref.source for ref in model.references_to(source_two)] == [source_one]
+    assert model.references_to("ns=1;s=One") == []
+
+def test_remap_nodeid():
+    source = Namespace()
+    source.uri = "http://model_remap_source.org"
+    source.add_namespace("http://model_remap_shared.org")
+    target = Namespace()
+    target.uri = "http://model_remap_target.org"
+    context = target.namespace_context
+
+    shared_nid = NodeId.from_string("ns=2;s=Shared")
+    remapped = context.remap_nodeid(shared_nid, source, target)
+    assert remapped == NodeId.from_string("ns=2;s=Shared")
+    assert target.namespace_array[2] == "http://model_remap_shared.org"
+    assert context.remap_nodeid(shared_nid, source, target) is remapped
+
+    local_nid = NodeId.from_string("ns=1;s=Local")
+    ua_nid = NodeId.from_string("i=58")
+    assert context.remap_nodeids([local_nid, ua_nid], source, target) == [NodeId.from_string("ns=3;s=Local"), ua_nid]
+    assert context.remap_nodeids([ua_nid], source, target)[0] is ua_nid
+    assert target.get_namespace_index("http://model_remap_source.org") == 3
+    assert target.get_namespace_index("http://model_remap_unknown.org") is None
+
+    # Appending directly to the namespace array is picked up
+    target.namespace_array.append("http://model_remap_appended.org")
+    assert target.get_namespace_index("http://model_remap_appended.org") == 4
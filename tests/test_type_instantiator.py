@@ -1,5 +1,64 @@
-from ua_nemo.node_model import Namespace, Node, NodeId
+import pytest
+
+from ua_nemo.node_model import Namespace, Node, NodeId, NodeClass
+from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.type_instantiator import TypeInstantiator
 
 def test_type_instantiator():
     
-    pass
\ No newline at end of file
+    pass
+
+def test_instance_template_is_reused():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyInstantiatorTest.com/Templates/"
+    engine.set_aliases(model)
+    instantiator = TypeInstantiator(engine.get_typelibrary("UA"), model)
+
+    instantiator.instantiate("TwoStateDiscreteType", "ns=1;s=VarA", "VarA")
+    template = instantiator.get_template("TwoStateDiscreteType")
+    instantiator.instantiate("TwoStateDiscreteType", "ns=1;s=VarB", "VarB")
+    assert instantiator.get_template("TwoStateDiscreteType") is template
+
+    var_b = model.find_by_nodeid("ns=1;s=VarB")
+    assert var_b.node_class == NodeClass.Variable
+    assert var_b.display_name == "VarB"
+    type_definitions = [ref.target_nodeid for ref in var_b.references if ref.reference_type == "HasTypeDefinition"]
+    assert type_definitions == [NodeId.from_string("i=2373")]
+
+    children = [ref.target for ref in var_b.references if ref.reference_type == "HasProperty"]
+    assert [child.browse_name for child in children] == ["FalseState", "TrueState"]
+    assert children[0].node_id == NodeId.from_string("ns=1;s=VarB.FalseState")
+    # Edits of one instance do not change the other instances or the template
+    children[0].edit_subnodes()["Description"] = "Changed"
+    assert model.find_by_nodeid("ns=1;s=VarA.FalseState").description != "Changed"
+    assert instantiator.get_template("TwoStateDiscreteType").type_node.description != "Changed"
+
+def test_instances_share_template_fields_until_changed():
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyInstantiatorTest.com/SharedFields/"
+    engine.set_aliases(model)
+    instantiator = TypeInstantiator(engine.get_typelibrary("UA"), model)
+
+    instantiator.instantiate("TwoStateDiscreteType", "ns=1;s=VarA", "VarA")
+    instantiator.instantiate("TwoStateDiscreteType", "ns=1;s=VarB", "VarB")
+    state_a = model.find_by_nodeid("ns=1;s=VarA.TrueState")
+    state_b = model.find_by_nodeid("ns=1;s=VarB.TrueState")
+    assert state_a.attributes_view is state_b.attributes_view
+    assert "DisplayName" not in state_a.subnodes_view
+    assert state_a.display_name == "TrueState"
+
+    # Reads do not copy the shared dicts, neither do failed writes
+    assert state_a.attributes.get("AccessLevel") is None
+    with pytest.raises(TypeError):
+        state_a.attributes["AccessLevel"] = "3"
+    assert state_a.attributes_view is state_b.attributes_view
+
+    state_a.edit_attributes()["AccessLevel"] = "3"
+    assert state_a.attributes_view is not state_b.attributes_view
+    assert "AccessLevel" not in state_b.attributes_view
+    template = instantiator.get_template("TwoStateDiscreteType")
+    assert any(entry.attributes is state_b.attributes_view for entry in template.entries)
@@ -0,0 +1,55 @@
+import shutil
+
+from ua_nemo.typelib_cache import TypeLibraryCache
+from ua_nemo.xml_loader import TypeLibraryXMLLoader, UA_NODESET
+from tests.test_minimal_example import TYPELIB_PATH
+
+
+def test_warm_load_skips_parsing(tmp_path, monkeypatch):
+    loader = TypeLibraryXMLLoader(cache_dir=tmp_path)
+    ua_path = UA_NODESET / "Opc.Ua.NodeSet2.xml"
+
+    _, cold = loader.load(ua_path)
+    assert loader.cache.entry_path(ua_path).is_file()
+
+    def fail_parse(*args, **kwargs):
+        raise AssertionError("Warm load should not parse xml")
+    monkeypatch.setattr(loader, "parse_xml_node", fail_parse)
+
+    _, warm = loader.load(ua_path)
+    cold_model, warm_model = cold["UA"], warm["UA"]
+
+    assert warm_model.namespace_context is cold_model.namespace_context
+    assert len(warm_model.nodes_by_id) == len(cold_model.nodes_by_id)
+    assert warm_model.aliases == cold_model.aliases
+    assert warm_model.namespace_array == cold_model.namespace_array
+
+    organizes_node = warm_model.find_by_browse_name("Organizes")[0]
+    assert organizes_node.base_type == organizes_node.node_id
+    assert warm_model.find_by_browse_name("HasModellingRule")[0].base_type is None
+
+
+def test_stale_entry_is_rebuilt(tmp_path):
+    xml_path = tmp_path / "test-types.xml"
+    shutil.copy(TYPELIB_PATH / "test-types.xml", xml_path)
+    loader = TypeLibraryXMLLoader(cache_dir=tmp_path / "cache")
+
+    _, typelibs = loader.load(xml_path)
+    assert not next(iter(typelibs.values())).find_by_browse_name("AddedType")
+
+    xml_path.write_text(xml_path.read_text().replace("1:MyCustomVariableType", "1:AddedType"))
+    _, typelibs = loader.load(xml_path)
+    assert next(iter(typelibs.values())).find_by_browse_name("AddedType")
+
+    # The rebuilt entry is valid for the current file contents
+    assert TypeLibraryCache(tmp_path / "cache").load(xml_path) is not None
+
+
+def test_cache_is_opt_in(tmp_path, monkeypatch):
+    monkeypatch.delenv("UA_NEMO_CACHE_DIR")
+    assert TypeLibraryXMLLoader().cache is None
+    assert TypeLibraryXMLLoader(cache_dir=tmp_path).cache.cache_dir == tmp_path
+
+    monkeypatch.setenv("UA_NEMO_CACHE_DIR", str(tmp_path / "env"))
+    assert TypeLibraryXMLLoader().cache.cache_dir == tmp_path / "env"
+    assert TypeLibraryXMLLoader(use_cache=False).cache is None
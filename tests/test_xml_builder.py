@@ -0,0 +1,129 @@
+from lxml import etree
+
+from ua_nemo.engine import ModelBuilderEngine
+from ua_nemo.node_model import Namespace
+from ua_nemo.fragment_cache import NodeFragmentCache
+from ua_nemo.xml_builder import NS_UA, dump_model_to_xml, write_model_xml
+
+
+def _build_model() -> Namespace:
+    engine = ModelBuilderEngine()
+    engine.load_typelibraries()
+    model = Namespace(engine.namespace_context)
+    model.uri = "http://www.MyXmlBuilderTest.com/"
+    engine.set_aliases(model)
+    engine.instantiate_many(model, [("UA", "TwoStateDiscreteType", "ns=1;s=Alarm", "Alarm", {"Description": "An alarm"})])
+    return model
+
+
+def _node_summary(root) -> list:
+    return [
+        (elem.tag, elem.get("NodeId"), elem.findtext(f"{{{NS_UA}}}DisplayName"),
+         [(ref.get("ReferenceType"), ref.get("IsForward"), ref.text) for ref in elem.iter(f"{{{NS_UA}}}Reference")])
+        for elem in root if elem.get("NodeId")]
+
+
+def test_export_modes_are_equivalent(tmp_path):
+    model = _build_model()
+
+    write_model_xml(model, tmp_path / "default.xml")
+    write_model_xml(model, tmp_path / "indented.xml", indent="  ")
+    write_model_xml(model, tmp_path / "compact.xml", compact=True, buffered=False)
+
+    parser = etree.XMLParser(remove_blank_text=True)
+    summaries = [_node_summary(etree.parse(str(tmp_path / name), parser).getroot())
+                 for name in ("default.xml", "indented.xml", "compact.xml")]
+    assert summaries[0] == summaries[1] == summaries[2]
+    assert len(summaries[0]) == len(model.nodes_by_id)
+
+    compact = (tmp_path / "compact.xml").read_text(encoding="utf-8")
+    assert "\n " not in compact
+    alarm = next(node for node in summaries[0] if node[1] == "ns=1;s=Alarm")
+    assert alarm[0] == f"{{{NS_UA}}}UAVariable"
+    assert ("HasTypeDefinition", None, "i=2373") in alarm[3]
+
+
+def test_dump_model_to_xml_returns_document():
+    model = _build_model()
+
+    document = dump_model_to_xml(model)
+    root = etree.fromstring(document.encode("utf-8"))
+    assert root.tag == f"{{{NS_UA}}}UANodeSet"
+    assert [uri.text for uri in root.find(f"{{{NS_UA}}}NamespaceUris")] == [model.uri]
+    assert "\n    <DisplayName>" in document
+
+
+def test_sharded_export_matches_serial(tmp_path):
+    model = _build_model()
+
+    write_model_xml(model, tmp_path / "serial.xml", indent="  ")
+    write_model_xml(model, tmp_path / "sharded.xml", indent="  ", max_workers=2, shard_size=2)
+
+    assert (tmp_path / "serial.xml").read_bytes() == (tmp_path / "sharded.xml").read_bytes()
+
+
+def test_concurrent_sharded_exports(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    models = [_build_model() for _ in range(2)]
+    extra = models[1].find_by_nodeid("ns=1;s=Alarm")
+    extra.edit_subnodes()["Description"] = "Another alarm"
+    for idx, model in enumerate(models):
+        write_model_xml(model, tmp_path / f"serial{idx}.xml", indent="  ")
+
+    def export(idx):
+        write_model_xml(models[idx], tmp_path / f"sharded{idx}.xml", indent="  ", max_workers=2, shard_size=2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(export, range(2)))
+
+    for idx in range(2):
+        assert (tmp_path / f"serial{idx}.xml").read_bytes() == (tmp_path / f"sharded{idx}.xml").read_bytes()
+
+
+def test_fragment_cache_and_delta_export(tmp_path):
+    model = _build_model()
+    cache = NodeFragmentCache(tmp_path / "fragments.pickle")
+
+    write_model_xml(model, tmp_path / "first.xml", indent="  ", fragment_cache=cache, delta_output=tmp_path / "d1.xml")
+    assert (tmp_path / "first.xml").read_bytes() == (tmp_path / "d1.xml").read_bytes()
+    cache.save()
+
+    alarm = model.find_by_nodeid("ns=1;s=Alarm")
+    alarm.edit_subnodes()["Description"] = "A changed alarm"
+    alarm.add_reference("HasComponent", "ns=1;s=Alarm.TrueState")  # Already there, not a change
+
+    write_model_xml(model, tmp_path / "second.xml", indent="  ", fragment_cache=cache, delta_output=tmp_path / "d2.xml")
+    write_model_xml(model, tmp_path / "uncached.xml", indent="  ")
+    assert (tmp_path / "second.xml").read_bytes() == (tmp_path / "uncached.xml").read_bytes()
+
+    delta = _node_summary(etree.parse(str(tmp_path / "d2.xml")).getroot())
+    assert [node[1] for node in delta] == ["ns=1;s=Alarm"]
+
+    # A cache loaded from file compares fingerprints of all nodes, only the alarm changed since it was saved
+    reloaded = NodeFragmentCache(tmp_path / "fragments.pickle")
+    assert len(reloaded) == len(model.nodes_by_id)
+    write_model_xml(model, tmp_path / "third.xml", indent="  ", fragment_cache=reloaded, delta_output=tmp_path / "d3.xml")
+    assert (tmp_path / "third.xml").read_bytes() == (tmp_path / "uncached.xml").read_bytes()
+    assert (tmp_path / "d3.xml").read_bytes() == (tmp_path / "d2.xml").read_bytes()
+
+
+def test_delta_export_tracks_field_edits(tmp_path):
+    model = _build_model()
+    # Changes are only recorded once a fragment cache renders the model
+    assert model.pop_dirty_nodes() == set()
+    cache = NodeFragmentCache(tmp_path / "fragments.pickle")
+    write_model_xml(model, tmp_path / "first.xml", indent="  ", fragment_cache=cache)
+
+    # Reads do not mark nodes as changed
+    model.find_by_nodeid("ns=1;s=Alarm.FalseState").attributes.get("DataType")
+    model.find_by_nodeid("ns=1;s=Alarm.FalseState").subnodes.get("Description")
+    # Edits through the edit methods, without mark_dirty
+    model.find_by_nodeid("ns=1;s=Alarm").edit_subnodes()["Description"] = "A changed alarm"
+    model.find_by_nodeid("ns=1;s=Alarm.TrueState").edit_attributes()["AccessLevel"] = "3"
+
+    write_model_xml(model, tmp_path / "second.xml", indent="  ", fragment_cache=cache, delta_output=tmp_path / "d.xml")
+    write_model_xml(model, tmp_path / "uncached.xml", indent="  ")
+    assert (tmp_path / "second.xml").read_bytes() == (tmp_path / "uncached.xml").read_bytes()
+    delta = _node_summary(etree.parse(str(tmp_path / "d.xml")).getroot())
+    assert sorted(node[1] for node in delta) == ["ns=1;s=Alarm", "ns=1;s=Alarm.TrueState"]
@@ -0,0 +1,129 @@
+from pathlib import Path
+
+import pytest
+
+from ua_nemo.node_model import Namespace
+from ua_nemo.xml_loader import UA_URI, TypeLibraryXMLLoader, _parse_typelibrary, read_model_header
+from tests.test_minimal_example import TYPELIB_PATH
+
+ISA95_URI = "http://www.OPCFoundation.org/UA/2013/01/ISA95"
+
+
+def test_read_model_header():
+    header = read_model_header(TYPELIB_PATH / "Opc.ISA95.NodeSet2.xml")
+
+    assert header["model_uri"] == ISA95_URI
+    assert header["namespace_uris"] == [ISA95_URI]
+    assert header["required_models"] == ["http://opcfoundation.org/UA/"]
+
+
+def test_sort_by_required_models():
+    headers = {
+        Path("c.xml"): {"model_uri": "urn:c", "required_models": ["urn:b", "urn:a"]},
+        Path("b.xml"): {"model_uri": "urn:b", "required_models": ["urn:a"]},
+        Path("a.xml"): {"model_uri": "urn:a", "required_models": []},
+    }
+    assert TypeLibraryXMLLoader._sort_by_required_models(headers) == [Path("a.xml"), Path("b.xml"), Path("c.xml")]
+
+    headers[Path("a.xml")]["required_models"] = ["urn:c"]
+    with pytest.raises(Exception, match="Circular"):
+        TypeLibraryXMLLoader._sort_by_required_models(headers)
+
+    headers[Path("a.xml")]["required_models"] = ["urn:missing"]
+    with pytest.raises(Exception, match="Missing requirements"):
+        TypeLibraryXMLLoader._sort_by_required_models(headers)
+
+
+def test_parallel_load_matches_serial_load():
+    serial = TypeLibraryXMLLoader(use_cache=False).load_from_path(TYPELIB_PATH, max_workers=1)
+    parallel = TypeLibraryXMLLoader(use_cache=False).load_from_path(TYPELIB_PATH, max_workers=2)
+
+    assert serial.keys() == parallel.keys()
+    for name, serial_model in serial.items():
+        parallel_model = parallel[name]
+        assert parallel_model.namespace_array == serial_model.namespace_array
+        assert parallel_model.nodes_by_id.keys() == serial_model.nodes_by_id.keys()
+        assert [n.base_type for n in parallel_model.nodes_by_id.values()] == \
+            [n.base_type for n in serial_model.nodes_by_id.values()]
+
+
+def test_parse_typelibrary_uses_a_local_context():
+    default_context = Namespace.get_default_namespace_context()
+    registered = dict(default_context.namespace_dict_uri)
+
+    model = _parse_typelibrary(TYPELIB_PATH / "Opc.ISA95.NodeSet2.xml", [UA_URI])
+
+    assert model.namespace_array == [UA_URI, ISA95_URI]
+    assert model.namespace_context is not default_context
+    assert default_context.namespace_dict_uri == registered
+
+
+def test_lazy_load_matches_eager_load():
+    lazy = TypeLibraryXMLLoader(lazy=True).load_from_path(TYPELIB_PATH)
+    isa95 = lazy["UA_2013_01_ISA95"]
+    assert 0 < isa95.materialized_count < len(isa95.nodes_by_id)
+
+    equipment_type = isa95.find_by_browse_name("EquipmentType")[0]
+    assert equipment_type.node_class.name == "ObjectType"
+    materialized = isa95.materialized_count
+    assert isa95.find_by_nodeid(equipment_type.node_id) is equipment_type
+    assert isa95.materialized_count == materialized
+
+    # Registers the eager models again, the namespace context is shared with the other tests
+    eager = TypeLibraryXMLLoader(use_cache=False).load_from_path(TYPELIB_PATH, max_workers=1)
+    assert lazy.keys() == eager.keys()
+    for name, eager_model in eager.items():
+        lazy_model = lazy[name]
+        assert lazy_model.namespace_array == eager_model.namespace_array
+        assert lazy_model.aliases == eager_model.aliases
+        assert sorted(lazy_model.nodes_by_id) == sorted(eager_model.nodes_by_id)
+        for key, eager_node in eager_model.nodes_by_id.items():
+            lazy_node = lazy_model.nodes_by_id[key]
+            assert (lazy_node.attributes, lazy_node.subnodes, lazy_node.base_type) == \
+                (eager_node.attributes, eager_node.subnodes, eager_node.base_type)
+
+
+def test_lazy_index_handles_prefixes_and_single_quotes(tmp_path):
+    import re
+    from ua_nemo.node_model import NamespaceContext
+    from ua_nemo.xml_loader import UA_NODESET
+
+    # Same nodeset with prefixed elements and single quoted attributes
+    source = (TYPELIB_PATH / "test-types.xml").read_text(encoding="utf-8")
+    prefixed = re.sub(r"<(/?)(?=[A-Za-z])", r"<\1ua:", source).replace("xmlns=", "xmlns:ua=").replace('"', "'")
+    xml_path = tmp_path / "test-types.xml"
+    xml_path.write_text(prefixed, encoding="utf-8")
+
+    models = {}
+    for lazy in (True, False):
+        loader = TypeLibraryXMLLoader(use_cache=False, lazy=lazy, namespace_context=NamespaceContext())
+        loader.load(UA_NODESET / "Opc.Ua.NodeSet2.xml")
+        _, loaded = loader.load(xml_path)
+        models[lazy] = next(iter(loaded.values()))
+    lazy_model, eager_model = models[True], models[False]
+
+    assert len(eager_model.nodes_by_id) > 0
+    assert sorted(lazy_model.nodes_by_id) == sorted(eager_model.nodes_by_id)
+    assert lazy_model.aliases == eager_model.aliases
+    for key, eager_node in eager_model.nodes_by_id.items():
+        lazy_node = lazy_model.nodes_by_id[key]
+        assert (lazy_node.browse_name, lazy_node.attributes, lazy_node.subnodes) == \
+            (eager_node.browse_name, eager_node.attributes, eager_node.subnodes)
+
+
+def test_lazy_browse_path_parses_only_visited_nodes():
+    from ua_nemo.node_model import NamespaceContext
+    from ua_nemo.xml_loader import UA_NODESET
+
+    loader = TypeLibraryXMLLoader(use_cache=False, lazy=True, namespace_context=NamespaceContext())
+    _, loaded = loader.load(UA_NODESET / "Opc.Ua.NodeSet2.xml")
+    ua_model = loaded["UA"]
+    total = len(ua_model._index.spans)
+
+    state = ua_model.resolve_browse_path("Objects/Server/ServerStatus/State")
+    assert state.node_id.to_string() == "i=2259"
+    # Listing the children of a node parses the children, not the rest of the file
+    children = [node.browse_name for _, node in ua_model.iter_subtree("i=2256", max_depth=1)]
+    assert children == ["ServerStatus", "StartTime", "CurrentTime", "State", "BuildInfo", "SecondsTillShutdown",
+                        "ShutdownReason"]
+    assert ua_model.materialized_count < total // 10